@@ -12,9 +12,19 @@ from __future__ import division
 from __future__ import print_function
 
 import argparse
+import codecs
+from collections import OrderedDict
 from distutils.util import strtobool
+import itertools
+import logging
+import multiprocessing as mp
+import numpy as np
 import os
 import time
+import torch
+from torch.multiprocessing import Process
+from torch.multiprocessing import Queue
+import traceback
 
 from neural_sp.bin.asr.train_utils import load_config
 from neural_sp.bin.asr.train_utils import set_logger
@@ -23,9 +33,14 @@ from neural_sp.evaluators.character import eval_char
 from neural_sp.evaluators.phone import eval_phone
 from neural_sp.evaluators.word import eval_word
 from neural_sp.evaluators.wordpiece import eval_wordpiece
+from neural_sp.models.ngram.ngram import NgramLM
+from neural_sp.models.ngram.ngram import NgramScorer
 from neural_sp.models.rnnlm.rnnlm import RNNLM
 from neural_sp.models.rnnlm.rnnlm_seq import SeqRNNLM
+from neural_sp.models.seq2seq.encoder_cache import EncoderCache
 from neural_sp.models.seq2seq.seq2seq import Seq2seq
+from neural_sp.utils.parallel import make_parallel
+from neural_sp.utils.parallel import share_model
 
 parser = argparse.ArgumentParser()
 # general
@@ -43,6 +58,8 @@ parser.add_argument('--eval_sets', type=str, nargs='+',
 # decoding paramter
 parser.add_argument('--batch_size', type=int, default=1,
                     help='the size of mini-batch in evaluation')
+parser.add_argument('--max_nframes_batch', type=int, default=0,
+                    help='if > 0, decode utterances in the length order with mini-batches of this number of padded frames (batch_size is ignored)')
 parser.add_argument('--beam_width', type=int, default=1,
                     help='the size of beam')
 parser.add_argument('--max_len_ratio', type=float, default=1,
@@ -57,6 +74,30 @@ parser.add_argument('--coverage_threshold', type=float, default=0.0,
                     help='coverage threshold')
 parser.add_argument('--rnnlm_weight', type=float, default=0.0,
                     help='the weight of RNNLM score')
+parser.add_argument('--recog_ctc_weight', type=float, default=0.0,
+                    help='the weight of CTC prefix score in joint CTC/attention decoding')
+parser.add_argument('--ngram_weight', type=float, default=0.0,
+                    help='the weight of n-gram LM score')
+parser.add_argument('--rescore_bwd_weight', type=float, default=0.0,
+                    help='the weight of the backward decoder score in N-best rescoring')
+parser.add_argument('--rescore_rnnlm_weight', type=float, default=0.0,
+                    help='the weight of RNNLM score in N-best rescoring')
+parser.add_argument('--ngram', type=str, default=None, nargs='?',
+                    help='path to the n-gram LM (ARPA file or directory converted by convert_arpa.py)')
+parser.add_argument('--attn_window', type=int, default=0,
+                    help='restrict attention to this number of frames around the previous peak (0 means no restriction)')
+parser.add_argument('--blank_skip_threshold', type=float, default=0.0,
+                    help='remove frames whose CTC blank posterior is not less than this value before attention (0 means no skipping)')
+parser.add_argument('--blank_skip_min_frames', type=int, default=1,
+                    help='the minimum number of frames kept per utterance in blank skipping (at least 1)')
+parser.add_argument('--blank_skip_merge', type=strtobool, default=False,
+                    help='merge each run of blank frames into one frame instead of removing it')
+parser.add_argument('--shortlist_threshold', type=float, default=0.0,
+                    help='restrict the output layer in beam search to tokens whose CTC posterior exceeds this value (0 means the full vocabulary)')
+parser.add_argument('--shortlist_nfrequent', type=int, default=0,
+                    help='the number of the most frequent tokens always included in the shortlist')
+parser.add_argument('--shortlist_max_error', type=float, default=0.01,
+                    help='fall back to the full softmax when the error bound of log-probabilities exceeds this value')
 parser.add_argument('--rnnlm', type=str, default=None, nargs='?',
                     help='path to the RMMLM')
 parser.add_argument('--rnnlm_bwd', type=str, default=None, nargs='?',
@@ -65,12 +106,28 @@ parser.add_argument('--resolving_unk', type=strtobool, default=False,
                     help='Resolving UNK for the word-based model.')
 parser.add_argument('--fwd_bwd_attention', type=strtobool, default=False,
                     help='Forward-backward attention decoding.')
+# cache & sweep
+parser.add_argument('--enc_cache_dir', type=str, default=None, nargs='?',
+                    help='directory to cache encoder outputs and CTC log-posteriors')
+parser.add_argument('--sweep', type=str, default=None, nargs='?',
+                    help='path to a yaml file of lists of decoding parameters to sweep (requires --enc_cache_dir)')
+parser.add_argument('--sweep_nj', type=int, default=1,
+                    help='the number of worker processes for the sweep, which decode on CPUs sharing the model')
+# parallel decoding
+parser.add_argument('--nj', type=int, default=1,
+                    help='the number of worker processes, each of which decodes a length-balanced shard of the evaluation set')
+parser.add_argument('--use_gpu', type=strtobool, default=True,
+                    help='decode on the GPU (otherwise on CPUs). With --nj > 1, each worker creates its own CUDA context on the same GPU')
+parser.add_argument('--prefork', type=strtobool, default=False,
+                    help='load the model once and fork --nj workers sharing its parameters, which decode on CPUs')
 # MTL
 parser.add_argument('--recog_unit', type=str, default=False, nargs='?',
                     choices=['word', 'wp', 'char', 'phone', 'word_char'],
                     help='')
 args = parser.parse_args()
 
+logger = logging.getLogger('decoding')
+
 
 def main():
 
@@ -89,7 +146,11 @@ def main():
         os.remove(os.path.join(args.decode_dir, 'decode.log'))
     logger = set_logger(os.path.join(args.decode_dir, 'decode.log'), key='decoding')
 
+    if args.sweep is not None and args.enc_cache_dir is None:
+        raise ValueError('--enc_cache_dir must be set for --sweep.')
+
     wer_mean, cer_mean, per_mean = 0, 0, 0
+    sweep_results = []
     for i, set in enumerate(args.eval_sets):
         # Load dataset
         eval_set = Dataset(csv_path=set,
@@ -103,6 +164,8 @@ def main():
                            unit_sub1=args.unit_sub1,
                            unit_sub2=args.unit_sub2,
                            batch_size=args.batch_size,
+                           sort_by_input_length=args.max_nframes_batch > 0,
+                           max_nframes_batch=args.max_nframes_batch,
                            is_test=True)
 
         if i == 0:
@@ -125,100 +188,63 @@ def main():
             args.rnnlm_cold_fusion = None
             args.rnnlm_init = None
 
-            # Load the ASR model
-            model = Seq2seq(args)
-            epoch, _, _, _ = model.load_checkpoint(args.model, epoch=args.epoch)
-
-            model.save_path = args.model
-
-            # For shallow fusion
-            if (not args.rnnlm_cold_fusion) and args.rnnlm is not None and args.rnnlm_weight > 0:
-                # Load a RNNLM config file
-                config_rnnlm = load_config(os.path.join(args.rnnlm, 'config.yml'))
-
-                # Merge config with args
-                args_rnnlm = argparse.Namespace()
-                for k, v in config_rnnlm.items():
-                    setattr(args_rnnlm, k, v)
-
-                assert args.unit == args_rnnlm.unit
-                args_rnnlm.vocab = eval_set.vocab
-
-                # Load the pre-trianed RNNLM
-                seq_rnnlm = SeqRNNLM(args_rnnlm)
-                seq_rnnlm.load_checkpoint(args.rnnlm, epoch=-1)
-
-                # Copy parameters
-                rnnlm = RNNLM(args_rnnlm)
-                rnnlm.copy_from_seqrnnlm(seq_rnnlm)
-
-                if args_rnnlm.backward:
-                    model.rnnlm_bwd = rnnlm
-                else:
-                    model.rnnlm_fwd = rnnlm
-
-                logger.info('RNNLM path: %s' % args.rnnlm)
-                logger.info('RNNLM weight: %.3f' % args.rnnlm_weight)
-                logger.info('RNNLM backward: %s' % str(config_rnnlm['backward']))
-
-            # GPU setting
-            model.cuda()
+            if (args.nj > 1 and args.prefork and args.sweep is None) or (args.sweep is not None and args.sweep_nj > 1):
+                # NOTE: CUDA is not initialized in the parent, and forked workers decode on CPUs
+                model, epoch = load_model(eval_set, use_gpu=False)
+                logger.info('shared parameters: %.1f MB' % (share_model(model) / 1024 / 1024))
+            elif args.nj <= 1 or args.sweep is not None:
+                model, epoch = load_model(eval_set, use_gpu=args.use_gpu)
+            # NOTE: otherwise each worker of evaluate_parallel() loads the model
 
             logger.info('beam width: %d' % args.beam_width)
             logger.info('length penalty: %.3f' % args.length_penalty)
             logger.info('coverage penalty: %.3f' % args.coverage_penalty)
             logger.info('coverage threshold: %.3f' % args.coverage_threshold)
-            logger.info('epoch: %d' % (epoch - 1))
+            logger.info('attention window: %d' % args.attn_window)
+            logger.info('blank skipping threshold: %.3f' % args.blank_skip_threshold)
+            logger.info('shortlist threshold: %.3f' % args.shortlist_threshold)
+            logger.info('CTC weight: %.3f' % args.recog_ctc_weight)
+            logger.info('rescoring weight (bwd): %.3f' % args.rescore_bwd_weight)
+            logger.info('rescoring weight (RNNLM): %.3f' % args.rescore_rnnlm_weight)
 
         start_time = time.time()
 
-        if args.unit in ['word', 'word_char'] and not args.recog_unit:
-            wer, nsub, nins, ndel, noov_total = eval_word(
-                [model], eval_set, decode_params,
-                epoch=epoch - 1,
-                decode_dir=args.decode_dir,
-                progressbar=True)
-            wer_mean += wer
-            logger.info('WER (%s): %.3f %%' % (eval_set.set, wer))
-            logger.info('SUB: %.3f / INS: %.3f / DEL: %.3f' % (nsub, nins, ndel))
-            logger.info('OOV (total): %d' % (noov_total))
-
-        elif (args.unit == 'wp' and not args.recog_unit) or args.recog_unit == 'wp':
-            wer, nsub, nins, ndel = eval_wordpiece(
-                [model], eval_set, decode_params,
-                epoch=epoch - 1,
-                decode_dir=args.decode_dir,
-                progressbar=True)
-            wer_mean += wer
-            logger.info('WER (%s): %.3f %%' % (eval_set.set, wer))
-            logger.info('SUB: %.3f / INS: %.3f / DEL: %.3f' % (nsub, nins, ndel))
-
-        elif ('char' in args.unit and not args.recog_unit) or 'char' in args.recog_unit:
-            (wer, nsub, nins, ndel), (cer, _, _, _) = eval_char(
-                [model], eval_set, decode_params,
-                epoch=epoch - 1,
-                decode_dir=args.decode_dir,
-                progressbar=True,
-                task_id=1 if args.recog_unit and 'char' in args.recog_unit else 0)
-            wer_mean += wer
-            cer_mean += cer
-            logger.info('WER / CER (%s): %.3f / %.3f %%' % (eval_set.set, wer, cer))
-            logger.info('SUB: %.3f / INS: %.3f / DEL: %.3f' % (nsub, nins, ndel))
-
-        elif 'phone' in args.unit:
-            per, nsub, nins, ndel = eval_phone(
-                [model], eval_set, decode_params,
-                epoch=epoch - 1,
-                decode_dir=args.decode_dir,
-                progressbar=True)
-            per_mean += per
-            logger.info('PER (%s): %.3f %%' % (eval_set.set, per))
-            logger.info('SUB: %.3f / INS: %.3f / DEL: %.3f' % (nsub, nins, ndel))
-
+        if args.sweep is not None:
+            # Fill the cache so that workers only run decoders
+            fill_enc_cache(model, eval_set, args.batch_size)
+            sweep_results += sweep(model, eval_set, decode_params, load_config(args.sweep),
+                                   epoch - 1, args.decode_dir, args.sweep_nj)
+            logger.info('Elasped time: %.2f [sec]:' % (time.time() - start_time))
+            continue
+
+        if args.nj > 1 and args.prefork:
+            results = evaluate_parallel(eval_set, decode_params, args.decode_dir, args.nj, model, epoch)
+        elif args.nj > 1:
+            results = evaluate_parallel(eval_set, decode_params, args.decode_dir, args.nj)
         else:
-            raise ValueError(args.unit)
+            results = evaluate(model, eval_set, decode_params, epoch - 1, args.decode_dir, progressbar=True)
+        if 'per' in results:
+            per_mean += results['per']
+            logger.info('PER (%s): %.3f %%' % (eval_set.set, results['per']))
+        elif 'cer' in results:
+            wer_mean += results['wer']
+            cer_mean += results['cer']
+            logger.info('WER / CER (%s): %.3f / %.3f %%' % (eval_set.set, results['wer'], results['cer']))
+        else:
+            wer_mean += results['wer']
+            logger.info('WER (%s): %.3f %%' % (eval_set.set, results['wer']))
+        logger.info('SUB: %.3f / INS: %.3f / DEL: %.3f' % (results['nsub'], results['nins'], results['ndel']))
+        if 'noov' in results:
+            logger.info('OOV (total): %d' % (results['noov']))
 
         logger.info('Elasped time: %.2f [sec]:' % (time.time() - start_time))
+        # NOTE: assume the frame shift of 10ms
+        logger.info('RTF: %.3f' % ((time.time() - start_time) / (eval_set.df['x_len'].sum() * 0.01)))
+
+    if args.sweep is not None:
+        write_sweep_results(sweep_results, os.path.join(args.decode_dir, 'sweep.tsv'))
+        logger.info('Sweep results: %s' % os.path.join(args.decode_dir, 'sweep.tsv'))
+        return
 
     if args.unit == 'word':
         logger.info('WER (mean): %.3f %%\n' % (wer_mean / len(args.eval_sets)))
@@ -231,5 +257,350 @@ def main():
         logger.info('PER (mean): %.3f %%\n' % (per_mean / len(args.eval_sets)))
 
 
+def load_model(eval_set, use_gpu=True):
+    """Load the ASR model and language models for decoding.
+
+    Args:
+        eval_set (Dataset):
+        use_gpu (bool): move the model to the GPU
+    Returns:
+        model (Seq2seq):
+        epoch (int): the epoch of the restored checkpoint
+
+    """
+    args.rnnlm_cold_fusion = None
+    args.rnnlm_init = None
+
+    # Load the ASR model
+    model = Seq2seq(args)
+    epoch, _, _, _ = model.load_checkpoint(args.model, epoch=args.epoch)
+
+    model.save_path = args.model
+
+    # For shallow fusion
+    if (not args.rnnlm_cold_fusion) and args.rnnlm is not None and \
+            (args.rnnlm_weight > 0 or args.rescore_rnnlm_weight > 0):
+        # Load a RNNLM config file
+        config_rnnlm = load_config(os.path.join(args.rnnlm, 'config.yml'))
+
+        # Merge config with args
+        args_rnnlm = argparse.Namespace()
+        for k, v in config_rnnlm.items():
+            setattr(args_rnnlm, k, v)
+
+        assert args.unit == args_rnnlm.unit
+        args_rnnlm.vocab = eval_set.vocab
+
+        # Load the pre-trianed RNNLM
+        seq_rnnlm = SeqRNNLM(args_rnnlm)
+        seq_rnnlm.load_checkpoint(args.rnnlm, epoch=-1)
+
+        # Copy parameters
+        rnnlm = RNNLM(args_rnnlm)
+        rnnlm.copy_from_seqrnnlm(seq_rnnlm)
+
+        if args_rnnlm.backward:
+            model.rnnlm_bwd = rnnlm
+        else:
+            model.rnnlm_fwd = rnnlm
+        # For N-best rescoring (in either direction)
+        model.seq_rnnlm = seq_rnnlm
+
+        logger.info('RNNLM path: %s' % args.rnnlm)
+        logger.info('RNNLM weight: %.3f' % args.rnnlm_weight)
+        logger.info('RNNLM backward: %s' % str(config_rnnlm['backward']))
+
+    # For shallow fusion with the n-gram LM
+    if args.ngram is not None and args.ngram_weight > 0:
+        ngram_lm = NgramLM.load(args.ngram)
+        model.ngram_fwd = NgramScorer(ngram_lm, os.path.join(args.model, 'dict.txt'), args.unit)
+
+        logger.info('n-gram LM path: %s' % args.ngram)
+        logger.info('n-gram LM weight: %.3f' % args.ngram_weight)
+
+    # Cache of encoder outputs
+    if args.enc_cache_dir is not None:
+        model.enc_cache = EncoderCache(args.enc_cache_dir, args.model, epoch)
+        logger.info('encoder cache: %s' % model.enc_cache.cache_dir)
+
+    # GPU setting
+    if use_gpu:
+        model.cuda()
+
+    logger.info('epoch: %d' % (epoch - 1))
+
+    return model, epoch
+
+
+def evaluate(model, eval_set, decode_params, epoch, decode_dir, progressbar=False):
+    """Evaluate the model with the evaluator of the unit.
+
+    Args:
+        model (Seq2seq):
+        eval_set (Dataset):
+        decode_params (dict):
+        epoch (int):
+        decode_dir (str):
+        progressbar (bool):
+    Returns:
+        results (dict): wer or wer and cer or per, nsub, nins, ndel (and noov for word models)
+
+    """
+    if args.unit in ['word', 'word_char'] and not args.recog_unit:
+        wer, nsub, nins, ndel, noov_total = eval_word(
+            [model], eval_set, decode_params,
+            epoch=epoch,
+            decode_dir=decode_dir,
+            progressbar=progressbar)
+        return {'wer': wer, 'nsub': nsub, 'nins': nins, 'ndel': ndel, 'noov': noov_total}
+
+    elif (args.unit == 'wp' and not args.recog_unit) or args.recog_unit == 'wp':
+        wer, nsub, nins, ndel = eval_wordpiece(
+            [model], eval_set, decode_params,
+            epoch=epoch,
+            decode_dir=decode_dir,
+            progressbar=progressbar)
+        return {'wer': wer, 'nsub': nsub, 'nins': nins, 'ndel': ndel}
+
+    elif ('char' in args.unit and not args.recog_unit) or 'char' in args.recog_unit:
+        (wer, nsub, nins, ndel), (cer, _, _, _) = eval_char(
+            [model], eval_set, decode_params,
+            epoch=epoch,
+            decode_dir=decode_dir,
+            progressbar=progressbar,
+            task_id=1 if args.recog_unit and 'char' in args.recog_unit else 0)
+        return {'wer': wer, 'cer': cer, 'nsub': nsub, 'nins': nins, 'ndel': ndel}
+
+    elif 'phone' in args.unit:
+        per, nsub, nins, ndel = eval_phone(
+            [model], eval_set, decode_params,
+            epoch=epoch,
+            decode_dir=decode_dir,
+            progressbar=progressbar)
+        return {'per': per, 'nsub': nsub, 'nins': nins, 'ndel': ndel}
+
+    else:
+        raise ValueError(args.unit)
+
+
+def make_shards(eval_set, nj):
+    """Split utterances into shards with the balanced number of frames.
+
+        Utterances are assigned from the longest one to the shard with the fewest frames so far.
+
+    Args:
+        eval_set (Dataset):
+        nj (int): the number of shards
+    Returns:
+        shards (list): A list of length `[nj]`, which contains lists of indices of `eval_set.df`
+            in the order of `eval_set.df`
+
+    """
+    nframes = np.zeros((nj,), dtype=np.int64)
+    shard_ids = {}
+    for i, x_len in eval_set.df['x_len'].sort_values(ascending=False, kind='mergesort').items():
+        j = int(np.argmin(nframes))
+        shard_ids[i] = j
+        nframes[j] += x_len
+    shards = [[] for _ in range(nj)]
+    for i in eval_set.df.index:
+        shards[shard_ids[i]].append(i)
+    return shards
+
+
+def count_units(eval_set, indices):
+    """Count words and characters (not bytes) of references in the same way as evaluators.
+
+    Args:
+        eval_set (Dataset):
+        indices (list): indices of `eval_set.df`
+    Returns:
+        nword (int):
+        nchar (int):
+
+    """
+    refs = [eval_set.df['text'][i] for i in indices]
+    return sum([len(ref.split(' ')) for ref in refs]), sum([len(ref) for ref in refs])
+
+
+def _trn_id(utt_id):
+    utt_id = utt_id.replace('-', '_').split('_')
+    return '(' + '_'.join(utt_id[:-2]) + '-' + utt_id[-2] + '-' + utt_id[-1] + ')'
+
+
+def _evaluate_worker(k, eval_set, indices, decode_params, decode_dir, nthreads, queue, model=None, epoch=None):
+    try:
+        torch.set_num_threads(nthreads)
+        eval_set.df = eval_set.df.loc[indices]
+        eval_set.reset()
+        if model is None:
+            model, epoch = load_model(eval_set, use_gpu=args.use_gpu)
+        results = evaluate(model, eval_set, decode_params, epoch - 1, os.path.join(decode_dir, 'shard' + str(k)))
+        queue.put((k, results, None))
+    except Exception:
+        queue.put((k, None, traceback.format_exc()))
+
+
+def evaluate_parallel(eval_set, decode_params, decode_dir, nj, model=None, epoch=None):
+    """Evaluate the model with worker processes, each of which decodes a shard of the evaluation set.
+
+        Each worker loads the model once unless the model prepared by share_model() is given,
+        and uses `cpu_count // nj` intra-op threads. Workers loading the model decode on the GPU
+        when --use_gpu is set, where all of them share the same device.
+        ref.trn and hyp.trn of shards are merged in the original order, and error rates are
+        aggregated over all utterances as in the evaluator of the unit.
+
+    Args:
+        eval_set (Dataset):
+        decode_params (dict):
+        decode_dir (str):
+        nj (int): the number of worker processes
+        model (Seq2seq): the model shared by workers
+        epoch (int): the epoch of the restored checkpoint of the shared model
+    Returns:
+        results (dict): the same as evaluate()
+
+    """
+    shards = [indices for indices in make_shards(eval_set, nj) if len(indices) > 0]
+    nthreads = max(1, mp.cpu_count() // len(shards))
+    logger.info('%d shards of %s (%d threads per job)' % (len(shards), eval_set.set, nthreads))
+
+    queue = Queue()
+    workers = [Process(target=_evaluate_worker,
+                       args=(k, eval_set, indices, decode_params, decode_dir, nthreads, queue, model, epoch))
+               for k, indices in enumerate(shards)]
+    for w in workers:
+        w.start()
+    results = [None] * len(shards)
+    errors = []
+    for _ in range(len(shards)):
+        k, results_k, error = queue.get()
+        if error is not None:
+            errors.append('shard %d:\n%s' % (k, error))
+        results[k] = results_k
+    for w in workers:
+        w.join()
+    if len(errors) > 0:
+        raise RuntimeError('\n'.join(errors))
+
+    # Merge trn files in the original order (sorted by utt_id)
+    for fname in ['ref.trn', 'hyp.trn']:
+        lines = {}
+        for k in range(len(shards)):
+            with codecs.open(os.path.join(decode_dir, 'shard' + str(k), fname), 'r', 'utf-8') as f:
+                for line in f:
+                    lines.setdefault(line.rstrip('\n').split(' ')[-1], []).append(line)
+        with codecs.open(os.path.join(decode_dir, fname), 'w', 'utf-8') as f:
+            for utt_id in sorted(eval_set.df['utt_id']):
+                f.write(lines[_trn_id(utt_id)].pop(0))
+
+    # Error rates are normalized by the number of words (or characters or phones) in each shard
+    counts = [count_units(eval_set, indices) for indices in shards]
+    nword = sum([c[0] for c in counts])
+    nchar = sum([c[1] for c in counts])
+    merged = {}
+    for key in results[0].keys():
+        if key == 'noov':
+            merged[key] = sum([r[key] for r in results])
+        elif key == 'cer':
+            merged[key] = sum([r[key] * c[1] for r, c in zip(results, counts)]) / nchar
+        else:
+            merged[key] = sum([r[key] * c[0] for r, c in zip(results, counts)]) / nword
+    return merged
+
+
+def fill_enc_cache(model, eval_set, batch_size):
+    """Encode all utterances of the evaluation set into the encoder cache.
+
+    Args:
+        model (Seq2seq):
+        eval_set (Dataset):
+        batch_size (int):
+
+    """
+    task = 'ys_sub1' if args.recog_unit and 'char' in args.recog_unit else 'ys'
+    eval_set.reset()
+    model.eval()
+    with torch.no_grad():
+        while True:
+            batch, is_new_epoch = eval_set.next(batch_size)
+            model.encode_cached(batch['xs'], batch['utt_ids'], task)
+            if is_new_epoch:
+                break
+    eval_set.reset()
+
+
+# Shared with forked workers of sweep()
+_sweep_context = {}
+
+
+def _sweep_worker(decode_params):
+    torch.set_num_threads(1)
+    model = _sweep_context['model']
+    eval_set = _sweep_context['eval_set']
+    decode_dir = os.path.join(_sweep_context['decode_dir'], 'sweep', eval_set.set,
+                              '_'.join([k + str(decode_params[k]) for k in _sweep_context['keys']]))
+    if not os.path.isdir(decode_dir):
+        try:
+            os.makedirs(decode_dir)
+        except OSError:
+            # Created by another worker
+            pass
+    start_time = time.time()
+    results = evaluate(model, eval_set, decode_params, _sweep_context['epoch'], decode_dir)
+    results['elapsed'] = time.time() - start_time
+    return results
+
+
+def sweep(model, eval_set, decode_params, grid, epoch, decode_dir, nj=1):
+    """Evaluate all combinations of decoding parameters against the encoder cache.
+
+    Args:
+        model (Seq2seq):
+        eval_set (Dataset):
+        decode_params (dict): default decoding parameters
+        grid (dict): lists of values of decoding parameters to sweep
+        epoch (int):
+        decode_dir (str):
+        nj (int): the number of worker processes
+    Returns:
+        results (list): A list of dicts, which contain the set, decoding parameters and metrics
+
+    """
+    keys = sorted(grid.keys())
+    for k in keys:
+        if k not in decode_params:
+            raise ValueError('Unknown decoding parameter: %s' % k)
+    configs = [dict(decode_params, **dict(zip(keys, values)))
+               for values in itertools.product(*[grid[k] for k in keys])]
+    logger.info('sweep: %d configurations on %s' % (len(configs), eval_set.set))
+
+    _sweep_context.update({'model': model, 'eval_set': eval_set, 'keys': keys,
+                           'epoch': epoch, 'decode_dir': decode_dir})
+    if nj > 1:
+        results = make_parallel(_sweep_worker, configs, core=nj)
+    else:
+        results = [_sweep_worker(config) for config in configs]
+
+    rows = []
+    for config, metrics in zip(configs, results):
+        row = OrderedDict([('set', eval_set.set)] + [(k, config[k]) for k in keys])
+        row.update(metrics)
+        rows.append(row)
+        logger.info(' '.join(['%s: %s' % (k, str(v)) for k, v in row.items()]))
+    return rows
+
+
+def write_sweep_results(rows, save_path):
+    """Write results of sweep() as a tab-separated table."""
+    columns = []
+    for row in rows:
+        columns += [k for k in row.keys() if k not in columns]
+    with codecs.open(save_path, 'w', 'utf-8') as f:
+        f.write('\t'.join(columns) + '\n')
+        for row in rows:
+            f.write('\t'.join([str(row.get(k, '')) for k in columns]) + '\n')
+
+
 if __name__ == '__main__':
     main()
@@ -51,6 +51,28 @@ parser.add_argument('--coverage_threshold', type=float, default=0.0,
                     help='coverage threshold')
 parser.add_argument('--rnnlm_weight', type=float, default=0.0,
                     help='the weight of RNNLM score')
+parser.add_argument('--recog_ctc_weight', type=float, default=0.0,
+                    help='the weight of CTC prefix score in joint CTC/attention decoding')
+parser.add_argument('--ngram_weight', type=float, default=0.0,
+                    help='the weight of n-gram LM score')
+parser.add_argument('--rescore_bwd_weight', type=float, default=0.0,
+                    help='the weight of the backward decoder score in N-best rescoring')
+parser.add_argument('--rescore_rnnlm_weight', type=float, default=0.0,
+                    help='the weight of RNNLM score in N-best rescoring')
+parser.add_argument('--attn_window', type=int, default=0,
+                    help='restrict attention to this number of frames around the previous peak (0 means no restriction)')
+parser.add_argument('--blank_skip_threshold', type=float, default=0.0,
+                    help='remove frames whose CTC blank posterior is not less than this value before attention (0 means no skipping)')
+parser.add_argument('--blank_skip_min_frames', type=int, default=1,
+                    help='the minimum number of frames kept per utterance in blank skipping (at least 1)')
+parser.add_argument('--blank_skip_merge', type=strtobool, default=False,
+                    help='merge each run of blank frames into one frame instead of removing it')
+parser.add_argument('--shortlist_threshold', type=float, default=0.0,
+                    help='restrict the output layer in beam search to tokens whose CTC posterior exceeds this value (0 means the full vocabulary)')
+parser.add_argument('--shortlist_nfrequent', type=int, default=0,
+                    help='the number of the most frequent tokens always included in the shortlist')
+parser.add_argument('--shortlist_max_error', type=float, default=0.01,
+                    help='fall back to the full softmax when the error bound of log-probabilities exceeds this value')
 parser.add_argument('--rnnlm', type=str, default=None, nargs='?',
                     help='path to the RMMLM')
 parser.add_argument('--resolving_unk', type=strtobool, default=False,
@@ -52,6 +52,28 @@ parser.add_argument('--coverage_threshold', type=float, default=0.0,
                     help='coverage threshold')
 parser.add_argument('--rnnlm_weight', type=float, default=0.0,
                     help='the weight of RNNLM score')
+parser.add_argument('--recog_ctc_weight', type=float, default=0.0,
+                    help='the weight of CTC prefix score in joint CTC/attention decoding')
+parser.add_argument('--ngram_weight', type=float, default=0.0,
+                    help='the weight of n-gram LM score')
+parser.add_argument('--rescore_bwd_weight', type=float, default=0.0,
+                    help='the weight of the backward decoder score in N-best rescoring')
+parser.add_argument('--rescore_rnnlm_weight', type=float, default=0.0,
+                    help='the weight of RNNLM score in N-best rescoring')
+parser.add_argument('--attn_window', type=int, default=0,
+                    help='restrict attention to this number of frames around the previous peak (0 means no restriction)')
+parser.add_argument('--blank_skip_threshold', type=float, default=0.0,
+                    help='remove frames whose CTC blank posterior is not less than this value before attention (0 means no skipping)')
+parser.add_argument('--blank_skip_min_frames', type=int, default=1,
+                    help='the minimum number of frames kept per utterance in blank skipping (at least 1)')
+parser.add_argument('--blank_skip_merge', type=strtobool, default=False,
+                    help='merge each run of blank frames into one frame instead of removing it')
+parser.add_argument('--shortlist_threshold', type=float, default=0.0,
+                    help='restrict the output layer in beam search to tokens whose CTC posterior exceeds this value (0 means the full vocabulary)')
+parser.add_argument('--shortlist_nfrequent', type=int, default=0,
+                    help='the number of the most frequent tokens always included in the shortlist')
+parser.add_argument('--shortlist_max_error', type=float, default=0.01,
+                    help='fall back to the full softmax when the error bound of log-probabilities exceeds this value')
 parser.add_argument('--rnnlm', type=str, default=None, nargs='?',
                     help='path to the RMMLM')
 parser.add_argument('--resolving_unk', type=strtobool, default=False,
@@ -129,14 +151,17 @@ def main():
 
         while True:
             batch, is_new_epoch = dataset.next(decode_params['batch_size'])
-            best_hyps, aws, perm_idx = model.decode(batch['xs'], decode_params,
-                                                    exclude_eos=False)
-            ys = [batch['ys'][i] for i in perm_idx]
-
-            # Get CTC probs
-            ctc_probs, indices_topk, x_lens = model.get_ctc_posteriors(
-                batch['xs'], temperature=1, topk=min(100, model.vocab))
+            # Decode and get CTC probs with a single encoder pass
+            results, perm_idx = model.decode_multi(batch['xs'], decode_params,
+                                                   outputs=['ys', 'ys.ctc'],
+                                                   exclude_eos=False,
+                                                   temperature=1, topk=min(100, model.vocab))
+            best_hyps, aws = results['ys']
+            ctc_probs, indices_topk, x_lens = results['ys.ctc']
             # NOTE: ctc_probs: '[B, T, topk]'
+            ys = [batch['ys'][i] for i in perm_idx]
+            utt_ids = [batch['utt_ids'][i] for i in perm_idx]
+            xs = [batch['xs'][i] for i in perm_idx]
 
             for b in range(len(batch['xs'])):
                 if args.unit == 'word':
@@ -150,20 +175,20 @@ def main():
                 else:
                     raise NotImplementedError(args.unit)
                 token_list = [unicode(t, 'utf-8') for t in token_list]
-                speaker = '_'.join(batch['utt_ids'][b].replace('-', '_').split('_')[:-2])
+                speaker = '_'.join(utt_ids[b].replace('-', '_').split('_')[:-2])
 
                 plot_ctc_probs(
                     ctc_probs[b, :x_lens[b]],
                     indices_topk[b],
                     nframes=x_lens[b],
                     subsample_factor=subsample_factor,
-                    spectrogram=batch['xs'][b][:, :dataset.input_dim],
-                    save_path=mkdir_join(save_path, speaker, batch['utt_ids'][b] + '.png'),
+                    spectrogram=xs[b][:, :dataset.input_dim],
+                    save_path=mkdir_join(save_path, speaker, utt_ids[b] + '.png'),
                     figsize=(20, 8))
 
                 ref = ys[b]
                 hyp = ' '.join(token_list)
-                logger.info('utt-id: %s' % batch['utt_ids'][b])
+                logger.info('utt-id: %s' % utt_ids[b])
                 logger.info('Ref: %s' % ref.lower())
                 logger.info('Hyp: %s' % hyp)
                 logger.info('-' * 50)
@@ -0,0 +1,444 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+
+"""Serve the ASR model over a local HTTP API with micro-batching (python3 only).
+
+    POST /recognize: a wav file (Content-Type: audio/wav) or a .npy file of features `[T, input_dim]`
+        (any other Content-Type). Returns {"text", "token_ids", "latency_ms", "batch_size"} in JSON.
+    GET /metrics: histograms of per-request latency and batch size in JSON.
+    GET /health
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import copy
+from distutils.util import strtobool
+import io
+import json
+import kaldi_io
+import logging
+import numpy as np
+import os
+import queue
+from python_speech_features import logfbank
+from scipy.io import wavfile
+import time
+import torch
+
+from neural_sp.bin.asr.train_utils import load_config
+from neural_sp.bin.asr.train_utils import set_logger
+from neural_sp.datasets.token_converter.character import Id2char
+from neural_sp.datasets.token_converter.phone import Id2phone
+from neural_sp.datasets.token_converter.word import Id2word
+from neural_sp.datasets.token_converter.wordpiece import Id2wp
+from neural_sp.models.seq2seq.seq2seq import Seq2seq
+
+parser = argparse.ArgumentParser()
+# general
+parser.add_argument('--model', type=str,
+                    help='path to the model')
+parser.add_argument('--epoch', type=int, default=-1,
+                    help='the epoch to restore')
+parser.add_argument('--log', type=str, default=None, nargs='?',
+                    help='path to the log file')
+# server
+parser.add_argument('--host', type=str, default='127.0.0.1',
+                    help='host to listen on')
+parser.add_argument('--port', type=int, default=8000,
+                    help='port to listen on')
+parser.add_argument('--unix_socket', type=str, default=None, nargs='?',
+                    help='path to a unix socket to listen on instead of the TCP port')
+parser.add_argument('--max_batch_size', type=int, default=8,
+                    help='the maximum number of requests decoded as a mini-batch')
+parser.add_argument('--max_latency_ms', type=float, default=50,
+                    help='the maximum time [ms] to wait for the following requests to form a mini-batch')
+parser.add_argument('--nworkers', type=int, default=1,
+                    help='the number of decoding threads, each of which has a replica of the model')
+parser.add_argument('--nthreads', type=int, default=1,
+                    help='the number of intra-op threads of pytorch')
+# features
+parser.add_argument('--cmvn', type=str, default=None, nargs='?',
+                    help='path to global CMVN statistics (cmvn.ark) applied to features of wav uploads')
+parser.add_argument('--sample_rate', type=int, default=16000,
+                    help='the sampling rate of wav uploads')
+# decoding paramter
+parser.add_argument('--beam_width', type=int, default=1,
+                    help='the size of beam')
+parser.add_argument('--max_len_ratio', type=float, default=1,
+                    help='')
+parser.add_argument('--min_len_ratio', type=float, default=0.0,
+                    help='')
+parser.add_argument('--length_penalty', type=float, default=0.0,
+                    help='length penalty')
+parser.add_argument('--coverage_penalty', type=float, default=0.0,
+                    help='coverage penalty')
+parser.add_argument('--coverage_threshold', type=float, default=0.0,
+                    help='coverage threshold')
+parser.add_argument('--recog_ctc_weight', type=float, default=0.0,
+                    help='the weight of CTC prefix score in joint CTC/attention decoding')
+parser.add_argument('--attn_window', type=int, default=0,
+                    help='restrict attention to this number of frames around the previous peak (0 means no restriction)')
+parser.add_argument('--blank_skip_threshold', type=float, default=0.0,
+                    help='remove frames whose CTC blank posterior is not less than this value before attention (0 means no skipping)')
+parser.add_argument('--blank_skip_min_frames', type=int, default=1,
+                    help='the minimum number of frames kept per utterance in blank skipping (at least 1)')
+parser.add_argument('--blank_skip_merge', type=strtobool, default=False,
+                    help='merge each run of blank frames into one frame instead of removing it')
+parser.add_argument('--shortlist_threshold', type=float, default=0.0,
+                    help='restrict the output layer in beam search to tokens whose CTC posterior exceeds this value (0 means the full vocabulary)')
+parser.add_argument('--shortlist_nfrequent', type=int, default=0,
+                    help='the number of the most frequent tokens always included in the shortlist')
+parser.add_argument('--shortlist_max_error', type=float, default=0.01,
+                    help='fall back to the full softmax when the error bound of log-probabilities exceeds this value')
+args = parser.parse_args()
+
+logger = logging.getLogger('decoding')
+
+# Upper bounds of buckets of the latency histogram [ms]
+LATENCY_BUCKETS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float('inf')]
+
+
+class Histogram(object):
+    """Histogram with fixed buckets.
+
+    Args:
+        buckets (list): upper bounds of buckets in the ascending order
+
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.
+        self.count = 0
+
+    def observe(self, value):
+        for i, upper in enumerate(self.buckets):
+            if value <= upper:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def to_dict(self):
+        return {'buckets': [{'le': str(upper), 'count': c} for upper, c in zip(self.buckets, self.counts)],
+                'count': self.count,
+                'mean': self.sum / self.count if self.count > 0 else 0.}
+
+
+class MicroBatcher(object):
+    """Group concurrent requests into mini-batches.
+
+        A mini-batch is dispatched when it has max_batch_size requests or when the first request
+        has waited for max_latency. Mini-batches are decoded on a thread pool, and requests
+        keep queueing while all threads are busy, so that mini-batches grow with the load.
+
+    Args:
+        decode_fn (function): decode a list of features and return a list of results
+        max_batch_size (int):
+        max_latency (float): [sec]
+        nworkers (int): the number of decoding threads
+
+    """
+
+    def __init__(self, decode_fn, max_batch_size, max_latency, nworkers):
+        self.decode_fn = decode_fn
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.executor = ThreadPoolExecutor(max_workers=nworkers)
+        self.workers = asyncio.Semaphore(nworkers)
+        self.queue = asyncio.Queue()
+        self.latency_hist = Histogram(LATENCY_BUCKETS)
+        self.batch_size_hist = Histogram(list(range(1, max_batch_size + 1)))
+
+    async def submit(self, xs):
+        """Decode features of a request.
+
+        Args:
+            xs (np.ndarray): `[T, input_dim]`
+        Returns:
+            result (dict):
+
+        """
+        future = asyncio.get_event_loop().create_future()
+        await self.queue.put((xs, future, time.time()))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            await self.workers.acquire()
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_latency - (time.time() - batch[0][2])
+            while len(batch) < self.max_batch_size:
+                if not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            task = loop.run_in_executor(self.executor, self.decode_fn, [xs for xs, _, _ in batch])
+            task.add_done_callback(lambda task, batch=batch: self._finish(task, batch))
+
+    def _finish(self, task, batch):
+        self.workers.release()
+        self.batch_size_hist.observe(len(batch))
+        error = task.exception()
+        for i, (_, future, start_time) in enumerate(batch):
+            if future.cancelled():
+                continue
+            if error is not None:
+                future.set_exception(error)
+                continue
+            latency = (time.time() - start_time) * 1000
+            self.latency_hist.observe(latency)
+            future.set_result(dict(task.result()[i], latency_ms=latency, batch_size=len(batch)))
+
+
+class Recognizer(object):
+    """Decode mini-batches of features with replicas of the model.
+
+    Args:
+        model (Seq2seq):
+        decode_params (dict):
+        id2token (): converter from index to token
+        nworkers (int): the number of replicas
+
+    """
+
+    def __init__(self, model, decode_params, id2token, nworkers=1):
+        self.decode_params = decode_params
+        self.id2token = id2token
+        # NOTE: decoders keep states during decoding, so each thread needs its own replica
+        self.models = queue.Queue()
+        self.models.put(model)
+        for _ in range(nworkers - 1):
+            self.models.put(copy.deepcopy(model))
+
+    def __call__(self, xs):
+        model = self.models.get()
+        try:
+            best_hyps, _, perm_ids = model.decode(xs, self.decode_params, exclude_eos=True, return_aws=False)
+        finally:
+            self.models.put(model)
+
+        results = [None] * len(xs)
+        for b, i in enumerate(perm_ids):
+            text = self.id2token(best_hyps[b])
+            if isinstance(text, bytes):
+                text = text.decode('utf-8')
+            results[i] = {'text': text, 'token_ids': [int(y) for y in best_hyps[b]]}
+        return results
+
+
+def load_cmvn(cmvn_path):
+    """Load global CMVN statistics computed by compute-cmvn-stats.
+
+    Args:
+        cmvn_path (str):
+    Returns:
+        mean (np.ndarray): `[input_dim]`
+        std (np.ndarray): `[input_dim]`
+
+    """
+    stats = kaldi_io.read_mat(cmvn_path)
+    count = stats[0, -1]
+    mean = stats[0, :-1] / count
+    var = stats[1, :-1] / count - mean ** 2
+    return mean, np.sqrt(np.maximum(var, 1e-20))
+
+
+def wav2feat(data, input_dim, sample_rate, cmvn=None):
+    """Extract log-mel filterbank features from a wav file.
+
+        Features are approximations of fbank of Kaldi with conf/fbank.conf of the recipes.
+    Args:
+        data (bytes): a wav file
+        input_dim (int): the number of mel bins
+        sample_rate (int):
+        cmvn (tuple): A tuple of (mean, std)
+    Returns:
+        feat (np.ndarray): `[T, input_dim]`
+
+    """
+    rate, signal = wavfile.read(io.BytesIO(data))
+    if rate != sample_rate:
+        raise ValueError('The sampling rate must be %d, but got %d.' % (sample_rate, rate))
+    if signal.ndim > 1:
+        signal = signal[:, 0]
+    feat = logfbank(signal.astype(np.float32), samplerate=rate, winlen=0.025, winstep=0.01,
+                    nfilt=input_dim, nfft=512, lowfreq=20, preemph=0.97, winfunc=np.hamming)
+    if cmvn is not None:
+        feat = (feat - cmvn[0]) / cmvn[1]
+    return feat.astype(np.float32)
+
+
+def load_feat(body, content_type, input_dim, sample_rate, cmvn=None):
+    """Load features of a request from a wav file or a .npy file.
+
+    Args:
+        body (bytes):
+        content_type (str):
+        input_dim (int):
+        sample_rate (int):
+        cmvn (tuple): A tuple of (mean, std)
+    Returns:
+        xs (np.ndarray): `[T, input_dim]`
+
+    """
+    if 'wav' in content_type:
+        xs = wav2feat(body, input_dim, sample_rate, cmvn)
+    else:
+        xs = np.load(io.BytesIO(body)).astype(np.float32)
+    if xs.ndim != 2 or xs.shape[1] != input_dim or xs.shape[0] == 0:
+        raise ValueError('Features must be of size [T, %d], but got %s.' % (input_dim, str(xs.shape)))
+    return xs
+
+
+def http_response(writer, status, body, content_type='application/json'):
+    if not isinstance(body, bytes):
+        body = json.dumps(body).encode('utf-8')
+    writer.write(('HTTP/1.1 %s\r\nContent-Type: %s\r\nContent-Length: %d\r\n\r\n' %
+                  (status, content_type, len(body))).encode('latin-1') + body)
+
+
+def make_handler(batcher, input_dim, sample_rate, cmvn=None):
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                # Parse a request
+                request_line = await reader.readline()
+                if len(request_line) == 0:
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = (await reader.readline()).decode('latin-1').strip()
+                    if len(line) == 0:
+                        break
+                    k, v = line.split(':', 1)
+                    headers[k.strip().lower()] = v.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                if method == 'GET' and path == '/health':
+                    http_response(writer, '200 OK', {'status': 'ok'})
+                elif method == 'GET' and path == '/metrics':
+                    http_response(writer, '200 OK', {'latency_ms': batcher.latency_hist.to_dict(),
+                                                     'batch_size': batcher.batch_size_hist.to_dict()})
+                elif method == 'POST' and path == '/recognize':
+                    try:
+                        # NOTE: features are extracted out of the event loop not to stall other connections
+                        xs = await asyncio.get_event_loop().run_in_executor(
+                            None, load_feat, body, headers.get('content-type', ''), input_dim, sample_rate, cmvn)
+                    except Exception as e:
+                        http_response(writer, '400 Bad Request', {'error': str(e)})
+                    else:
+                        try:
+                            result = await batcher.submit(xs)
+                        except Exception as e:
+                            logger.exception('Failed to decode a request.')
+                            http_response(writer, '500 Internal Server Error', {'error': str(e)})
+                        else:
+                            http_response(writer, '200 OK', result)
+                else:
+                    http_response(writer, '404 Not Found', {'error': 'unknown path: %s %s' % (method, path)})
+                await writer.drain()
+
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        except Exception:
+            logger.exception('Failed to handle a request.')
+        finally:
+            writer.close()
+
+    return handle
+
+
+def main():
+
+    # Load a config file
+    config = load_config(os.path.join(args.model, 'config.yml'))
+
+    # Merge config with args
+    for k, v in config.items():
+        if not hasattr(args, k):
+            setattr(args, k, v)
+
+    # Setting for logging
+    if args.log is not None:
+        set_logger(args.log, key='decoding')
+    else:
+        logging.basicConfig(level=logging.INFO)
+
+    torch.set_num_threads(args.nthreads)
+
+    # Load the ASR model on CPUs
+    args.rnnlm_cold_fusion = None
+    args.rnnlm_init = None
+    model = Seq2seq(args)
+    epoch, _, _, _ = model.load_checkpoint(args.model, epoch=args.epoch)
+    model.save_path = args.model
+    model.eval()
+    logger.info('epoch: %d' % (epoch - 1))
+
+    dict_path = os.path.join(args.model, 'dict.txt')
+    if args.unit in ['word', 'word_char']:
+        id2token = Id2word(dict_path)
+    elif args.unit == 'wp':
+        id2token = Id2wp(dict_path, os.path.join(args.model, 'wp.model'))
+    elif args.unit == 'char':
+        id2token = Id2char(dict_path)
+    elif 'phone' in args.unit:
+        id2token = Id2phone(dict_path)
+    else:
+        raise ValueError(args.unit)
+
+    decode_params = vars(args)
+    # NOTE: language models are not loaded
+    decode_params.update({'rnnlm_weight': 0., 'ngram_weight': 0.,
+                          'rescore_bwd_weight': 0., 'rescore_rnnlm_weight': 0.,
+                          'resolving_unk': False, 'fwd_bwd_attention': False})
+
+    cmvn = load_cmvn(args.cmvn) if args.cmvn is not None else None
+
+    recognizer = Recognizer(model, decode_params, id2token, args.nworkers)
+    loop = asyncio.get_event_loop()
+    batcher = MicroBatcher(recognizer, args.max_batch_size, args.max_latency_ms / 1000, args.nworkers)
+    handler = make_handler(batcher, args.input_dim, args.sample_rate, cmvn)
+    if args.unix_socket is not None:
+        server = loop.run_until_complete(asyncio.start_unix_server(handler, path=args.unix_socket))
+        logger.info('Listening on %s' % args.unix_socket)
+    else:
+        server = loop.run_until_complete(asyncio.start_server(handler, args.host, args.port))
+        logger.info('Listening on %s:%d' % (args.host, args.port))
+
+    loop.create_task(batcher.run())
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        loop.run_until_complete(server.wait_closed())
+        batcher.executor.shutdown()
+        loop.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -172,6 +172,8 @@ parser.add_argument('--emb_dim', type=int, default=320,
                     help='')
 parser.add_argument('--tie_embedding', type=bool, default=False, nargs='?',
                     help='If True, tie weights between an embedding matrix and a linear layer before the softmax layer.')
+parser.add_argument('--adaptive_softmax', type=bool, default=False, nargs='?',
+                    help='If True, use the adaptive softmax output layer (the vocabulary must be sorted by frequency).')
 parser.add_argument('--input_feeding', type=bool, default=False, nargs='?',
                     help='')
 parser.add_argument('--ctc_fc_list', type=str, default="", nargs='?',
@@ -267,6 +269,9 @@ parser.add_argument('--ctc_weight_sub1', type=float, default=0.0,
                     help='')
 parser.add_argument('--ctc_weight_sub2', type=float, default=0.0,
                     help='')
+parser.add_argument('--ctc_backend', type=str, default='native',
+                    choices=['native', 'warpctc'],
+                    help='CTC loss implementation (native: torch.nn.functional.ctc_loss)')
 parser.add_argument('--sub1_weight', type=float, default=0.0,
                     help='')
 parser.add_argument('--sub2_weight', type=float, default=0.0,
@@ -275,6 +280,11 @@ parser.add_argument('--mtl_per_batch', type=bool, default=False, nargs='?',
                     help='If True, change mini-batch per task')
 parser.add_argument('--task_specific_layer', type=bool, default=False, nargs='?',
                     help='If True, insert a task-specific encoder layer per task')
+parser.add_argument('--mtl_encode_once', type=str, default='', nargs='?',
+                    choices=['', 'combined', 'per_task'],
+                    help='Encode once per mini-batch for all tasks with mtl_per_batch. '
+                    'combined: update with the sum of all task losses. '
+                    'per_task: update per task with gradients computed from the shared graph.')
 # foroward-backward
 parser.add_argument('--bwd_weight', type=float, default=0.0,
                     help='')
@@ -329,6 +339,17 @@ decode_params = {
     'coverage_penalty': 0.0,
     'coverage_threshold': 0.0,
     'rnnlm_weight': 0.0,
+    'recog_ctc_weight': 0.0,
+    'ngram_weight': 0.0,
+    'rescore_bwd_weight': 0.0,
+    'rescore_rnnlm_weight': 0.0,
+    'attn_window': 0,
+    'blank_skip_threshold': 0.0,
+    'blank_skip_min_frames': 1,
+    'blank_skip_merge': False,
+    'shortlist_threshold': 0.0,
+    'shortlist_nfrequent': 0,
+    'shortlist_max_error': 0.01,
     'resolving_unk': False,
     'fwd_bwd_attention': False
 }
@@ -484,6 +505,8 @@ def main():
         dir_name += str(args.dec_nlayers) + 'L'
         if args.tie_embedding:
             dir_name += '_tie'
+        if args.adaptive_softmax:
+            dir_name += '_adaptive'
         dir_name += '_' + args.attn_type
         if args.attn_nheads > 1:
             dir_name += '_head' + str(args.attn_nheads)
@@ -734,20 +757,45 @@ def main():
         # Compute loss in the training set
         batch_train, is_new_epoch = train_set.next()
 
-        # Change tasks depending on task
-        for task in tasks:
+        if args.mtl_per_batch and args.mtl_encode_once:
+            # Compute losses of all tasks with a single encoder pass
             model.module.optimizer.zero_grad()
-            loss, reporter = model(batch_train, reporter=reporter, task=task)
-            if len(model.device_ids) > 1:
-                loss.backward(torch.ones(len(model.device_ids)))
-            else:
-                loss.backward()
-            loss.detach()  # Trancate the graph
-            if args.clip_grad_norm > 0:
-                torch.nn.utils.clip_grad_norm_(model.module.parameters(), args.clip_grad_norm)
-            model.module.optimizer.step()
-            loss_train = loss.item()
-            del loss
+            losses, reporter = model(batch_train, reporter=reporter, task=tasks)
+            if args.mtl_encode_once == 'combined':
+                losses = [sum(losses)]
+            grads = []
+            for i, loss in enumerate(losses):
+                model.module.optimizer.zero_grad()
+                if len(model.device_ids) > 1:
+                    loss.backward(torch.ones(len(model.device_ids)), retain_graph=i < len(losses) - 1)
+                else:
+                    loss.backward(retain_graph=i < len(losses) - 1)
+                grads.append([p.grad.clone() if p.grad is not None else None
+                              for p in model.module.parameters()])
+            # NOTE: all gradients are computed before updating parameters
+            for grad in grads:
+                for p, g in zip(model.module.parameters(), grad):
+                    p.grad = g
+                if args.clip_grad_norm > 0:
+                    torch.nn.utils.clip_grad_norm_(model.module.parameters(), args.clip_grad_norm)
+                model.module.optimizer.step()
+            loss_train = sum([loss.item() for loss in losses])
+            del losses, grads
+        else:
+            # Change tasks depending on task
+            for task in tasks:
+                model.module.optimizer.zero_grad()
+                loss, reporter = model(batch_train, reporter=reporter, task=task)
+                if len(model.device_ids) > 1:
+                    loss.backward(torch.ones(len(model.device_ids)))
+                else:
+                    loss.backward()
+                loss.detach()  # Trancate the graph
+                if args.clip_grad_norm > 0:
+                    torch.nn.utils.clip_grad_norm_(model.module.parameters(), args.clip_grad_norm)
+                model.module.optimizer.step()
+                loss_train = loss.item()
+                del loss
         reporter.step(is_eval=False)
 
         # Update learning rate
@@ -760,12 +808,18 @@ def main():
         if step % args.print_step == 0:
             # Compute loss in the dev set
             batch_dev = dev_set.next()[0]
-            # Change tasks depending on task
-            for task in tasks:
-                loss, reporter = model(batch_dev, reporter=reporter, task=task,
-                                       is_eval=True)
-                loss_dev = loss.item()
-                del loss
+            if args.mtl_per_batch and args.mtl_encode_once:
+                losses, reporter = model(batch_dev, reporter=reporter, task=tasks,
+                                         is_eval=True)
+                loss_dev = sum([loss.item() for loss in losses])
+                del losses
+            else:
+                # Change tasks depending on task
+                for task in tasks:
+                    loss, reporter = model(batch_dev, reporter=reporter, task=task,
+                                           is_eval=True)
+                    loss_dev = loss.item()
+                    del loss
             reporter.step(is_eval=True)
 
             duration_step = time.time() - start_time_step
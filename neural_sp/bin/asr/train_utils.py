@@ -272,12 +272,12 @@ def load_config(config_path):
 
     """
     with open(config_path, "r") as f:
-        config = yaml.load(f)
+        config = yaml.load(f, Loader=yaml.Loader)
 
         # Load the parent config file
         if 'parent' in config.keys():
             with open(config['parent'], "r") as fp:
-                config_parent = yaml.load(fp)
+                config_parent = yaml.load(fp, Loader=yaml.Loader)
             params = config_parent['param']
 
             # Override
@@ -0,0 +1,33 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Convert an ARPA file into memory-mappable arrays of the n-gram LM."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+
+from neural_sp.models.ngram.ngram import NgramLM
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--arpa', type=str,
+                    help='path to an ARPA file')
+parser.add_argument('--save_dir', type=str,
+                    help='directory to save arrays')
+args = parser.parse_args()
+
+
+def main():
+
+    lm = NgramLM.from_arpa(args.arpa)
+    lm.save(args.save_dir)
+    print('order: %d, vocab: %d' % (lm.order, len(lm.vocab)))
+
+
+if __name__ == '__main__':
+    main()
@@ -79,6 +79,8 @@ parser.add_argument('--emb_dim', type=int, default=5,
                     help='')
 parser.add_argument('--tie_weights', type=bool, default=False,
                     help='')
+parser.add_argument('--adaptive_softmax', type=bool, default=False,
+                    help='If True, use the adaptive softmax output layer (the vocabulary must be sorted by frequency).')
 parser.add_argument('--residual', type=bool, default=False,
                     help='')
 parser.add_argument('--backward', type=bool, default=False,
@@ -192,6 +194,8 @@ def main():
     model.name += '_bs' + str(args.batch_size)
     if args.tie_weights:
         model.name += '_tie'
+    if args.adaptive_softmax:
+        model.name += '_adaptive'
     if args.residual:
         model.name += '_residual'
     if args.backward:
@@ -12,6 +12,7 @@ from __future__ import print_function
 
 import codecs
 import logging
+import numpy as np
 import random
 import six
 import time
@@ -139,7 +140,10 @@ class Base(object):
         is_new_epoch = False
 
         if self.sort_by_input_length or not self.shuffle:
-            if self.sort_by_input_length:
+            if self.sort_by_input_length and self.max_nframes_batch > 0:
+                # Fill mini-batches up to the budget of padded frames
+                _batch_size = self.select_batch_size_by_frames(self.max_nframes_batch)
+            elif self.sort_by_input_length:
                 # Change batch size dynamically
                 min_num_frames_batch = self.df[self.offset:self.offset + 1]['x_len'].values[0]
                 _batch_size = self.select_batch_size(batch_size, min_num_frames_batch)
@@ -196,6 +200,19 @@ class Base(object):
 
         return batch_size
 
+    def select_batch_size_by_frames(self, max_nframes_batch):
+        """The number of utterances from the offset whose padded frames fit in the budget.
+
+        Args:
+            max_nframes_batch (int): the maximum number of frames in a mini-batch after padding
+        Returns:
+            batch_size (int): at least 1
+
+        """
+        xlens = self.df['x_len'].values[self.offset:self.offset + max_nframes_batch]
+        nframes_padded = np.maximum.accumulate(xlens) * np.arange(1, len(xlens) + 1)
+        return max(1, int(np.sum(nframes_padded <= max_nframes_batch)))
+
     def reset(self):
         self._reset()
 
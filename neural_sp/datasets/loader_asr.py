@@ -39,7 +39,7 @@ class Dataset(Base):
                  is_test=False,  min_nframes=40, max_nframes=2000,
                  shuffle=False, sort_by_input_length=False,
                  short2long=False, sort_stop_epoch=None,
-                 nques=None, dynamic_batching=False,
+                 nques=None, dynamic_batching=False, max_nframes_batch=0,
                  ctc=False, subsample_factor=1, skip_speech=False,
                  wp_model=False, wp_model_sub1=False, wp_model_sub2=False,
                  csv_path_sub1=False, dict_path_sub1=False, unit_sub1=False,
@@ -66,6 +66,8 @@ class Dataset(Base):
             nques (int): the number of elements to enqueue
             dynamic_batching (bool): if True, batch size will be chainged
                 dynamically in training
+            max_nframes_batch (int): if > 0, mini-batches are formed up to this number of
+                padded frames instead of batch_size (only when sort_by_input_length is True)
             ctc (bool):
             subsample_factor (int):
             skip_speech (bool): skip loading speech features
@@ -85,6 +87,7 @@ class Dataset(Base):
         self.sort_stop_epoch = sort_stop_epoch
         self.nques = nques
         self.dynamic_batching = dynamic_batching
+        self.max_nframes_batch = max_nframes_batch
         self.skip_speech = skip_speech
         self.vocab = self.count_vocab_size(dict_path)
 
@@ -11,6 +11,7 @@ from __future__ import division
 from __future__ import print_function
 
 import codecs
+import six
 
 
 class Char2id(object):
@@ -30,7 +31,7 @@ class Char2id(object):
         self.token2id = {}
         with codecs.open(dict_path, 'r', 'utf-8') as f:
             for line in f:
-                c, id = line.strip().encode('utf_8').split(' ')
+                c, id = (line.strip().encode('utf_8') if six.PY2 else line.strip()).split(' ')
                 if c in remove_list:
                     continue
                 self.token2id[c] = int(id)
@@ -81,7 +82,7 @@ class Id2char(object):
         self.id2token = {}
         with codecs.open(dict_path, 'r', 'utf-8') as f:
             for line in f:
-                c, id = line.strip().encode('utf_8').split(' ')
+                c, id = (line.strip().encode('utf_8') if six.PY2 else line.strip()).split(' ')
                 if c in remove_list:
                     continue
                 self.id2token[int(id)] = c
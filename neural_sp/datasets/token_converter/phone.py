@@ -11,6 +11,7 @@ from __future__ import division
 from __future__ import print_function
 
 import codecs
+import six
 
 
 class Phone2id(object):
@@ -27,7 +28,7 @@ class Phone2id(object):
         self.token2id = {}
         with codecs.open(dict_path, 'r', 'utf-8') as f:
             for line in f:
-                p, id = line.strip().encode('utf_8').split(' ')
+                p, id = (line.strip().encode('utf_8') if six.PY2 else line.strip()).split(' ')
                 if p in remove_list:
                     continue
                 self.token2id[p] = int(id)
@@ -60,7 +61,7 @@ class Id2phone(object):
         self.id2token = {}
         with codecs.open(dict_path, 'r', 'utf-8') as f:
             for line in f:
-                p, id = line.strip().encode('utf_8').split(' ')
+                p, id = (line.strip().encode('utf_8') if six.PY2 else line.strip()).split(' ')
                 if p in remove_list:
                     continue
                 self.id2token[int(id)] = p
@@ -12,6 +12,7 @@ from __future__ import print_function
 
 import codecs
 import sentencepiece as spm
+import six
 
 
 class Wp2id(object):
@@ -27,7 +28,7 @@ class Wp2id(object):
         self.token2id = {}
         with codecs.open(dict_path, 'r', 'utf-8') as f:
             for line in f:
-                wp, id = line.strip().encode('utf_8').split(' ')
+                wp, id = (line.strip().encode('utf_8') if six.PY2 else line.strip()).split(' ')
                 self.token2id[wp] = int(id)
 
         self.sp = spm.SentencePieceProcessor()
@@ -66,7 +67,7 @@ class Id2wp(object):
         self.id2token = {}
         with codecs.open(dict_path, 'r', 'utf-8') as f:
             for line in f:
-                wp, id = line.strip().encode('utf_8').split(' ')
+                wp, id = (line.strip().encode('utf_8') if six.PY2 else line.strip()).split(' ')
                 self.id2token[int(id)] = wp
 
         self.sp = spm.SentencePieceProcessor()
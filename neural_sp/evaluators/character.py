@@ -57,6 +57,18 @@ def eval_char(models, dataset, decode_params, epoch,
         decode_dir += '_cp' + str(decode_params['coverage_penalty'])
         decode_dir += '_' + str(decode_params['min_len_ratio']) + '_' + str(decode_params['max_len_ratio'])
         decode_dir += '_rnnlm' + str(decode_params['rnnlm_weight'])
+        if decode_params['recog_ctc_weight'] > 0:
+            decode_dir += '_ctc' + str(decode_params['recog_ctc_weight'])
+        if decode_params['ngram_weight'] > 0:
+            decode_dir += '_ngram' + str(decode_params['ngram_weight'])
+        if decode_params['blank_skip_threshold'] > 0:
+            decode_dir += '_skip' + str(decode_params['blank_skip_threshold'])
+        if decode_params['shortlist_threshold'] > 0:
+            decode_dir += '_shortlist' + str(decode_params['shortlist_threshold'])
+        if decode_params['rescore_bwd_weight'] > 0:
+            decode_dir += '_rescore_bwd' + str(decode_params['rescore_bwd_weight'])
+        if decode_params['rescore_rnnlm_weight'] > 0:
+            decode_dir += '_rescore_lm' + str(decode_params['rescore_rnnlm_weight'])
 
         ref_trn_save_path = mkdir_join(model.save_path, decode_dir, 'ref.trn')
         hyp_trn_save_path = mkdir_join(model.save_path, decode_dir, 'hyp.trn')
@@ -68,6 +80,7 @@ def eval_char(models, dataset, decode_params, epoch,
     nsub_w, nins_w, ndel_w = 0, 0, 0
     nsub_c, nins_c, ndel_c = 0, 0, 0
     nword, nchar = 0, 0
+    trn_lines = []
     if progressbar:
         pbar = tqdm(total=len(dataset))
 
@@ -82,20 +95,24 @@ def eval_char(models, dataset, decode_params, epoch,
         while True:
             batch, is_new_epoch = dataset.next(decode_params['batch_size'])
             best_hyps, _, perm_ids = model.decode(batch['xs'], decode_params,
-                                                  exclude_eos=True, task=task)
+                                                  exclude_eos=True, task=task,
+                                                  return_aws=False,
+                                                  utt_ids=batch['utt_ids'])
             ys = [batch['text'][i] for i in perm_ids]
+            utt_ids = [batch['utt_ids'][i] for i in perm_ids]
 
             for b in six.moves.range(len(batch['xs'])):
                 ref = ys[b]
                 hyp = dataset.id2char(best_hyps[b])
 
-                # Write to trn
-                speaker = '_'.join(batch['utt_ids'][b].replace('-', '_').split('_')[:-2])
-                start = batch['utt_ids'][b].replace('-', '_').split('_')[-2]
-                end = batch['utt_ids'][b].replace('-', '_').split('_')[-1]
-                f_ref.write(ref + ' (' + speaker + '-' + start + '-' + end + ')\n')
-                f_hyp.write(hyp + ' (' + speaker + '-' + start + '-' + end + ')\n')
-                logger.info('utt-id: %s' % batch['utt_ids'][b])
+                # Write to trn later
+                speaker = '_'.join(utt_ids[b].replace('-', '_').split('_')[:-2])
+                start = utt_ids[b].replace('-', '_').split('_')[-2]
+                end = utt_ids[b].replace('-', '_').split('_')[-1]
+                trn_lines.append((utt_ids[b],
+                                  ref + ' (' + speaker + '-' + start + '-' + end + ')\n',
+                                  hyp + ' (' + speaker + '-' + start + '-' + end + ')\n'))
+                logger.info('utt-id: %s' % utt_ids[b])
                 # logger.info('Ref: %s' % ref.lower())
                 logger.info('Ref: %s' % ref)
                 logger.info('Hyp: %s' % hyp)
@@ -130,6 +147,11 @@ def eval_char(models, dataset, decode_params, epoch,
             if is_new_epoch:
                 break
 
+        # Write to trn in the original order (sorted by utt_id) when decoded in the length order
+        for _, ref_line, hyp_line in sorted(trn_lines, key=lambda x: x[0]):
+            f_ref.write(ref_line)
+            f_hyp.write(hyp_line)
+
     if progressbar:
         pbar.close()
 
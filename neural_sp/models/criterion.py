@@ -11,11 +11,11 @@ from __future__ import division
 from __future__ import print_function
 
 import math
-import numpy as np
-
 import torch
 import torch.nn.functional as F
 
+from neural_sp.models.torch_utils import make_pad_mask
+
 
 def cross_entropy_lsm(logits, ys, y_lens, lsm_prob, size_average=False):
     """Compute cross entropy loss for label smoothing of sequence-to-sequence models.
@@ -32,17 +32,18 @@ def cross_entropy_lsm(logits, ys, y_lens, lsm_prob, size_average=False):
     """
     bs, _, vocab = logits.size()
     fill_val = lsm_prob / (vocab - 1)
-
-    # Create one-hot vector
-    ys_lsm = torch.zeros_like(logits).fill_(fill_val)
-    for b in range(bs):
-        for t in range(y_lens[b]):
-            ys_lsm[b, t, ys[b, t]] = 1 - lsm_prob
+    max_time = max(y_lens)
+    logits = logits[:, :max_time]
+    ys = ys[:, :max_time]
+    mask = make_pad_mask(y_lens, logits.get_device())
 
     # Compute XE for label smoothing
+    # NOTE: the smoothed target is fill_val for all classes except for the
+    # reference class (1 - lsm_prob), so the one-hot tensor is not materialized
     log_probs = F.log_softmax(logits, dim=-1)
-    loss = np.sum([(- ys_lsm[b, :y_lens[b]] * log_probs[b, :y_lens[b]]).sum()
-                   for b in range(bs)])
+    log_probs_ref = log_probs.gather(-1, ys.masked_fill(mask == 0, 0).unsqueeze(-1)).squeeze(-1)
+    loss = -(fill_val * log_probs.sum(-1) + (1 - lsm_prob - fill_val) * log_probs_ref)
+    loss = loss.masked_select(mask).sum()
     if size_average:
         loss /= bs
     return loss
@@ -61,15 +62,16 @@ def kldiv_lsm_ctc(logits, y_lens, lsm_prob, size_average=False):
 
     """
     bs, _, vocab = logits.size()
-
-    # Create uniform distribution
-    log_uniform = torch.zeros_like(logits).fill_(math.log(lsm_prob))
+    max_time = max(y_lens)
+    logits = logits[:, :max_time]
+    mask = make_pad_mask(y_lens, logits.get_device())
 
     # Compute XE for label smoothing
+    # NOTE: the uniform distribution is constant over classes
     probs = F.softmax(logits, dim=-1)
     log_probs = F.log_softmax(logits, dim=-1)
-    kl_div = torch.mul(probs, log_probs) - torch.mul(probs, log_uniform)
-    loss = np.sum([kl_div[b, :y_lens[b]].sum() for b in range(bs)])
+    kl_div = torch.mul(probs, log_probs).sum(-1) - probs.sum(-1) * math.log(lsm_prob)
+    loss = kl_div.masked_select(mask).sum()
     if size_average:
         loss /= bs
     return loss
@@ -89,19 +91,17 @@ def focal_loss(logits, ys, y_lens, gamma, size_average=False):
 
     """
     bs = ys.size(0)
+    max_time = max(y_lens)
+    logits = logits[:, :max_time]
+    ys = ys[:, :max_time]
+    mask = make_pad_mask(y_lens, logits.get_device())
 
-    # Create one-hot vector
-    ys_onehot = torch.zeros_like(logits)
-    for b in range(bs):
-        for t in range(y_lens[b]):
-            ys_onehot[b, t, ys[b, t]] = 1
-
-    # Compute focal loss
+    # Compute focal loss only for the reference classes
     log_probs = F.log_softmax(logits, dim=-1)
-    probs = F.softmax(logits, dim=-1)
-    ones = torch.ones_like(log_probs)
-    loss = np.sum([(- ys_onehot[b, :y_lens[b]] * log_probs[b, :y_lens[b]] * torch.pow(ones[b, :y_lens[b]] - probs[b, :y_lens[b]], gamma)).sum()
-                   for b in range(bs)])
+    log_probs_ref = log_probs.gather(-1, ys.masked_fill(mask == 0, 0).unsqueeze(-1)).squeeze(-1)
+    probs_ref = torch.exp(log_probs_ref)
+    loss = -log_probs_ref * torch.pow(1 - probs_ref, gamma)
+    loss = loss.masked_select(mask).sum()
     if size_average:
         loss /= bs
     return loss
@@ -11,6 +11,7 @@ from __future__ import division
 from __future__ import print_function
 
 import numpy as np
+import torch
 import torch.nn as nn
 
 
@@ -86,3 +87,68 @@ class Embedding(nn.Module):
         if hasattr(self, 'dropout'):
             y = self.dropout(y)
         return y
+
+
+class AdaptiveSoftmax(nn.Module):
+
+    def __init__(self, in_size, vocab, cutoffs=None, div_value=4.0):
+        """Adaptive softmax layer.
+
+        A torch.nn.AdaptiveLogSoftmaxWithLoss layer modified to accept ND arrays.
+            Token indices are assumed to be sorted by frequency in descending order.
+            See "Efficient softmax approximation for GPUs" (Grave et al. 2017)
+            https://arxiv.org/abs/1609.04309
+        Args:
+            in_size (int):
+            vocab (int): the number of nodes in softmax layer
+            cutoffs (list): boundaries of frequency clusters
+            div_value (float): the factor to reduce the projection size of each tail cluster
+
+        """
+        super(AdaptiveSoftmax, self).__init__()
+
+        self.vocab = vocab
+        if cutoffs is None:
+            cutoffs = [int(round(vocab / 15)), 3 * int(round(vocab / 15))]
+        self.asm = nn.AdaptiveLogSoftmaxWithLoss(in_size, vocab,
+                                                 cutoffs=cutoffs,
+                                                 div_value=div_value)
+
+    def forward(self, xs):
+        """Compute exact log-probabilities over the whole vocabulary.
+
+        Args:
+            xs (FloatTensor): `[B, T, input_dim]`
+        Returns:
+            log_probs (FloatTensor): `[B, T, vocab]`
+
+        """
+        size = list(xs.size())
+        xs = xs.contiguous().view((int(np.prod(size[:-1])), int(size[-1])))
+        log_probs = self.asm.log_prob(xs)
+        size[-1] = self.vocab
+        return log_probs.view(size)
+
+    def loss(self, xs, ys, ignore_index=-1):
+        """Compute negative log-likelihood of the references.
+
+        Only the head and the tail clusters including the references are evaluated.
+
+        Args:
+            xs (FloatTensor): `[B, T, input_dim]`
+            ys (LongTensor): `[B, T]`
+            ignore_index (int):
+        Returns:
+            loss (FloatTensor): summed over all non-padded positions `[1]`
+            acc (float): token-level accuracy
+
+        """
+        mask = ys != ignore_index
+        xs = xs.contiguous().masked_select(mask.unsqueeze(-1)).view(-1, xs.size(-1))
+        ys = ys.masked_select(mask)
+        loss = -self.asm(xs, ys).output.sum()
+
+        # Compute token-level accuracy in teacher-forcing
+        pred = self.asm.predict(xs.detach())
+        acc = float(torch.sum(pred == ys)) * 100 / float(ys.size(0))
+        return loss, acc
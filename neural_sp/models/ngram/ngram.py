@@ -0,0 +1,438 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Back-off n-gram language model stored in a sorted-array trie."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from collections import OrderedDict
+import codecs
+import logging
+import math
+import numpy as np
+import os
+import re
+import torch
+
+logger = logging.getLogger('decoding')
+
+LN10 = math.log(10)
+
+
+class NgramLM(object):
+    """Back-off n-gram language model.
+
+        N-grams of each order are stored in flat arrays sorted by (index of the context, word id),
+        so that a lookup is a binary search within the children of the context.
+        The arrays can be saved with `save()` and memory-mapped with `load()`.
+        All log-probabilities are in the natural log.
+        Distributions over the vocabulary are cached up to `cache_bytes` in total.
+
+    Args:
+        vocab (list): words of the language model
+        arrays (dict): arrays of the trie
+            prob_k (np.ndarray): log-probabilities of k-grams `[N_k]`
+            bow_k (np.ndarray): back-off weights of k-grams `[N_k]` (k < order)
+            words_k (np.ndarray): the last words of k-grams `[N_k]` (k >= 2)
+            begin_k (np.ndarray): offsets of children of k-grams in (k+1)-grams `[N_k + 1]` (k < order)
+        cache_bytes (int): the maximum size of cached distributions in bytes
+
+    """
+
+    def __init__(self, vocab, arrays, cache_bytes=2 ** 28):
+        self.vocab = vocab
+        self.word2idx = {w: i for i, w in enumerate(vocab)}
+        self.order = max(int(k.split('_')[1]) for k in arrays.keys() if k.startswith('prob_'))
+        self.arrays = arrays
+        self.bos = self.word2idx.get('<s>')
+        self.eos = self.word2idx.get('</s>')
+        self.unk = self.word2idx.get('<unk>')
+
+        # Cache of distributions over the vocabulary per state
+        self.cache = LRUCache(cache_bytes)
+
+    @classmethod
+    def from_arpa(cls, arpa_path):
+        """Build the trie from an ARPA file.
+
+        Args:
+            arpa_path (str): path to an ARPA file
+        Returns:
+            NgramLM
+
+        """
+        ngrams = []
+        vocab = []
+        order = 0
+        with codecs.open(arpa_path, 'r', 'utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if len(line) == 0 or line.startswith('ngram ') or line == '\\data\\' or line == '\\end\\':
+                    continue
+                m = re.match(r'^\\(\d+)-grams:$', line)
+                if m is not None:
+                    order = int(m.group(1))
+                    ngrams.append({})
+                    continue
+                fields = line.split()
+                prob = float(fields[0]) * LN10
+                if len(fields) == order + 2:
+                    bow = float(fields[-1]) * LN10
+                    words = fields[1:-1]
+                else:
+                    bow = 0.
+                    words = fields[1:]
+                if order == 1:
+                    vocab.append(words[0])
+                ngrams[-1][tuple(words)] = (prob, bow)
+
+        # KenLM convention for a missing <unk>
+        if '<unk>' not in vocab:
+            vocab.append('<unk>')
+            ngrams[0][('<unk>',)] = (-100. * LN10, 0.)
+        word2idx = {w: i for i, w in enumerate(vocab)}
+
+        arrays = {}
+        n_max = len(ngrams)
+        arrays['prob_1'] = np.array([ngrams[0][(w,)][0] for w in vocab], dtype=np.float32)
+        arrays['bow_1'] = np.array([ngrams[0][(w,)][1] for w in vocab], dtype=np.float32)
+        index = {(word2idx[w],): i for i, w in enumerate(vocab)}
+        for k in range(2, n_max + 1):
+            entries = []
+            n_orphans = 0
+            for words, (prob, bow) in ngrams[k - 1].items():
+                ids = tuple(word2idx[w] for w in words)
+                if ids[:-1] not in index:
+                    n_orphans += 1
+                    continue
+                entries.append((index[ids[:-1]], ids[-1], prob, bow, ids))
+            if n_orphans > 0:
+                logger.warning('%d %d-grams without their contexts are skipped.' % (n_orphans, k))
+            entries.sort(key=lambda x: (x[0], x[1]))
+
+            parents = np.array([e[0] for e in entries], dtype=np.int64)
+            arrays['words_' + str(k)] = np.array([e[1] for e in entries], dtype=np.int32)
+            arrays['prob_' + str(k)] = np.array([e[2] for e in entries], dtype=np.float32)
+            if k < n_max:
+                arrays['bow_' + str(k)] = np.array([e[3] for e in entries], dtype=np.float32)
+            n_parents = len(arrays['prob_' + str(k - 1)])
+            arrays['begin_' + str(k - 1)] = np.searchsorted(parents, np.arange(n_parents + 1)).astype(np.int64)
+            index = {e[4]: i for i, e in enumerate(entries)}
+
+        return cls(vocab, arrays)
+
+    def save(self, save_dir):
+        """Save the trie as .npy files, which can be memory-mapped.
+
+        Args:
+            save_dir (str): path to a directory
+
+        """
+        if not os.path.isdir(save_dir):
+            os.makedirs(save_dir)
+        with codecs.open(os.path.join(save_dir, 'vocab.txt'), 'w', 'utf-8') as f:
+            for w in self.vocab:
+                f.write(w + '\n')
+        for k, v in self.arrays.items():
+            np.save(os.path.join(save_dir, k + '.npy'), v)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Load the language model.
+
+        Args:
+            path (str): path to an ARPA file or a directory saved by `save()`
+            mmap (bool): memory-map arrays instead of reading them
+        Returns:
+            NgramLM
+
+        """
+        if not os.path.isdir(path):
+            return cls.from_arpa(path)
+        with codecs.open(os.path.join(path, 'vocab.txt'), 'r', 'utf-8') as f:
+            vocab = [line.rstrip('\n') for line in f]
+        arrays = {}
+        for fname in os.listdir(path):
+            if fname.endswith('.npy'):
+                arrays[fname[:-4]] = np.load(os.path.join(path, fname), mmap_mode='r' if mmap else None)
+        return cls(vocab, arrays)
+
+    def word_id(self, word):
+        return self.word2idx.get(word, self.unk)
+
+    def initial_state(self):
+        """The context of the beginning of a sentence."""
+        return (self.bos,) if self.bos is not None else ()
+
+    def _find(self, ids):
+        """Find the index of an n-gram in the arrays of its order (-1 if missing)."""
+        idx = ids[0]
+        for k in range(2, len(ids) + 1):
+            begin = self.arrays['begin_' + str(k - 1)]
+            words = self.arrays['words_' + str(k)]
+            start, end = begin[idx], begin[idx + 1]
+            j = start + np.searchsorted(words[start:end], ids[k - 1])
+            if j >= end or words[j] != ids[k - 1]:
+                return -1
+            idx = j
+        return idx
+
+    def score(self, state, word):
+        """Score a word given the context with back-off.
+
+        Args:
+            state (tuple): ids of context words
+            word (int): word id
+        Returns:
+            logp (float): log-probability of the word
+            state (tuple): the next state
+
+        """
+        logp = 0.
+        for j in range(len(state), -1, -1):
+            context = state[len(state) - j:]
+            if j == 0:
+                logp += float(self.arrays['prob_1'][word])
+                break
+            idx = self._find(context + (word,))
+            if idx >= 0:
+                logp += float(self.arrays['prob_' + str(j + 1)][idx])
+                break
+            idx = self._find(context)
+            if idx >= 0:
+                logp += float(self.arrays['bow_' + str(j)][idx])
+        return logp, self.next_state(state, word)
+
+    def next_state(self, state, word):
+        """The longest suffix of the history which exists as a context in the model."""
+        history = state + (word,)
+        for j in range(min(len(history), self.order - 1), 0, -1):
+            if self._find(history[len(history) - j:]) >= 0:
+                return history[len(history) - j:]
+        return ()
+
+    def log_probs(self, state):
+        """Distribution over the whole vocabulary given the context.
+
+        Args:
+            state (tuple): ids of context words
+        Returns:
+            log_probs (np.ndarray): `[vocab]`
+
+        """
+        log_probs = self.cache.get(state)
+        if log_probs is not None:
+            return log_probs
+
+        log_probs = np.array(self.arrays['prob_1'], dtype=np.float32)
+        for j in range(1, len(state) + 1):
+            context = state[len(state) - j:]
+            idx = self._find(context)
+            if idx < 0:
+                continue
+            # Back off to the shorter context and override explicit n-grams
+            log_probs += self.arrays['bow_' + str(j)][idx]
+            begin = self.arrays['begin_' + str(j)]
+            start, end = begin[idx], begin[idx + 1]
+            log_probs[self.arrays['words_' + str(j + 1)][start:end]] = self.arrays['prob_' + str(j + 1)][start:end]
+
+        self.cache.put(state, log_probs)
+        return log_probs
+
+
+class LRUCache(object):
+    """Cache of arrays which evicts the least recently used ones beyond `max_bytes` in total.
+
+    Args:
+        max_bytes (int): the maximum size of cached arrays in bytes
+
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is not None:
+            self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        if key in self.entries:
+            self.nbytes -= self.entries.pop(key).nbytes
+        self.entries[key] = value
+        self.nbytes += value.nbytes
+        while self.nbytes > self.max_bytes and len(self.entries) > 0:
+            self.nbytes -= self.entries.popitem(last=False)[1].nbytes
+
+
+class NgramScorer(object):
+    """Score tokens of the ASR vocabulary with a word-level n-gram language model.
+
+        For character and word-piece units, a word is scored when it is completed, i.e.,
+        at <space> (character), a word-piece starting with "▁" or <eos>, so that only two
+        scores per state (the completed word and <eos>) are computed and cached.
+
+    Args:
+        lm (NgramLM):
+        dict_path (str): path to the dictionary of the ASR model
+        unit (str): word or wp or char
+        eos (int): the index of <eos>
+        max_next_states (int): the maximum number of cached next states
+
+    """
+
+    def __init__(self, lm, dict_path, unit, eos=2, max_next_states=100000):
+        assert unit in ['word', 'wp', 'char']
+        if lm.eos is None:
+            raise ValueError('The n-gram LM does not contain </s>, which is required to score <eos>.')
+        self.lm = lm
+        self.unit = unit
+        self.eos = eos
+
+        token2id = {}
+        with codecs.open(dict_path, 'r', 'utf-8') as f:
+            for line in f:
+                token, idx = line.strip().split(' ')
+                token2id[token] = int(idx)
+        self.vocab = max(list(token2id.values()) + [eos]) + 1
+        self.id2token = {i: t for t, i in token2id.items()}
+
+        if unit == 'word':
+            self.dec2lm = np.full((self.vocab,), lm.unk, dtype=np.int64)
+            for token, i in token2id.items():
+                self.dec2lm[i] = lm.word_id(token)
+        else:
+            self.is_boundary = np.zeros((self.vocab,), dtype=np.bool_)
+            for token, i in token2id.items():
+                if (unit == 'char' and token == '<space>') or (unit == 'wp' and token.startswith(u'▁')):
+                    self.is_boundary[i] = True
+        self.not_boundary = {}  # `{device: ByteTensor}`
+        self.cache = LRUCache(lm.cache.max_bytes)
+
+        # Cache of next states per (state, token)
+        self.max_next_states = max_next_states
+        self.next_cache = OrderedDict()
+
+    def initial_state(self):
+        """A tuple of (state of the n-gram LM, characters of the incomplete word)."""
+        return (self.lm.initial_state(), '')
+
+    def _complete(self, state):
+        """Score the incomplete word of the state."""
+        lm_state, word = state
+        if len(word) == 0:
+            return 0., lm_state
+        return self.lm.score(lm_state, self.lm.word_id(word))
+
+    def scores(self, states):
+        """Log-probabilities of all tokens.
+
+        Args:
+            states (list): A list of length `[B]`, which contains states
+        Returns:
+            scores (np.ndarray): `[B, vocab]`
+
+        """
+        if self.unit == 'word':
+            return np.stack([self._scores(state) for state in states], axis=0)
+        word_eos = np.stack([self._scores(state) for state in states], axis=0)
+        scores = np.where(self.is_boundary[None, :], word_eos[:, :1], 0).astype(np.float32)
+        scores[:, self.eos] = word_eos[:, 1]
+        return scores
+
+    def scores_tensor(self, states, device):
+        """Log-probabilities of all tokens on a device.
+
+            For char and wp units, only the scores of the completed word and <eos> are copied
+            to the device and expanded to the vocabulary there.
+        Args:
+            states (list): A list of length `[B]`, which contains states
+            device (torch.device):
+        Returns:
+            scores (FloatTensor): `[B, vocab]`
+
+        """
+        if self.unit == 'word':
+            scores = torch.from_numpy(self.scores(states))
+            if device.type == 'cuda':
+                # NOTE: copy from page-locked memory without blocking the host
+                scores = scores.pin_memory()
+            return scores.to(device, non_blocking=True)
+
+        word_eos = torch.from_numpy(np.stack([self._scores(state) for state in states], axis=0)).to(device)
+        if device not in self.not_boundary:
+            self.not_boundary[device] = torch.from_numpy(self.is_boundary.astype(np.uint8)).to(device) == 0
+        scores = word_eos[:, :1].repeat(1, self.vocab).masked_fill_(self.not_boundary[device].unsqueeze(0), 0)
+        scores[:, self.eos] = word_eos[:, 1]
+        return scores
+
+    def _scores(self, state):
+        """Scores of all tokens (word) or of the completed word and <eos> (char and wp)."""
+        scores = self.cache.get(state)
+        if scores is not None:
+            return scores
+
+        lm_state, word = state
+        if self.unit == 'word':
+            scores = self.lm.log_probs(lm_state)[self.dec2lm]
+            scores[self.eos] = self.lm.score(lm_state, self.lm.eos)[0]
+        else:
+            logp, lm_state = self._complete(state)
+            scores = np.array([logp, logp + self.lm.score(lm_state, self.lm.eos)[0]], dtype=np.float32)
+
+        self.cache.put(state, scores)
+        return scores
+
+    def next_states(self, states, tokens):
+        """Update states by tokens, computing each pair of a state and a token only once.
+
+        Args:
+            states (list): A list of length `[B]`, which contains states
+            tokens (list): A list of length `[B]`, which contains indices of tokens
+        Returns:
+            states (list): A list of length `[B]`
+
+        """
+        next_states = []
+        for state, token in zip(states, tokens):
+            key = (state, int(token))
+            next_state = self.next_cache.get(key)
+            if next_state is None:
+                next_state = self.next_state(state, int(token))
+                self.next_cache[key] = next_state
+                if len(self.next_cache) > self.max_next_states:
+                    self.next_cache.popitem(last=False)
+            next_states.append(next_state)
+        return next_states
+
+    def next_state(self, state, token):
+        """Update the state by a token.
+
+        Args:
+            state (tuple): A tuple of (state of the n-gram LM, characters of the incomplete word)
+            token (int): the index of the token
+        Returns:
+            state (tuple):
+
+        """
+        if token == self.eos:
+            return state
+        if self.unit == 'word':
+            return (self.lm.next_state(state[0], int(self.dec2lm[token])), '')
+        if not self.is_boundary[token]:
+            return (state[0], state[1] + self.id2token.get(token, ''))
+        lm_state = self._complete(state)[1]
+        if self.unit == 'wp':
+            return (lm_state, self.id2token[token][1:])
+        return (lm_state, '')
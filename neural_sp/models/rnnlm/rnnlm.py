@@ -17,6 +17,7 @@ import torch.nn as nn
 import torch.nn.functional as F
 
 from neural_sp.models.base import ModelBase
+from neural_sp.models.linear import AdaptiveSoftmax
 from neural_sp.models.linear import Embedding
 from neural_sp.models.linear import LinearND
 from neural_sp.models.torch_utils import np2tensor
@@ -95,9 +96,18 @@ class RNNLM(ModelBase):
                 if l != self.nlayers - 1 and args.nprojs > 0:
                     self.proj += [LinearND(args.nunits * self.ndirs, args.nprojs)]
 
-        self.output = LinearND(args.nprojs if args.nprojs > 0 else args.nunits,
-                               self.vocab,
-                               dropout=args.dropout_out)
+        # TODO(hirofumi): remove later
+        if not hasattr(args, 'adaptive_softmax'):
+            args.adaptive_softmax = False
+
+        self.adaptive_softmax = args.adaptive_softmax
+        if args.adaptive_softmax:
+            self.output = AdaptiveSoftmax(args.nprojs if args.nprojs > 0 else args.nunits,
+                                          self.vocab)
+        else:
+            self.output = LinearND(args.nprojs if args.nprojs > 0 else args.nunits,
+                                   self.vocab,
+                                   dropout=args.dropout_out)
 
         # Optionally tie weights as in:
         # "Using the Output Embedding to Improve Language Models" (Press & Wolf 2016)
@@ -106,6 +116,8 @@ class RNNLM(ModelBase):
         # "Tying Word Vectors and Word Classifiers: A Loss Framework for Language Modeling" (Inan et al. 2016)
         # https://arxiv.org/abs/1611.01462
         if args.tie_weights:
+            if args.adaptive_softmax:
+                raise ValueError('The tied flag is not supported with adaptive softmax.')
             if args.nunits != args.emb_dim:
                 raise ValueError('When using the tied flag, nunits must be equal to emb_dim.')
             self.output.fc.weight = self.embed.embed.weight
@@ -203,19 +215,24 @@ class RNNLM(ModelBase):
                     hx_list[l] += xs_lower
                     xs_lower = hx_list[l]
 
-        logits = self.output(hx_list[-1].unsqueeze(1))
+        if self.adaptive_softmax:
+            # Compute XE sequence loss only over the clusters of the references
+            loss, acc = self.output.loss(hx_list[-1].unsqueeze(1), ys_out, ignore_index=self.pad)
+            loss /= torch.sum(ys_out != self.pad).item()
+        else:
+            logits = self.output(hx_list[-1].unsqueeze(1))
 
-        # Compute XE sequence loss
-        loss = F.cross_entropy(logits.view((-1, logits.size(2))),
-                               ys_out.contiguous().view(-1),
-                               ignore_index=self.pad, size_average=True)
+            # Compute XE sequence loss
+            loss = F.cross_entropy(logits.view((-1, logits.size(2))),
+                                   ys_out.contiguous().view(-1),
+                                   ignore_index=self.pad, size_average=True)
 
-        # Compute token-level accuracy in teacher-forcing
-        pad_pred = logits.view(ys_out.size(0), ys_out.size(1), logits.size(-1)).argmax(2)
-        mask = ys_out != self.pad
-        numerator = torch.sum(pad_pred.masked_select(mask) == ys_out.masked_select(mask))
-        denominator = torch.sum(mask)
-        acc = float(numerator) * 100 / float(denominator)
+            # Compute token-level accuracy in teacher-forcing
+            pad_pred = logits.view(ys_out.size(0), ys_out.size(1), logits.size(-1)).argmax(2)
+            mask = ys_out != self.pad
+            numerator = torch.sum(pad_pred.masked_select(mask) == ys_out.masked_select(mask))
+            denominator = torch.sum(mask)
+            acc = float(numerator) * 100 / float(denominator)
 
         observation = {'loss': loss.item(),
                        'acc': acc,
@@ -238,7 +255,7 @@ class RNNLM(ModelBase):
 
         """
         if state[0] is None:
-            hx_list, cx_list = self.initialize_hidden(bs=1)
+            hx_list, cx_list = self.initialize_hidden(bs=y.size(0))
         else:
             hx_list, cx_list = state
 
@@ -326,5 +343,8 @@ class RNNLM(ModelBase):
             self.rnn[l].weight_hh.data = rnnlm.rnn[l].weight_hh_l0.data
             self.rnn[l].bias_ih.data = rnnlm.rnn[l].bias_ih_l0.data
             self.rnn[l].bias_hh.data = rnnlm.rnn[l].bias_hh_l0.data
-        self.output.fc.weight.data = rnnlm.output.fc.weight.data
-        self.output.fc.bias.data = rnnlm.output.fc.bias.data
+        if self.adaptive_softmax:
+            self.output.load_state_dict(rnnlm.output.state_dict())
+        else:
+            self.output.fc.weight.data = rnnlm.output.fc.weight.data
+            self.output.fc.bias.data = rnnlm.output.fc.bias.data
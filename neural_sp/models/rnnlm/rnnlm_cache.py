@@ -0,0 +1,145 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Cache of RNNLM states keyed by token prefixes."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from collections import OrderedDict
+import torch
+
+
+class TrieNode(object):
+    """A node of the prefix trie.
+
+    Args:
+        parent (TrieNode): the parent node (None for the root)
+        token (int): the last token of the prefix
+
+    """
+
+    def __init__(self, parent=None, token=None):
+        self.parent = parent
+        self.token = token
+        self.children = {}
+        self.value = None  # A tuple of (logits, hx_list, cx_list)
+
+
+class RNNLMCache(object):
+    """Cache of RNNLM outputs and states shared across hypotheses and utterances.
+
+        Prefixes are stored in a trie, and the least recently used states are evicted
+        when the number of cached states exceeds `max_size`. Each state holds logits over
+        the vocabulary, so the cache should live only during decoding of a mini-batch.
+
+    Args:
+        rnnlm (RNNLM):
+        max_size (int): the maximum number of cached states
+
+    """
+
+    def __init__(self, rnnlm, max_size=10000):
+        self.rnnlm = rnnlm
+        self.max_size = max_size
+        self.root = TrieNode()
+        self.lru = OrderedDict()  # `{id(node): node}`
+        self.hits = 0
+        self.queries = 0
+
+    def reset(self):
+        self.root = TrieNode()
+        self.lru = OrderedDict()
+        self.hits = 0
+        self.queries = 0
+
+    @property
+    def hit_rate(self):
+        return self.hits / self.queries if self.queries > 0 else 0.
+
+    def predict(self, nodes, ys, state):
+        """Extend prefixes by one token.
+
+            RNNLM is run only for prefixes missing in the cache, as a single mini-batch.
+        Args:
+            nodes (list): A list of length `[B]`, which contains TrieNode of prefixes
+            ys (list): A list of length `[B]`, which contains the next tokens
+            state (tuple): A tuple of (hx_list, cx_list) after reading the prefixes,
+                or (None, None) for empty prefixes
+        Returns:
+            logits (FloatTensor): `[B, 1, vocab]`
+            state (tuple): A tuple of (hx_list, cx_list) after reading the next tokens
+            children (list): A list of length `[B]`, which contains TrieNode of extended prefixes
+
+        """
+        children = []
+        misses = OrderedDict()  # `{id(node): (node, index)}`
+        for i, (node, y) in enumerate(zip(nodes, ys)):
+            child = node.children.get(y)
+            if child is None:
+                child = TrieNode(node, y)
+                node.children[y] = child
+            if child.value is not None:
+                self.hits += 1
+                self.lru.move_to_end(id(child))
+            elif id(child) in misses:
+                # The same prefix appears more than once in the mini-batch
+                self.hits += 1
+            else:
+                misses[id(child)] = (child, i)
+            children.append(child)
+        self.queries += len(nodes)
+
+        # Compute RNNLM states of all cache misses in a single mini-batch
+        if len(misses) > 0:
+            ids = torch.LongTensor([i for _, i in misses.values()])
+            y = torch.LongTensor([ys[i] for _, i in misses.values()]).view(-1, 1)
+            hx_list, cx_list = state
+            if hx_list is not None:
+                ids = ids.to(hx_list[0].device)
+                hx_list = [h.index_select(0, ids) for h in hx_list]
+                if cx_list is not None:
+                    cx_list = [c.index_select(0, ids) for c in cx_list]
+            y_lm_emb = self.rnnlm.embed(y.to(self.device)).squeeze(1)
+            logits, _, (hx_list, cx_list) = self.rnnlm.predict(y_lm_emb, (hx_list, cx_list))
+            # NOTE: copy rows so that cached states do not keep the whole mini-batch alive
+            for j, (child, _) in enumerate(misses.values()):
+                child.value = (logits[j, 0].clone(),
+                               [h[j].clone() for h in hx_list],
+                               [c[j].clone() for c in cx_list] if cx_list is not None else None)
+                self.lru[id(child)] = child
+            self._evict(protected=set(id(c) for c in children))
+
+        logits = torch.stack([c.value[0] for c in children], dim=0).unsqueeze(1)
+        hx_list = [torch.stack([c.value[1][l] for c in children], dim=0)
+                   for l in range(len(children[0].value[1]))]
+        cx_list = None
+        if children[0].value[2] is not None:
+            cx_list = [torch.stack([c.value[2][l] for c in children], dim=0)
+                       for l in range(len(children[0].value[2]))]
+        return logits, (hx_list, cx_list), children
+
+    @property
+    def device(self):
+        return next(self.rnnlm.parameters()).device
+
+    def _evict(self, protected):
+        # Collect the least recently used states except for protected ones
+        keys = []
+        for key in self.lru:
+            if len(self.lru) - len(keys) <= self.max_size:
+                break
+            if key not in protected:
+                keys.append(key)
+        for key in keys:
+            node = self.lru.pop(key)
+            node.value = None
+            # Remove leaves from the trie
+            while node.parent is not None and node.value is None and len(node.children) == 0:
+                if node.parent.children.get(node.token) is node:
+                    del node.parent.children[node.token]
+                node = node.parent
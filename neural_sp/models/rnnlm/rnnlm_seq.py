@@ -18,6 +18,7 @@ import torch.nn as nn
 import torch.nn.functional as F
 
 from neural_sp.models.base import ModelBase
+from neural_sp.models.linear import AdaptiveSoftmax
 from neural_sp.models.linear import Embedding
 from neural_sp.models.linear import LinearND
 from neural_sp.models.torch_utils import np2tensor
@@ -96,9 +97,18 @@ class SeqRNNLM(ModelBase):
                 if l != self.nlayers - 1 and args.nprojs > 0:
                     self.proj += [LinearND(args.nunits * self.ndirs, args.nprojs)]
 
-        self.output = LinearND(args.nprojs if args.nprojs > 0 else args.nunits,
-                               self.vocab,
-                               dropout=args.dropout_out)
+        # TODO(hirofumi): remove later
+        if not hasattr(args, 'adaptive_softmax'):
+            args.adaptive_softmax = False
+
+        self.adaptive_softmax = args.adaptive_softmax
+        if args.adaptive_softmax:
+            self.output = AdaptiveSoftmax(args.nprojs if args.nprojs > 0 else args.nunits,
+                                          self.vocab)
+        else:
+            self.output = LinearND(args.nprojs if args.nprojs > 0 else args.nunits,
+                                   self.vocab,
+                                   dropout=args.dropout_out)
 
         # Optionally tie weights as in:
         # "Using the Output Embedding to Improve Language Models" (Press & Wolf 2016)
@@ -107,6 +117,8 @@ class SeqRNNLM(ModelBase):
         # "Tying Word Vectors and Word Classifiers: A Loss Framework for Language Modeling" (Inan et al. 2016)
         # https://arxiv.org/abs/1611.01462
         if args.tie_weights:
+            if args.adaptive_softmax:
+                raise ValueError('The tied flag is not supported with adaptive softmax.')
             if args.nunits != args.emb_dim:
                 raise ValueError('When using the tied flag, nunits must be equal to emb_dim.')
             self.output.fc.weight = self.embed.embed.weight
@@ -165,41 +177,80 @@ class SeqRNNLM(ModelBase):
         # Path through embedding
         ys_in = self.embed(ys_in)
 
+        # Path through RNN
+        ys_in = self._forward_rnn(ys_in)
+
+        if self.adaptive_softmax:
+            # Compute XE sequence loss only over the clusters of the references
+            loss, acc = self.output.loss(ys_in, ys_out, ignore_index=self.pad)
+            loss /= torch.sum(ys_out != self.pad).item()
+        else:
+            logits = self.output(ys_in)
+
+            # Compute XE sequence loss
+            loss = F.cross_entropy(logits.view((-1, logits.size(2))),
+                                   ys_out.contiguous().view(-1),
+                                   ignore_index=self.pad, size_average=True)
+
+            # Compute token-level accuracy in teacher-forcing
+            pad_pred = logits.view(ys_out.size(0), ys_out.size(1), logits.size(-1)).argmax(2)
+            mask = ys_out != self.pad
+            numerator = torch.sum(pad_pred.masked_select(mask) == ys_out.masked_select(mask))
+            denominator = torch.sum(mask)
+            acc = float(numerator) * 100 / float(denominator)
+
+        observation = {'loss': loss.item(),
+                       'acc': acc,
+                       'ppl': math.exp(loss.item())}
+
+        return loss, observation
+
+    def _forward_rnn(self, ys_emb):
         if self.fast_impl:
-            ys_in, _ = self.rnn(ys_in, hx=None)
-            ys_in = self.dropout_top(ys_in)
+            ys_emb, _ = self.rnn(ys_emb, hx=None)
+            ys_emb = self.dropout_top(ys_emb)
         else:
             xs_lower = None
             for l in range(self.nlayers):
                 # Path through RNN
-                ys_in, _ = self.rnn[l](ys_in, hx=None)
-                ys_in = self.dropout[l](ys_in)
+                ys_emb, _ = self.rnn[l](ys_emb, hx=None)
+                ys_emb = self.dropout[l](ys_emb)
 
                 # Residual connection
                 if self.residual and l > 0:
-                    ys_in += xs_lower
-                    xs_lower = ys_in
+                    ys_emb += xs_lower
+                    xs_lower = ys_emb
                 # NOTE: Exclude residual connection from the raw inputs
+        return ys_emb
 
-        logits = self.output(ys_in)
-
-        # Compute XE sequence loss
-        loss = F.cross_entropy(logits.view((-1, logits.size(2))),
-                               ys_out.contiguous().view(-1),
-                               ignore_index=self.pad, size_average=True)
+    def score(self, ys):
+        """Compute log-likelihoods of token sequences in teacher-forcing mode.
 
-        # Compute token-level accuracy in teacher-forcing
-        pad_pred = logits.view(ys_out.size(0), ys_out.size(1), logits.size(-1)).argmax(2)
-        mask = ys_out != self.pad
-        numerator = torch.sum(pad_pred.masked_select(mask) == ys_out.masked_select(mask))
-        denominator = torch.sum(mask)
-        acc = float(numerator) * 100 / float(denominator)
-
-        observation = {'loss': loss.item(),
-                       'acc': acc,
-                       'ppl': math.exp(loss.item())}
+        Args:
+            ys (list): A list of length `[B]`, which contains arrays of size `[L]` (without <sos> and <eos>)
+        Returns:
+            scores (FloatTensor): `[B]`
 
-        return loss, observation
+        """
+        with torch.no_grad():
+            # Append <sos> and <eos>
+            ys = [np.concatenate([[self.sos], y[::-1] if self.backward else y, [self.eos]]).astype(np.int64)
+                  for y in ys]
+            y_lens = np2tensor(np.fromiter([len(y) - 1 for y in ys], dtype=np.int64), self.device_id)
+            ys = pad_list([np2tensor(y, self.device_id).long() for y in ys], self.pad)
+            ys_in = ys[:, :-1]
+            ys_out = ys[:, 1:]
+
+            outs = self._forward_rnn(self.embed(ys_in))
+            # NOTE: the adaptive softmax layer outputs log-probabilities
+            log_probs = F.log_softmax(self.output(outs), dim=-1)
+            log_probs = log_probs.gather(2, ys_out.unsqueeze(2)).squeeze(2)  # `[B, L]`
+
+            # Mask out padded positions
+            mask = torch.arange(ys_out.size(1), dtype=torch.long, device=ys_out.device).unsqueeze(0) < \
+                y_lens.unsqueeze(1)
+            scores = (log_probs * mask.float()).sum(1)
+        return scores
 
     def predict(self, y, state):
         """Predict a token per step for ASR decoding.
@@ -54,6 +54,7 @@ class AttentionMechanism(nn.Module):
         self.attn_dim = attn_dim
         self.sharpening_factor = sharpening_factor
         self.sigmoid_smoothing = sigmoid_smoothing
+        self.conv_kernel_size = conv_kernel_size
         self.nheads = 1
         self.enc_out_a = None
         self.mask = None
@@ -109,7 +110,7 @@ class AttentionMechanism(nn.Module):
         self.enc_out_a = None
         self.mask = None
 
-    def forward(self, enc_out, x_lens, dec_out, aw_step):
+    def forward(self, enc_out, x_lens, dec_out, aw_step, window=0):
         """Forward computation.
 
         Args:
@@ -117,6 +118,9 @@ class AttentionMechanism(nn.Module):
             x_lens (list): A list of length `[B]`
             dec_out (FloatTensor): `[B, 1, dec_units]`
             aw_step (FloatTensor): `[B, T]`
+            window (int): if larger than 0, restrict scoring to encoder frames
+                within `window` frames around the peak of the previous attention
+                weights of each utterance (inference only). The first step always attends to all frames.
         Returns:
             context (FloatTensor): `[B, 1, enc_units]`
             aw_step (FloatTensor): `[B, T]`
@@ -124,9 +128,6 @@ class AttentionMechanism(nn.Module):
         """
         bs, enc_time = enc_out.size()[:2]
 
-        if aw_step is None:
-            aw_step = enc_out.new_zeros(bs, enc_time)
-
         # Pre-computation of encoder-side features for computing scores
         if self.enc_out_a is None:
             if self.attn_type in ['add', 'location', 'dot', 'luong_general']:
@@ -139,43 +140,93 @@ class AttentionMechanism(nn.Module):
                 if x_lens[b] < enc_time:
                     self.mask[b, x_lens[b]:] = 0
 
+        if aw_step is None:
+            aw_step = enc_out.new_zeros(bs, enc_time)
+            window = 0
+
+        if window > 0 and 2 * window + 1 < enc_time:
+            # Gather frames around the peak of each utterance (or hypothesis)
+            # NOTE: the size of windows is fixed, so that no host synchronization is required
+            peaks = aw_step.argmax(-1)  # `[B]`
+            ids, valid = window_indices(peaks, window, enc_time)  # `[B, W]`
+            enc_out_w = enc_out.gather(1, ids.unsqueeze(2).expand(-1, -1, enc_out.size(2)))
+            if self.enc_out_a is not None:
+                enc_out_a_w = self.enc_out_a.gather(1, ids.unsqueeze(2).expand(-1, -1, self.enc_out_a.size(2)))
+            mask = self.mask.gather(1, ids) * valid
+        else:
+            window = 0
+            enc_out_w, enc_out_a_w, mask = enc_out, self.enc_out_a, self.mask
+        win_time = enc_out_w.size(1)
+
         if self.attn_type == 'add':
-            dec_out = dec_out.expand_as(torch.zeros((bs, enc_time, dec_out.size(2))))
-            energy = self.v(F.tanh(self.enc_out_a + self.w_dec(dec_out))).squeeze(2)
+            dec_out = dec_out.expand(bs, win_time, dec_out.size(2))
+            energy = self.v(F.tanh(enc_out_a_w + self.w_dec(dec_out))).squeeze(2)
 
         elif self.attn_type == 'location':
-            dec_out = dec_out.expand_as(torch.zeros((bs, enc_time, dec_out.size(2))))
-            # For 1D conv
-            # conv_feat = self.conv(aw_step[:, :].contiguous().unsqueeze(1))
+            dec_out = dec_out.expand(bs, win_time, dec_out.size(2))
             # For 2D conv
-            conv_feat = self.conv(aw_step.view(bs, 1, 1, enc_time)).squeeze(2)  # `[B, conv_out_channels, T]`
+            if window > 0:
+                # NOTE: convolve weights around the window as well so that the
+                # features inside the window are identical to the full computation
+                ids_conv, valid_conv = window_indices(peaks, window, enc_time, margin=self.conv_kernel_size)
+                conv_feat = self.conv((aw_step.gather(1, ids_conv) * valid_conv).view(bs, 1, 1, -1)).squeeze(2)
+                conv_feat = conv_feat[:, :, self.conv_kernel_size:self.conv_kernel_size + win_time]
+            else:
+                conv_feat = self.conv(aw_step.view(bs, 1, 1, enc_time)).squeeze(2)  # `[B, conv_out_channels, T]`
             conv_feat = conv_feat.transpose(1, 2).contiguous()  # `[B, T, conv_out_channels]`
-            energy = self.v(F.tanh(self.enc_out_a + self.w_dec(dec_out) + self.w_conv(conv_feat))).squeeze(2)
+            energy = self.v(F.tanh(enc_out_a_w + self.w_dec(dec_out) + self.w_conv(conv_feat))).squeeze(2)
 
         elif self.attn_type == 'dot':
-            energy = torch.matmul(self.enc_out_a, self.w_dec(dec_out).transpose(-2, -1)).squeeze(2)
+            energy = torch.matmul(enc_out_a_w, self.w_dec(dec_out).transpose(-2, -1)).squeeze(2)
 
         elif self.attn_type == 'luong_dot':
-            energy = torch.matmul(enc_out, dec_out.transpose(-2, -1)).squeeze(2)
+            energy = torch.matmul(enc_out_w, dec_out.transpose(-2, -1)).squeeze(2)
 
         elif self.attn_type == 'luong_general':
-            energy = torch.matmul(self.enc_out_a, dec_out.transpose(-2, -1)).squeeze(2)
+            energy = torch.matmul(enc_out_a_w, dec_out.transpose(-2, -1)).squeeze(2)
 
         elif self.attn_type == 'luong_concat':
-            dec_out = dec_out.expand_as(torch.zeros((bs, enc_time, dec_out.size(2))))
-            energy = self.v(F.tanh(self.w(torch.cat([enc_out, dec_out], dim=-1)))).squeeze(2)
+            dec_out = dec_out.expand(bs, win_time, dec_out.size(2))
+            energy = self.v(F.tanh(self.w(torch.cat([enc_out_w, dec_out], dim=-1)))).squeeze(2)
 
         # Compute attention weights
-        energy = energy.masked_fill_(self.mask == 0, -float('inf'))  # `[B, T]`
+        energy = energy.masked_fill_(mask == 0, -float('inf'))  # `[B, T]`
         if self.sigmoid_smoothing:
-            aw_step = F.sigmoid(energy) / F.sigmoid(energy).sum(-1).unsqueeze(-1)
+            aw_w = F.sigmoid(energy) / F.sigmoid(energy).sum(-1).unsqueeze(-1)
         else:
-            aw_step = F.softmax(energy * self.sharpening_factor, dim=-1)  # `[B, T]`
+            aw_w = F.softmax(energy * self.sharpening_factor, dim=-1)  # `[B, T]`
         # attention dropout
         if self.dropout is not None:
-            aw_step = self.dropout(aw_step)
+            aw_w = self.dropout(aw_w)
 
         # Compute context vector (weighted sum of encoder outputs)
-        context = torch.matmul(aw_step.unsqueeze(1), enc_out)
+        context = torch.matmul(aw_w.unsqueeze(1), enc_out_w)
+
+        if window > 0:
+            # NOTE: weights of frames outside the encoder outputs are 0
+            aw_step = enc_out.new_zeros(bs, enc_time).scatter_add_(1, ids, aw_w)
+        else:
+            aw_step = aw_w
 
         return context, aw_step
+
+
+def window_indices(peaks, window, enc_time, margin=0):
+    """Indices of encoder frames within a window around each peak.
+
+    Args:
+        peaks (LongTensor): `[B]`
+        window (int): frames within this number of frames around each peak are included
+        enc_time (int): the number of encoder frames
+        margin (int): extend windows by this number of frames on both sides
+    Returns:
+        ids (LongTensor): indices clamped to encoder frames `[B, 2 * (window + margin) + 1]`
+        valid (FloatTensor): 1 for indices inside encoder frames before clamping
+            `[B, 2 * (window + margin) + 1]`
+
+    """
+    width = window + margin
+    offsets = torch.arange(-width, width + 1, dtype=torch.long, device=peaks.device)
+    ids = peaks.unsqueeze(1) + offsets.unsqueeze(0)
+    valid = (ids >= 0) & (ids < enc_time)
+    return ids.clamp(0, enc_time - 1), valid.float()
@@ -10,6 +10,7 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import math
 import numpy as np
 import torch
 import torch.nn.functional as F
@@ -23,135 +24,204 @@ LOG_1 = 0
 class BeamSearchDecoder(object):
     """Beam search decoder.
 
-    Arga:
+    Args:
         blank_index (int): the index of the blank label
+        sos_index (int): the index of <sos>, which is fed to the RNNLM at the first step
 
     """
 
-    def __init__(self, blank_index):
+    def __init__(self, blank_index, sos_index=2):
         self.blank = blank_index
+        self.sos = sos_index
 
     def __call__(self, log_probs, x_lens, beam_width=1,
-                 rnnlm=None, rnnlm_weight=0., length_penalty=0., space_index=5):
+                 rnnlm=None, rnnlm_weight=0., length_penalty=0.,
+                 ngram=None, ngram_weight=0.):
         """Performs inference for the given output probabilities.
 
+            Identical prefixes reached through different alignments are merged
+            in a hash map keyed by the label sequence. Candidate labels are
+            limited to the top-`beam_width` labels of each frame.
+
         Args:
-            log_probs (torch.autograd.Variable): The output log-scale probabilities
+            log_probs (FloatTensor): The output log-scale probabilities
                 (e.g. post-softmax) for each time step. `[B, T, vocab]`
             x_lens (list): A list of length `[B]`
             beam_width (int): the size of beam
-            rnnlm ():
+            rnnlm (RNNLM): RNNLM for shallow fusion
             rnnlm_weight (float): language model weight
             length_penalty (float): insertion bonus
-            space_index (int, optional): the index of the space label This is used for character-level CTC.
+            ngram (NgramScorer): n-gram LM for shallow fusion
+            ngram_weight (float): the weight of n-gram LM score
         Returns:
-            best_hyps (list): Best path hypothesis. `[B, labels_max_seq_len]`
-            best_hyps_lens (list): Lengths of best path hypothesis. `[B]`
+            best_hyps (list): Best path hypothesis. A list of length `[B]`,
+                which contains arrays of size `[L]`
 
         """
-        assert isinstance(log_probs, torch.autograd.Variable)
-        batch_size, _, vocab = log_probs.size()
+        bs, _, vocab = log_probs.size()
+        use_lm = rnnlm is not None and rnnlm_weight > 0
+        use_ngram = ngram is not None and ngram_weight > 0
+
+        # Copy posteriors and the pruned vocabulary of each frame to the host once
+        log_probs_np = tensor2np(log_probs)
+        k = min(beam_width, vocab)
+        ids_topk = np.argpartition(-log_probs_np, k - 1, axis=-1)[:, :, :k]
+
+        # Each beam is a dict of {prefix: (p_blank, p_nonblank, weighted LM scores)}
+        # Initialize the beam with the empty sequence, a probability of
+        # 1 for ending in blank and zero for ending in non-blank (in log space).
+        beams = [{(): (LOG_1, LOG_0, 0.)} for _ in range(bs)]
+
+        # RNNLM cache of {prefix: (lm_log_probs, state)} per utterance
+        lm_cache = [{} for _ in range(bs)]
+        if use_lm:
+            self._update_lm_cache(rnnlm, lm_cache, [(b, ()) for b in range(bs)], log_probs)
+
+        # n-gram LM states of {prefix: state} per utterance
+        ngram_states = [{(): ngram.initial_state()} if use_ngram else {} for _ in range(bs)]
+
+        for t in range(max(x_lens)):
+            misses = []
+            for b in range(bs):
+                if t >= x_lens[b]:
+                    continue
+                lp_t = log_probs_np[b, t]
+                cands = ids_topk[b, t]
+                cands = cands[cands != self.blank]
+                lp_cands = lp_t[cands]
+
+                prefixes = list(beams[b].keys())
+                p_b = np.array([beams[b][prefix][0] for prefix in prefixes])
+                p_nb = np.array([beams[b][prefix][1] for prefix in prefixes])
+                lm_scores = np.array([beams[b][prefix][2] for prefix in prefixes])
+                lasts = np.array([prefix[-1] if len(prefix) > 0 else -1 for prefix in prefixes])
+                p_tot = np.logaddexp(p_b, p_nb)
+
+                new_beam = {}
+                for i, prefix in enumerate(prefixes):
+                    # If we propose a blank the prefix doesn't change.
+                    # Only the probability of ending in blank gets updated.
+                    p_nb_i = LOG_0
+                    # A repeated label not separated by a blank is collapsed,
+                    # so the prefix doesn't change either.
+                    if lasts[i] >= 0:
+                        p_nb_i = p_nb[i] + lp_t[lasts[i]]
+                    new_beam[prefix] = (p_tot[i] + lp_t[self.blank], p_nb_i, lm_scores[i])
+
+                if len(cands) > 0:
+                    # Extend all prefixes by all candidates at once. We don't include
+                    # the probability of not ending in blank if the label is repeated.
+                    p_ext = np.where(cands[None, :] == lasts[:, None],
+                                     p_b[:, None], p_tot[:, None]) + lp_cands[None, :]  # `[P, K]`
+                    lm_ext = np.repeat(lm_scores[:, None], len(cands), axis=1)
+                    if use_lm:
+                        lm_ext += np.stack([lm_cache[b][prefix][0][cands] for prefix in prefixes],
+                                           axis=0) * rnnlm_weight
+                    if use_ngram:
+                        lm_ext += ngram.scores([ngram_states[b][prefix] for prefix in prefixes])[:, cands] * ngram_weight
+                    scores_ext = p_ext + lm_ext + \
+                        (np.array([len(prefix) for prefix in prefixes])[:, None] + 1) * length_penalty
+
+                    # Extensions already in the beam are merged with the unchanged prefixes
+                    ids_cand = {c: j for j, c in enumerate(cands.tolist())}
+                    ids_prefix = {prefix: i for i, prefix in enumerate(prefixes)}
+                    for prefix in prefixes:
+                        if len(prefix) == 0 or prefix[:-1] not in ids_prefix or prefix[-1] not in ids_cand:
+                            continue
+                        i, j = ids_prefix[prefix[:-1]], ids_cand[prefix[-1]]
+                        _merge(new_beam, prefix, LOG_0, p_ext[i, j], lm_ext[i, j])
+                        scores_ext[i, j] = LOG_0
+
+                    # Scores of the other extensions are final, so only the top ones can survive
+                    n_ext = min(beam_width, scores_ext.size)
+                    ids_ext = np.argpartition(-scores_ext.reshape(-1), n_ext - 1)[:n_ext]
+                    for i, j in zip(*np.unravel_index(ids_ext, scores_ext.shape)):
+                        if scores_ext[i, j] == LOG_0:
+                            continue
+                        new_beam[prefixes[i] + (int(cands[j]),)] = (LOG_0, p_ext[i, j], lm_ext[i, j])
+                        if use_ngram:
+                            ngram_states[b][prefixes[i] + (int(cands[j]),)] = ngram.next_state(
+                                ngram_states[b][prefixes[i]], int(cands[j]))
+
+                # Sort and trim the beam before moving on to the next time-step.
+                beam = sorted(new_beam.items(),
+                              key=lambda x: _logaddexp(x[1][0], x[1][1]) + x[1][2] + len(x[0]) * length_penalty,
+                              reverse=True)
+                beams[b] = dict(beam[:beam_width])
+                if use_ngram:
+                    ngram_states[b] = {prefix: ngram_states[b][prefix] for prefix in beams[b]}
+
+                if use_lm:
+                    misses += [(b, prefix) for prefix in beams[b] if prefix not in lm_cache[b]]
+
+            if use_lm:
+                # Compute RNNLM states of new prefixes in a single mini-batch
+                if len(misses) > 0:
+                    self._update_lm_cache(rnnlm, lm_cache, misses, log_probs)
+                # Keep only prefixes alive in the beam
+                for b in range(bs):
+                    lm_cache[b] = {prefix: lm_cache[b][prefix] for prefix in beams[b]}
+
         best_hyps = []
+        for b in range(bs):
+            if use_ngram:
+                # Score the last word and the end of the sentence
+                beams[b] = {prefix: (p_b, p_nb, lm_score + ngram.scores([ngram_states[b][prefix]])[0, ngram.eos] *
+                                     ngram_weight)
+                            for prefix, (p_b, p_nb, lm_score) in beams[b].items()}
+            best_hyp = max(beams[b].items(),
+                           key=lambda x: _logaddexp(x[1][0], x[1][1]) + x[1][2] + len(x[0]) * length_penalty)[0]
+            best_hyps.append(np.array(best_hyp, dtype=np.int64))
 
-        for b in range(batch_size):
-            # Elements in the beam are (prefix, (p_blank, p_no_blank))
-            # Initialize the beam with the empty sequence, a probability of
-            # 1 for ending in blank and zero for ending in non-blank
-            # (in log space).
-            beam = [{'hyp': [],
-                     'p_blank': LOG_1,
-                     'p_nonblank': LOG_1,
-                     'rnnlm_score': LOG_1,
-                     'rnnlm_state': None}]
-
-            for t in range(x_lens[b]):
-                new_beam = []
-
-                # Pick up the top-k scores
-                log_probs_topk, indices_topk = torch.topk(
-                    log_probs[:, t, :], k=beam_width, dim=-1, largest=True, sorted=True)
-
-                for c in tensor2np(indices_topk)[b]:
-                    p_t = log_probs[b, t, c].item()
-
-                    # The variables p_blank and p_nonblank are respectively the
-                    # probabilities for the prefix given that it ends in a
-                    # blank and does not end in a blank at this time step.
-                    for i_beam in range(len(beam)):
-                        prefix = beam[i_beam]['hyp']
-                        p_blank = beam[i_beam]['p_blank']
-                        p_nonblank = beam[i_beam]['p_nonblank']
-                        rnnlm_score = beam[i_beam]['rnnlm_score']
-                        rnnlm_state = beam[i_beam]['rnnlm_state']
-
-                        # If we propose a blank the prefix doesn't change.
-                        # Only the probability of ending in blank gets updated.
-                        if c == self.blank:
-                            new_p_blank = np.logaddexp(
-                                p_blank + p_t, p_nonblank + p_t)
-                            new_beam.append({'hyp': beam[i_beam]['hyp'],
-                                             'p_blank': new_p_blank,
-                                             'p_nonblank': LOG_0,
-                                             'rnnlm_score': rnnlm_score,
-                                             'rnnlm_state': rnnlm_state})
-                            continue
+        return best_hyps
 
-                        # Extend the prefix by the new character c and it to the
-                        # beam. Only the probability of not ending in blank gets
-                        # updated.
-                        prefix_end = prefix[-1] if len(prefix) > 0 else None
-                        new_p_blank = LOG_0
-                        new_p_nonblank = LOG_0
-                        if c != prefix_end:
-                            new_p_nonblank = np.logaddexp(
-                                p_blank + p_t, p_nonblank + p_t)
-                        else:
-                            # We don't include the previous probability of not ending
-                            # in blank (p_nonblank) if c is repeated at the end. The CTC
-                            # algorithm merges characters not separated by a
-                            # blank.
-                            new_p_nonblank = p_blank + p_t
-
-                        # Update RNNLM states
-                        if rnnlm_weight > 0 and rnnlm is not None:
-                            y_rnnlm = Variable(log_probs.new(1, 1).fill_(c).long(), volatile=True)
-                            y_rnnlm = rnnlm.embed(y_rnnlm)
-                            logits_step_rnnlm, rnnlm_out, rnnlm_state = rnnlm.predict(
-                                y_rnnlm, h=rnnlm_state)
-
-                        # # Add RNNLM score
-                        if rnnlm_weight > 0 and rnnlm is not None:
-                            rnnlm_log_probs = F.log_softmax(
-                                logits_step_rnnlm.squeeze(1), dim=1)
-                            assert log_probs[:, t, :].size(
-                            ) == rnnlm_log_probs.size()
-                            rnnlm_score = rnnlm_log_probs.data[0, c]
-
-                        new_beam.append({'hyp': beam[i_beam]['hyp'] + [c],
-                                         'p_blank': new_p_blank,
-                                         'p_nonblank': new_p_nonblank,
-                                         'rnnlm_score': rnnlm_score,
-                                         'rnnlm_state': rnnlm_state})
-
-                        # If c is repeated at the end we also update the unchanged
-                        # prefix. This is the merging case.
-                        if c == prefix_end:
-                            new_p_nonblank = p_nonblank + p_t
-                            new_beam.append({'hyp': beam[i_beam]['hyp'],
-                                             'p_blank': new_p_blank,
-                                             'p_nonblank': new_p_nonblank,
-                                             'rnnlm_score': rnnlm_score,
-                                             'rnnlm_state': rnnlm_state})
-
-                # Sort and trim the beam before moving on to the
-                # next time-step.
-                beam = sorted(new_beam,
-                              key=lambda x: np.logaddexp(
-                                  x['p_blank'], x['p_nonblank']) + x['rnnlm_score'] * rnnlm_weight,
-                              reverse=True)
-                beam = beam[:beam_width]
+    def _update_lm_cache(self, rnnlm, lm_cache, misses, log_probs):
+        """Run RNNLM for prefixes missing in the cache.
 
-            best_hyp = beam[0]['hyp']
-            best_hyps.append(np.array(best_hyp))
+            States of the parent prefixes (without the last label) must be cached.
 
-        return np.array(best_hyps)
+        Args:
+            rnnlm (RNNLM):
+            lm_cache (list): A list of length `[B]`, which contains dicts of
+                {prefix: (lm_log_probs, state)}
+            misses (list): A list of tuples of (utterance index, prefix)
+            log_probs (FloatTensor): used to allocate tensors on the same device
+
+        """
+        ys = [prefix[-1] if len(prefix) > 0 else self.sos for _, prefix in misses]
+        y = log_probs.new_tensor(ys).long().view(-1, 1)
+        if len(misses[0][1]) == 0:
+            state = (None, None)
+        else:
+            parents = [lm_cache[b][prefix[:-1]][1] for b, prefix in misses]
+            hx_list = [torch.cat([s[0][l] for s in parents], dim=0) for l in range(len(parents[0][0]))]
+            cx_list = None
+            if parents[0][1] is not None:
+                cx_list = [torch.cat([s[1][l] for s in parents], dim=0) for l in range(len(parents[0][1]))]
+            state = (hx_list, cx_list)
+
+        y_lm_emb = rnnlm.embed(y).squeeze(1)
+        logits_lm, _, (hx_list, cx_list) = rnnlm.predict(y_lm_emb, state)
+        lm_log_probs = tensor2np(F.log_softmax(logits_lm.squeeze(1), dim=-1))
+
+        for i, (b, prefix) in enumerate(misses):
+            hx_i = [h[i:i + 1] for h in hx_list]
+            cx_i = [c[i:i + 1] for c in cx_list] if cx_list is not None else None
+            lm_cache[b][prefix] = (lm_log_probs[i], (hx_i, cx_i))
+
+
+def _logaddexp(x, y):
+    if x == LOG_0:
+        return y
+    if y == LOG_0:
+        return x
+    return max(x, y) + math.log1p(math.exp(-abs(x - y)))
+
+
+def _merge(beam, prefix, p_b, p_nb, lm_score):
+    """Add probabilities to the prefix, merging paths ending with the same prefix."""
+    if prefix in beam:
+        p_b_prev, p_nb_prev, _ = beam[prefix]
+        beam[prefix] = (_logaddexp(p_b_prev, p_b), _logaddexp(p_nb_prev, p_nb), lm_score)
+    else:
+        beam[prefix] = (p_b, p_nb, lm_score)
@@ -0,0 +1,110 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""CTC prefix score for joint CTC/attention decoding in pytorch implementation."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import torch
+
+LOG_0 = -1e10
+
+
+class CTCPrefixScore(object):
+    """Compute CTC prefix scores of candidate tokens for all hypotheses in parallel.
+
+        See "Hybrid CTC/Attention Architecture for End-to-End Speech Recognition" (Watanabe et al., 2017).
+
+    Args:
+        log_probs (FloatTensor): CTC log-probabilities `[B, T, vocab]`
+        elens (list): A list of length `[B]`
+        blank (int): the index of the blank label
+        eos (int): the index of <eos>
+        beam_width (int): the number of hypotheses per utterance
+
+    """
+
+    def __init__(self, log_probs, elens, blank, eos, beam_width):
+        self.blank = blank
+        self.eos = eos
+        bs, self.time, self.vocab = log_probs.size()
+
+        # Padded frames emit blank with the probability of 1
+        x = log_probs.clone()
+        for b in range(bs):
+            if elens[b] < self.time:
+                x[b, elens[b]:] = LOG_0
+                x[b, elens[b]:, blank] = 0
+        self.x = x.transpose(0, 1).contiguous().view(self.time, -1)  # `[T, B * vocab]`
+
+        # Offsets of utterances for each hypothesis
+        self.offset = torch.arange(bs * beam_width, dtype=torch.long,
+                                   device=log_probs.device) // beam_width * self.vocab  # `[B * beam_width]`
+        self.x_blank = self.x.index_select(1, self.offset + blank)  # `[T, B * beam_width]`
+
+    def initial_state(self):
+        """Initial states for the empty prefix.
+
+        Returns:
+            r (FloatTensor): forward probabilities ending with non-blank and blank `[T, 2, B * beam_width]`
+            log_psi (FloatTensor): prefix scores `[B * beam_width]`
+
+        """
+        r = self.x_blank.new_full((self.time, 2, self.x_blank.size(1)), LOG_0)
+        r[:, 1] = torch.cumsum(self.x_blank, dim=0)
+        log_psi = self.x_blank.new_zeros(self.x_blank.size(1))
+        return r, log_psi
+
+    def __call__(self, ylen, y_prev, cands, state):
+        """Compute prefix scores of candidates.
+
+        Args:
+            ylen (int): the length of prefixes (excluding <sos>)
+            y_prev (LongTensor): the last tokens of prefixes `[B * beam_width]`
+            cands (LongTensor): candidate tokens `[B * beam_width, n_cands]`
+            state (tuple): A tuple of (r, log_psi) of prefixes
+        Returns:
+            scores (FloatTensor): increments of prefix scores `[B * beam_width, n_cands]`
+            r_new (FloatTensor): `[T, 2, B * beam_width, n_cands]`
+            log_psi (FloatTensor): prefix scores of extended prefixes `[B * beam_width, n_cands]`
+
+        """
+        r_prev, log_psi_prev = state
+        n_hyps, n_cands = cands.size()
+
+        # Gather log-probabilities of candidates `[T, B * beam_width, n_cands]`
+        x = self.x.index_select(1, (cands + self.offset.unsqueeze(1)).view(-1)).view(self.time, n_hyps, n_cands)
+
+        r_new = x.new_full((self.time, 2, n_hyps, n_cands), LOG_0)
+        if ylen == 0:
+            r_new[0, 0] = x[0]
+
+        # Do not add the probability ending with non-blank if the candidate is repeated
+        r_sum = torch.logsumexp(r_prev, dim=1)  # `[T, B * beam_width]`
+        log_phi = r_sum.unsqueeze(2).expand(self.time, n_hyps, n_cands)
+        is_repeated = (cands == y_prev.unsqueeze(1)).unsqueeze(0).expand_as(log_phi)
+        log_phi = torch.where(is_repeated, r_prev[:, 1].unsqueeze(2).expand_as(log_phi), log_phi)
+
+        # Forward computation over time
+        start = max(ylen, 1)
+        for t in range(start, self.time):
+            r_new[t, 0] = torch.logsumexp(torch.stack([r_new[t - 1, 0], log_phi[t - 1]], dim=0), dim=0) + x[t]
+            r_new[t, 1] = torch.logsumexp(r_new[t - 1], dim=0) + self.x_blank[t].unsqueeze(1)
+
+        # Prefix probabilities accumulated over all frames
+        log_psi = torch.logsumexp(torch.cat([r_new[start - 1, 0].unsqueeze(0),
+                                             log_phi[start - 1:-1] + x[start:]], dim=0), dim=0)
+
+        # <eos> is scored by the probability of the whole prefix
+        log_psi = torch.where(cands == self.eos, r_sum[-1].unsqueeze(1).expand_as(log_psi), log_psi)
+        log_psi = log_psi.masked_fill(cands == self.blank, LOG_0)
+
+        # Prefixes which cannot be emitted within the input length are excluded
+        scores = (log_psi - log_psi_prev.unsqueeze(1)).masked_fill(log_psi <= LOG_0 / 2, -float('inf'))
+
+        return scores, r_new, log_psi
@@ -21,16 +21,19 @@ import torch.nn.functional as F
 try:
     import warpctc_pytorch
 except:
-    raise ImportError('Install warpctc_pytorch.')
+    warpctc_pytorch = None
 
 from neural_sp.models.criterion import cross_entropy_lsm
 from neural_sp.models.criterion import focal_loss
 from neural_sp.models.criterion import kldiv_lsm_ctc
+from neural_sp.models.linear import AdaptiveSoftmax
 from neural_sp.models.linear import Embedding
 from neural_sp.models.linear import LinearND
+from neural_sp.models.rnnlm.rnnlm_cache import RNNLMCache
 from neural_sp.models.seq2seq.decoders.attention import AttentionMechanism
 from neural_sp.models.seq2seq.decoders.ctc_beam_search_decoder import BeamSearchDecoder
 from neural_sp.models.seq2seq.decoders.ctc_greedy_decoder import GreedyDecoder
+from neural_sp.models.seq2seq.decoders.ctc_prefix_score import CTCPrefixScore
 from neural_sp.models.seq2seq.decoders.multihead_attention import MultiheadAttentionMechanism
 from neural_sp.models.torch_utils import np2tensor
 from neural_sp.models.torch_utils import pad_list
@@ -38,6 +41,12 @@ from neural_sp.models.torch_utils import tensor2np
 
 random.seed(1)
 
+# The number of candidates scored by CTC per hypothesis, relative to the beam width
+CTC_SCORING_RATIO = 1.5
+
+# The interval of steps to check if all utterances are finished in greedy decoding
+GREEDY_CHECK_INTERVAL = 8
+
 logger = logging.getLogger("decoding")
 
 
@@ -74,6 +83,7 @@ class Decoder(nn.Module):
         init_with_enc (bool):
         ctc_weight (float):
         ctc_fc_list (list):
+        ctc_backend (str): native or warpctc
         input_feeding (bool):
         backward (bool): decode in the backward order
         rnnlm_cold_fusion (torch.nn.Module):
@@ -84,6 +94,7 @@ class Decoder(nn.Module):
         rnnlm_init ():
         lmobj_weight (float):
         share_lm_softmax (bool):
+        adaptive_softmax (bool): use the adaptive softmax output layer
 
     """
 
@@ -118,6 +129,7 @@ class Decoder(nn.Module):
                  init_with_enc=False,
                  ctc_weight=0.,
                  ctc_fc_list=[],
+                 ctc_backend='native',
                  input_feeding=False,
                  backward=False,
                  rnnlm_cold_fusion=False,
@@ -128,7 +140,8 @@ class Decoder(nn.Module):
                  share_lm_softmax=False,
                  global_weight=1.0,
                  mtl_per_batch=False,
-                 vocab_char=None):
+                 vocab_char=None,
+                 adaptive_softmax=False):
 
         super(Decoder, self).__init__()
 
@@ -161,6 +174,7 @@ class Decoder(nn.Module):
         self.share_lm_softmax = share_lm_softmax
         self.global_weight = global_weight
         self.mtl_per_batch = mtl_per_batch
+        self.adaptive_softmax = adaptive_softmax
 
         if ctc_weight > 0 and not backward:
             # Fully-connected layers for CTC
@@ -174,8 +188,23 @@ class Decoder(nn.Module):
             else:
                 self.output_ctc = LinearND(enc_nunits, vocab)
             self.decode_ctc_greedy = GreedyDecoder(blank_index=0)
-            self.decode_ctc_beam = BeamSearchDecoder(blank_index=0)
-            self.warpctc_loss = warpctc_pytorch.CTCLoss(size_average=True)
+            self.decode_ctc_beam = BeamSearchDecoder(blank_index=0, sos_index=sos)
+
+            # CTC loss
+            if ctc_backend == 'native' and not hasattr(F, 'ctc_loss'):
+                logger.warning('torch.nn.functional.ctc_loss is not available, use warpctc_pytorch instead.')
+                ctc_backend = 'warpctc'
+            if ctc_backend == 'warpctc' and warpctc_pytorch is None:
+                if not hasattr(F, 'ctc_loss'):
+                    raise ImportError('Install warpctc_pytorch.')
+                # NOTE: configs saved before the native backend was added use warpctc_pytorch
+                logger.warning('warpctc_pytorch is not installed, use torch.nn.functional.ctc_loss instead.')
+                ctc_backend = 'native'
+            if ctc_backend == 'warpctc':
+                self.warpctc_loss = warpctc_pytorch.CTCLoss(size_average=True)
+            elif ctc_backend != 'native':
+                raise ValueError(ctc_backend)
+        self.ctc_backend = ctc_backend
 
         if ctc_weight < global_weight:
             # Attention layer
@@ -224,7 +253,11 @@ class Decoder(nn.Module):
                 rnn_cell = nn.GRUCell
             if internal_lm:
                 assert nlayers >= 2
-                self.rnn_inlm = rnn_cell(emb_dim, nunits)
+                # NOTE: the internal LM can run over the whole sequence at once
+                if rnn_type == 'lstm':
+                    self.rnn_inlm = nn.LSTM(emb_dim, nunits, 1, batch_first=True)
+                elif rnn_type == 'gru':
+                    self.rnn_inlm = nn.GRU(emb_dim, nunits, 1, batch_first=True)
                 self.dropout_inlm = nn.Dropout(p=dropout)
                 self.rnn += [rnn_cell(nunits + enc_nunits, nunits)]
             else:
@@ -252,7 +285,10 @@ class Decoder(nn.Module):
             else:
                 self.output_bn = LinearND(nunits + enc_nunits, nunits)
 
-            self.output = LinearND(nunits, vocab)
+            if adaptive_softmax:
+                self.output = AdaptiveSoftmax(nunits, vocab)
+            else:
+                self.output = LinearND(nunits, vocab)
 
             # Embedding
             self.embed = Embedding(vocab=vocab,
@@ -267,6 +303,8 @@ class Decoder(nn.Module):
             # "Tying Word Vectors and Word Classifiers: A Loss Framework for Language Modeling" (Inan et al. 2016)
             # https://arxiv.org/abs/1611.01462
             if tie_embedding:
+                if adaptive_softmax:
+                    raise ValueError('The tied flag is not supported with adaptive softmax.')
                 if nunits != emb_dim:
                     raise ValueError('When using the tied flag, nunits must be equal to emb_dim.')
                 self.output.fc.weight = self.embed.embed.weight
@@ -288,7 +326,7 @@ class Decoder(nn.Module):
                        'loss_att': 0, 'loss_ctc': 0, 'loss_lmobj': 0,
                        'acc_att': 0, 'acc_lmobj': 0,
                        'ppl_att': 0, 'ppl_lmobj': 0}
-        loss = torch.zeros((1,), dtype=torch.float32).cuda()
+        loss = eouts.new_zeros((1,))
 
         # CTC loss
         if self.ctc_weight > 0 and (not self.mtl_per_batch or (self.mtl_per_batch and 'ctc' in task)):
@@ -336,24 +374,36 @@ class Decoder(nn.Module):
             loss (FloatTensor): `[B, L, vocab]`
 
         """
-        logits = self.output_ctc(eouts).transpose(0, 1).cpu()  # time-major
+        logits = self.output_ctc(eouts)
 
         # Compute the auxiliary CTC loss
         assert not self.backward
-        enc_lens_ctc = np2tensor(np.fromiter(elens, dtype=np.int32), -1).int()
-        ys_ctc = [np2tensor(np.fromiter(y, dtype=np.int64)).long() for y in ys]  # always fwd
-        y_lens = np2tensor(np.fromiter([y.size(0) for y in ys_ctc], dtype=np.int32), -1).int()
-        ys_ctc = torch.cat(ys_ctc, dim=0).int()
-        # NOTE: Concatenate all elements in ys for warpctc_pytorch
-        # NOTE: do not copy to GPUs here
-
-        # Compute CTC loss
-        loss = self.warpctc_loss(logits, ys_ctc, enc_lens_ctc, y_lens)
-        # NOTE: ctc loss has already been normalized by bs
-        # NOTE: index 0 is reserved for blank in warpctc_pytorch
-
-        if device_id >= 0:
-            loss = loss.cuda(device_id)
+        if self.ctc_backend == 'warpctc':
+            enc_lens_ctc = np2tensor(np.fromiter(elens, dtype=np.int32), -1).int()
+            ys_ctc = [np2tensor(np.fromiter(y, dtype=np.int64)).long() for y in ys]  # always fwd
+            y_lens = np2tensor(np.fromiter([y.size(0) for y in ys_ctc], dtype=np.int32), -1).int()
+            ys_ctc = torch.cat(ys_ctc, dim=0).int()
+            # NOTE: Concatenate all elements in ys for warpctc_pytorch
+            # NOTE: do not copy to GPUs here
+
+            # Compute CTC loss
+            loss = self.warpctc_loss(logits.transpose(0, 1).cpu(), ys_ctc, enc_lens_ctc, y_lens)
+            # NOTE: ctc loss has already been normalized by bs
+            # NOTE: index 0 is reserved for blank in warpctc_pytorch
+
+            if device_id >= 0:
+                loss = loss.cuda(device_id)
+        else:
+            # NOTE: compute on the same device as logits
+            log_probs = F.log_softmax(logits.transpose(0, 1), dim=-1)  # time-major
+            ys_ctc = torch.cat([np2tensor(np.fromiter(y, dtype=np.int64), device_id).long()
+                                for y in ys], dim=0)  # always fwd
+            loss = F.ctc_loss(log_probs, ys_ctc,
+                              [int(elens[b]) for b in range(len(elens))],
+                              [len(y) for y in ys],
+                              blank=0, reduction='sum', zero_infinity=True) / len(ys)
+            # NOTE: normalize by bs as in warpctc_pytorch
+            # NOTE: infeasible alignments (too long labels) are ignored as in warpctc_pytorch
 
         # Label smoothing for CTC
         if self.lsm_prob > 0 and self.ctc_weight == 1:
@@ -378,8 +428,8 @@ class Decoder(nn.Module):
         bs = len(ys)
 
         # Append <sos> and <eos>
-        sos = torch.zeros((1,)).fill_(self.sos).long().cuda(device_id)
-        eos = torch.zeros((1,)).fill_(self.eos).long().cuda(device_id)
+        sos = np2tensor(np.array([self.sos], dtype=np.int64), device_id)
+        eos = np2tensor(np.array([self.eos], dtype=np.int64), device_id)
         if self.backward:
             ys = [np2tensor(np.fromiter(y[::-1], dtype=np.int64), device_id).long() for y in ys]
             ys_in = [torch.cat([eos, y], dim=0) for y in ys]
@@ -394,31 +444,40 @@ class Decoder(nn.Module):
         # Initialization
         dout, dstate = self.init_dec_state(bs, self.nlayers, device_id)
         _dout, _dstate = self.init_dec_state(bs, 1, device_id)  # for internal LM
-        context = torch.zeros((bs, 1, self.enc_nunits), dtype=torch.float32).cuda(device_id)
+        context = np2tensor(np.zeros((bs, 1, self.enc_nunits), dtype=np.float32), device_id)
 
         # Pre-computation of embedding
         ys_emb = self.embed(ys_in_pad)
 
-        logits = []
-        for t in range(ys_in_pad.size(1)):
-            y_emb = ys_emb[:, t:t + 1]
-
-            # Recurrency
-            dout, dstate, _dout, _dstate = self.recurrency(y_emb, context, dstate, _dstate)
+        if self.internal_lm:
+            # NOTE: the internal LM does not depend on the attention context
+            _hxs, _ = self.recurrency_inlm(ys_emb, _dstate)
+            outs = self.dropout[0](_hxs)
+        else:
+            outs = []
+            for t in range(ys_in_pad.size(1)):
+                y_emb = ys_emb[:, t:t + 1]
 
-            # Generate
-            if self.internal_lm:
-                if self.share_lm_softmax:
-                    logits_t = self.output(_dout)
-                else:
-                    logits_t = self.output_lmobj(_dout)
-            else:
-                attentional_t = self.generate(context, dout)
-                logits_t = self.output(attentional_t)
-            logits.append(logits_t)
+                # Recurrency
+                dout, dstate, _, _ = self.recurrency(y_emb, context, dstate)
+
+                # Generate
+                outs.append(self.generate(context, dout))
+            outs = torch.cat(outs, dim=1)
+
+        if self.internal_lm and not self.share_lm_softmax:
+            logits = self.output_lmobj(outs)
+        elif self.adaptive_softmax:
+            # Compute XE loss only over the clusters of the references
+            loss, acc = self.output.loss(outs, ys_out_pad, ignore_index=-1)
+            loss /= bs
+            ppl = math.exp(loss.item())
+            return loss, acc, ppl
+        else:
+            logits = self.output(outs)
 
         # Compute XE loss for RNNLM objective
-        logits = torch.cat(logits, dim=1) / self.logits_temp
+        logits = logits / self.logits_temp
         loss = F.cross_entropy(logits.view((-1, logits.size(2))),
                                ys_out_pad.view(-1),
                                ignore_index=-1, size_average=False) / bs
@@ -469,35 +528,45 @@ class Decoder(nn.Module):
         context = eouts.new_zeros(bs, 1, enc_nunits)
         self.score.reset()
         aw = None
-        rnnlm_state = None
 
         # Pre-computation of embedding
         ys_emb = self.embed(ys_in_pad)
+
+        # Pre-computation of the internal LM outputs
+        _hxs = None
+        if self.internal_lm and self.ss_prob == 0:
+            _hxs, _dstate = self.recurrency_inlm(ys_emb, _dstate)
+
+        # Pre-computation of RNNLM features for cold fusion
+        rnnlm_state = None
         if self.rnnlm_cf:
             ys_lm_emb = self.rnnlm_cf.embed(ys_in_pad)
-            # ys_lm_emb = [self.rnnlm_cf.embed(ys_in_pad[:, t:t + 1])
-            #              for t in range(ys_in_pad.size(1))]
-            # ys_lm_emb = torch.cat(ys_lm_emb, dim=1)
+            if self.ss_prob == 0:
+                logits_lm, lm_outs, _ = self.rnnlm_cf.predict(ys_lm_emb, None)
+            # NOTE: the RNNLM is frozen. With scheduled sampling, it is run step by step
+            # on the same history as the decoder
 
-        logits = []
+        attentionals = []
         for t in range(ys_in_pad.size(1)):
             # Sample for scheduled sampling
             is_sample = t > 0 and self.ss_prob > 0 and random.random() < self.ss_prob
             if is_sample:
-                y_emb = self.embed(torch.argmax(logits[-1].detach(), dim=-1))
+                y_prev = torch.argmax(self.output(attentionals[-1].detach()), dim=-1)
+                y_emb = self.embed(y_prev)
             else:
                 y_emb = ys_emb[:, t:t + 1]
 
             # Recurrency
-            dout, dstate, _dout, _dstate = self.recurrency(y_emb, context, dstate, _dstate)
+            dout, dstate, _dout, _dstate = self.recurrency(
+                y_emb, context, dstate, _dstate, _hxs[:, t:t + 1] if _hxs is not None else None)
 
-            # Update RNNLM states for cold fusion
+            # RNNLM features for cold fusion
             if self.rnnlm_cf:
-                if is_sample:
-                    y_lm_emb = self.rnnlm_cf.embed(np.argmax(logits[-1].detach(), axis=2).cuda(device_id))
+                if self.ss_prob == 0:
+                    logits_lm_t, lm_out = logits_lm[:, t:t + 1], lm_outs[:, t:t + 1]
                 else:
-                    y_lm_emb = ys_lm_emb[:, t:t + 1]
-                logits_lm_t, lm_out, rnnlm_state = self.rnnlm_cf.predict(y_lm_emb, rnnlm_state)
+                    y_lm_emb = self.rnnlm_cf.embed(y_prev) if is_sample else ys_lm_emb[:, t:t + 1]
+                    logits_lm_t, lm_out, rnnlm_state = self.rnnlm_cf.predict(y_lm_emb, rnnlm_state)
             else:
                 logits_lm_t, lm_out = None, None
 
@@ -509,10 +578,19 @@ class Decoder(nn.Module):
             if self.rnnlm_init and self.internal_lm:
                 # Residual connection
                 attentional_t += _dout
-            logits.append(self.output(attentional_t))
+            attentionals.append(attentional_t)
+        attentionals = torch.cat(attentionals, dim=1)
 
         # Compute XE sequence loss
-        logits = torch.cat(logits, dim=1) / self.logits_temp
+        if self.adaptive_softmax and self.lsm_prob == 0 and self.fl_weight == 0:
+            # Compute XE loss only over the clusters of the references
+            loss, acc = self.output.loss(attentionals, ys_out_pad, ignore_index=-1)
+            loss /= bs
+            ppl = math.exp(loss.item())
+            return loss, acc, ppl
+        # NOTE: label smoothing and focal loss require the full distribution,
+        # and the adaptive softmax layer outputs exact log-probabilities
+        logits = self.output(attentionals) / self.logits_temp
         if self.lsm_prob > 0:
             # Label smoothing
             y_lens = [y.size(0) for y in ys_out]
@@ -542,6 +620,76 @@ class Decoder(nn.Module):
 
         return loss, acc, ppl
 
+    def score_sequences(self, eouts, elens, ys):
+        """Compute log-likelihoods of hypotheses in teacher-forcing mode for N-best rescoring.
+
+            Scheduled sampling is not applied, and outputs are normalized without temperature
+            as in beam search.
+        Args:
+            eouts (FloatTensor): `[B, T, dec_units]`
+            elens (list): A list of length `[B]`
+            ys (list): A list of length `[B]`, which contains arrays of size `[L]`
+                (in the forward order, without <sos> and <eos>)
+        Returns:
+            scores (FloatTensor): `[B]`
+
+        """
+        bs, _, enc_nunits = eouts.size()
+        device_id = eouts.get_device()
+
+        # Append <sos> and <eos>
+        sos = eouts.new_zeros(1).fill_(self.sos).long()
+        eos = eouts.new_zeros(1).fill_(self.eos).long()
+        if self.backward:
+            ys = [np2tensor(np.fromiter(y[::-1], dtype=np.int64), device_id).long() for y in ys]
+            ys_in = [torch.cat([eos, y], dim=0) for y in ys]
+            ys_out = [torch.cat([y, sos], dim=0) for y in ys]
+        else:
+            ys = [np2tensor(np.fromiter(y, dtype=np.int64), device_id).long() for y in ys]
+            ys_in = [torch.cat([sos, y], dim=0) for y in ys]
+            ys_out = [torch.cat([y, eos], dim=0) for y in ys]
+        ys_in_pad = pad_list(ys_in, self.pad)
+        ys_out_pad = pad_list(ys_out, -1)
+
+        # Initialization
+        dout, dstate = self.init_dec_state(bs, self.nlayers, device_id, eouts, elens)
+        _dout, _dstate = self.init_dec_state(bs, 1, device_id, eouts, elens)
+        context = eouts.new_zeros(bs, 1, enc_nunits)
+        self.score.reset()
+        aw = None
+
+        ys_emb = self.embed(ys_in_pad)
+        _hxs = None
+        if self.internal_lm:
+            _hxs, _dstate = self.recurrency_inlm(ys_emb, _dstate)
+        if self.rnnlm_cf:
+            logits_lm, lm_outs, _ = self.rnnlm_cf.predict(self.rnnlm_cf.embed(ys_in_pad), None)
+
+        attentionals = []
+        for t in range(ys_in_pad.size(1)):
+            # Recurrency
+            dout, dstate, _dout, _dstate = self.recurrency(
+                ys_emb[:, t:t + 1], context, dstate, _dstate, _hxs[:, t:t + 1] if _hxs is not None else None)
+
+            # Score
+            context, aw = self.score(eouts, elens, dout, aw)
+
+            # Generate
+            if self.rnnlm_cf:
+                attentional_t = self.generate(context, dout, logits_lm[:, t:t + 1], lm_outs[:, t:t + 1])
+            else:
+                attentional_t = self.generate(context, dout)
+            if self.rnnlm_init and self.internal_lm:
+                # Residual connection
+                attentional_t += _dout
+            attentionals.append(attentional_t)
+        attentionals = torch.cat(attentionals, dim=1)
+
+        # NOTE: the adaptive softmax layer outputs log-probabilities
+        log_probs = F.log_softmax(self.output(attentionals), dim=-1)
+        log_probs = log_probs.gather(2, ys_out_pad.clamp(min=0).unsqueeze(2)).squeeze(2)  # `[B, L]`
+        return (log_probs * (ys_out_pad != -1).float()).sum(1)
+
     def init_dec_state(self, batch_size, nlayers, device_id, eouts=None, elens=None):
         """Initialize decoder state.
 
@@ -572,14 +720,14 @@ class Decoder(nn.Module):
             hx_list = [dout.clone().squeeze(1)] * self.nlayers
             cx_list = [dout.clone().squeeze(1)] * self.nlayers if self.rnn_type == 'lstm' else None
         else:
-            dout = torch.zeros((batch_size, 1, self.nunits), dtype=torch.float32).cuda(device_id)
-            zero_state = torch.zeros((batch_size, self.nunits), dtype=torch.float32).cuda(device_id)
+            dout = np2tensor(np.zeros((batch_size, 1, self.nunits), dtype=np.float32), device_id)
+            zero_state = np2tensor(np.zeros((batch_size, self.nunits), dtype=np.float32), device_id)
             hx_list = [zero_state] * self.nlayers
             cx_list = [zero_state] * self.nlayers if self.rnn_type == 'lstm' else None
 
         return dout, (hx_list, cx_list)
 
-    def recurrency(self, y_emb, context, dstate, _dstate=None):
+    def recurrency(self, y_emb, context, dstate, _dstate=None, _hx_lm=None):
         """Recurrency function.
 
         Args:
@@ -591,6 +739,8 @@ class Decoder(nn.Module):
             _dstate (tuple): A tuple of (hx_list, cx_list)
                 hx_list (list of FloatTensor):
                 cx_list (list of FloatTensor):
+            _hx_lm (FloatTensor): `[B, 1, nunits]`
+                pre-computed outputs of the internal LM (_dstate is not updated)
         Returns:
             dout (FloatTensor): `[B, 1, nunits]`
             dstate (tuple): A tuple of (hx_list, cx_list)
@@ -607,17 +757,15 @@ class Decoder(nn.Module):
         context = context.squeeze(1)
 
         if self.internal_lm:
-            hx_lm, cx_lm = _dstate
+            if _hx_lm is None:
+                _hx_lm, _dstate = self.recurrency_inlm(y_emb.unsqueeze(1), _dstate)
+            _hx_lm = _hx_lm.squeeze(1)
+            _h_lm = torch.cat([self.dropout_inlm(_hx_lm), context], dim=-1)
             if self.rnn_type == 'lstm':
-                hx_lm[0], cx_lm[0] = self.rnn_inlm(y_emb, (hx_lm[0], cx_lm[0]))
-                _h_lm = torch.cat([self.dropout_inlm(hx_lm[0]), context], dim=-1)
                 hx_list[0], cx_list[0] = self.rnn[0](_h_lm, (hx_list[0], cx_list[0]))
             elif self.rnn_type == 'gru':
-                hx_lm = self.rnn_inlm(y_emb, hx_lm)
-                _h_lm = torch.cat([self.dropout_inlm(hx_lm), context], dim=-1)
                 hx_list[0] = self.rnn[0](_h_lm, hx_list[0])
-            _dout = self.dropout[0](hx_lm[0]).unsqueeze(1)
-            _dstate = (hx_lm, cx_lm)
+            _dout = self.dropout[0](_hx_lm).unsqueeze(1)
         else:
             if self.rnn_type == 'lstm':
                 hx_list[0], cx_list[0] = self.rnn[0](torch.cat([y_emb, context], dim=-1), (hx_list[0], cx_list[0]))
@@ -639,6 +787,37 @@ class Decoder(nn.Module):
         dout = self.dropout[-1](hx_list[-1]).unsqueeze(1)
         return dout, (hx_list, cx_list), _dout, _dstate
 
+    def recurrency_inlm(self, ys_emb, _dstate):
+        """Recurrency function for the internal LM.
+
+        Args:
+            ys_emb (FloatTensor): `[B, L, emb_dim]`
+            _dstate (tuple): A tuple of (hx_list, cx_list)
+                hx_list (list of FloatTensor):
+                cx_list (list of FloatTensor):
+        Returns:
+            _hxs (FloatTensor): `[B, L, nunits]`
+            _dstate (tuple): A tuple of (hx_list, cx_list)
+                hx_list (list of FloatTensor):
+                cx_list (list of FloatTensor):
+
+        """
+        hx_lm, cx_lm = _dstate
+        if self.rnn_type == 'lstm':
+            _hxs, (hx_lm, cx_lm) = self.rnn_inlm(ys_emb, (hx_lm[0].unsqueeze(0), cx_lm[0].unsqueeze(0)))
+            _dstate = ([hx_lm.squeeze(0)], [cx_lm.squeeze(0)])
+        elif self.rnn_type == 'gru':
+            _hxs, hx_lm = self.rnn_inlm(ys_emb, hx_lm[0].unsqueeze(0))
+            _dstate = ([hx_lm.squeeze(0)], None)
+        return _hxs, _dstate
+
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        # NOTE: the internal LM used to be a RNN cell
+        for k in ['weight_ih', 'weight_hh', 'bias_ih', 'bias_hh']:
+            if prefix + 'rnn_inlm.' + k in state_dict:
+                state_dict[prefix + 'rnn_inlm.' + k + '_l0'] = state_dict.pop(prefix + 'rnn_inlm.' + k)
+        super(Decoder, self)._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+
     def generate(self, context, dout, logits_lm_t=None, lm_out=None):
         """Generate function.
 
@@ -665,21 +844,30 @@ class Decoder(nn.Module):
             logits_t = self.output_bn(torch.cat([dout, context], dim=-1))
         return torch.tanh(logits_t)
 
-    def greedy(self, eouts, elens, max_len_ratio, exclude_eos=False):
+    def greedy(self, eouts, elens, max_len_ratio, exclude_eos=False, attn_window=0,
+               return_aws=True, check_interval=GREEDY_CHECK_INTERVAL):
         """Greedy decoding in the inference stage.
 
+            Finished utterances are tracked on the device, and removed from the mini-batch
+            every `check_interval` steps. The maximum length of hypotheses is determined by
+            the length of each utterance, so results do not depend on the other utterances.
         Args:
             eouts (FloatTensor): `[B, T, enc_units]`
             elens (list): A list of length `[B]`
             max_len_ratio (int): the maximum sequence length of tokens
             exclude_eos (bool):
+            attn_window (int): restrict attention to a window around the previous peak
+            return_aws (bool): return attention weights
+            check_interval (int): the interval of steps to check if utterances are finished
         Returns:
             best_hyps (list): A list of length `[B]`, which contains arrays of size `[L]`
             aw (list): A list of length `[B]`, which contains arrays of size `[L, T]`
+                (None if return_aws is False)
 
         """
         bs, enc_time, enc_nunits = eouts.size()
         device_id = eouts.get_device()
+        max_len = int(math.floor(enc_time * max_len_ratio)) + 1
 
         # Initialization
         dout, dstate = self.init_dec_state(bs, self.nlayers, device_id, eouts, elens)
@@ -687,7 +875,7 @@ class Decoder(nn.Module):
         context = eouts.new_zeros(bs, 1, enc_nunits)
         self.score.reset()
         aw = None
-        rnnlm_state = None
+        rnnlm_state = (None, None)
 
         if self.backward:
             sos, eos = self.eos, self.sos
@@ -697,23 +885,32 @@ class Decoder(nn.Module):
         # Start from <sos> (<eos> in case of the backward decoder)
         y = eouts.new_zeros(bs, 1).fill_(sos).long()
 
-        best_hyps_tmp, aws_tmp = [], []
-        y_lens = np.zeros((bs,), dtype=np.int32)
-        eos_flags = [False] * bs
-        for t in range(int(math.floor(enc_time * max_len_ratio)) + 1):
+        # States of the active utterances
+        active = torch.arange(bs, dtype=torch.long, device=eouts.device)  # indices in the mini-batch
+        elens_active = list(elens)
+        ylens_active = eouts.new_zeros(bs).long()
+        eos_flags_active = y.squeeze(1) < 0
+        max_lens_active = eouts.new_tensor([int(math.floor(elens[b] * max_len_ratio)) + 1
+                                            for b in range(bs)]).long()
+
+        best_hyps_tmp = eouts.new_zeros(bs, max_len).long()
+        ylens = eouts.new_zeros(bs).long()
+        eos_flags = y.squeeze(1) < 0
+        aws_tmp = []  # A list of tuples of (active, aw)
+        for t in range(max_len):
             # Recurrency
             y_emb = self.embed(y)
             dout, dstate, _dout, _dstate = self.recurrency(y_emb, context, dstate, _dstate)
 
             # Update RNNLM states for cold fusion
             if self.rnnlm_cf:
-                y_lm = self.rnnlm_cf.embed(y)
+                y_lm = self.rnnlm_cf.embed(y).squeeze(1)
                 logits_lm_t, lm_out, rnnlm_state = self.rnnlm_cf.predict(y_lm, rnnlm_state)
             else:
                 logits_lm_t, lm_out = None, None
 
             # Score
-            context, aw = self.score(eouts, elens, dout, aw)
+            context, aw = self.score(eouts, elens_active, dout, aw, attn_window)
 
             # Generate
             attentional_t = self.generate(context, dout, logits_lm_t, lm_out)
@@ -723,42 +920,73 @@ class Decoder(nn.Module):
             logits_t = self.output(attentional_t)
 
             # Pick up 1-best
-            device_id = logits_t.get_device()
-            y = np.argmax(logits_t.squeeze(1).detach(), axis=1).cuda(device_id).unsqueeze(1)
-            best_hyps_tmp += [y]
-            if self.score.nheads > 1:
-                aws_tmp += [aw[0]]
-            else:
-                aws_tmp += [aw]
-
-            # Count lengths of hypotheses
-            for b in range(bs):
-                if not eos_flags[b]:
-                    if y[b].item() == eos:
-                        eos_flags[b] = True
-                    y_lens[b] += 1
-                    # NOTE: include <eos>
-
-            # Break if <eos> is outputed in all mini-bs
-            if sum(eos_flags) == bs:
+            y = logits_t.squeeze(1).argmax(-1).unsqueeze(1)
+            best_hyps_tmp[active, t] = y.squeeze(1)
+            if return_aws:
+                aws_tmp += [(active, aw[:, 0] if self.score.nheads > 1 else aw)]
+
+            # Count lengths of hypotheses (including <eos>) without synchronization
+            is_alive = (eos_flags_active == 0) & (max_lens_active > t)
+            ylens_active += is_alive.long()
+            eos_flags_active = eos_flags_active | (is_alive & (y.squeeze(1) == eos))
+
+            if (t + 1) % check_interval != 0 or t == max_len - 1:
+                continue
+
+            # Break if <eos> is outputed or the maximum length is reached in all mini-batch
+            is_finished = tensor2np(eos_flags_active | (max_lens_active <= t + 1))
+            if is_finished.all():
                 break
 
-        # Concatenate in L dimension
-        best_hyps_tmp = torch.cat(best_hyps_tmp, dim=1)
-        aws_tmp = torch.stack(aws_tmp, dim=1)
+            # Remove finished utterances from the mini-batch
+            if is_finished.any():
+                ylens.index_copy_(0, active, ylens_active)
+                eos_flags.index_copy_(0, active, eos_flags_active)
+                ids = np.where(is_finished == 0)[0]
+                ids_active = torch.from_numpy(ids).to(eouts.device)
+                active = active.index_select(0, ids_active)
+                elens_active = [elens_active[i] for i in ids]
+                ylens_active = ylens_active.index_select(0, ids_active)
+                eos_flags_active = eos_flags_active.index_select(0, ids_active)
+                max_lens_active = max_lens_active.index_select(0, ids_active)
+                eouts = eouts.index_select(0, ids_active)
+                y = y.index_select(0, ids_active)
+                dstate = select_state(dstate, ids_active)
+                if self.internal_lm:
+                    _dstate = select_state(_dstate, ids_active)
+                context = context.index_select(0, ids_active)
+                aw = aw.index_select(0, ids_active)
+                if rnnlm_state[0] is not None:
+                    rnnlm_state = select_state(rnnlm_state, ids_active)
+                # NOTE: cached encoder projections and masks are recomputed for the new mini-batch
+                self.score.reset()
+
+        ylens.index_copy_(0, active, ylens_active)
+        eos_flags.index_copy_(0, active, eos_flags_active)
 
         # Convert to numpy
+        y_lens = tensor2np(ylens)
+        eos_flags = tensor2np(eos_flags).astype(bool).tolist()
         best_hyps_tmp = tensor2np(best_hyps_tmp)
-        aws_tmp = tensor2np(aws_tmp)
 
         # Truncate by the first <eos> (<sos> in case of the backward decoder)
         if self.backward:
             # Reverse the order
             best_hyps = [best_hyps_tmp[b, :y_lens[b]][::-1] for b in range(bs)]
-            aws = [aws_tmp[b, :y_lens[b]][::-1] for b in range(bs)]
         else:
             best_hyps = [best_hyps_tmp[b, :y_lens[b]] for b in range(bs)]
-            aws = [aws_tmp[b, :y_lens[b]] for b in range(bs)]
+
+        aws = None
+        if return_aws:
+            # Concatenate in L dimension
+            aws_all = eouts.new_zeros(bs, len(aws_tmp), enc_time)
+            for t, (active_t, aw_t) in enumerate(aws_tmp):
+                aws_all[active_t, t] = aw_t
+            aws_all = tensor2np(aws_all)
+            if self.backward:
+                aws = [aws_all[b, :y_lens[b]][::-1] for b in range(bs)]
+            else:
+                aws = [aws_all[b, :y_lens[b]] for b in range(bs)]
 
         # Exclude <eos> (<sos> in case of the backward decoder)
         if exclude_eos:
@@ -772,9 +1000,12 @@ class Decoder(nn.Module):
         return best_hyps, aws
 
     def beam_search(self, eouts, elens, params, rnnlm, nbest=1,
-                    exclude_eos=False, id2token=None, refs=None):
+                    exclude_eos=False, id2token=None, refs=None, ngram=None, return_aws=True,
+                    ctc_log_probs=None, ctc_elens=None):
         """Beam search decoding in the inference stage.
 
+            All hypotheses of all utterances are decoded in parallel as a mini-batch of size `[B * beam_width]`.
+            Tokens are stored step by step with backpointers, and hypotheses are traced back only when completed.
         Args:
             eouts (FloatTensor): `[B, T, dec_units]`
             elens (list): A list of length `[B]`
@@ -786,249 +1017,558 @@ class Decoder(nn.Module):
                 coverage_penalty (float): coverage penalty
                 coverage_threshold (float): threshold for coverage penalty
                 rnnlm_weight (float): the weight of RNNLM score
+                attn_window (int): restrict attention to a window around the previous peak
+                recog_ctc_weight (float): the weight of CTC prefix score
+                ngram_weight (float): the weight of n-gram LM score
+                shortlist_threshold (float): restrict the output layer to tokens whose CTC posterior
+                    exceeds this value at any frame (0 means the full vocabulary)
+                shortlist_nfrequent (int): the number of the most frequent tokens always in the shortlist
+                shortlist_max_error (float): fall back to the full softmax when the bound of the error
+                    of log-probabilities exceeds this value
             rnnlm (torch.nn.Module):
             nbest (int):
             exclude_eos (bool):
             id2token (): converter from index to token
             refs ():
+            ngram (NgramScorer): n-gram LM for shallow fusion (only for the forward decoder)
+            return_aws (bool): return attention weights
+            ctc_log_probs (FloatTensor): CTC log-posteriors `[B, T_ctc, vocab]` for CTC scores and shortlists,
+                e.g., over encoder outputs before blank frames are removed (computed from eouts if None)
+            ctc_elens (list): A list of length `[B]`, which contains lengths of ctc_log_probs
         Returns:
             nbest_hyps (list): A list of length `[B]`, which contains list of n hypotheses
             aws (list): A list of length `[B]`, which contains arrays of size `[L, T]`
+                (None if return_aws is False)
             scores (list):
 
         """
-        bs, _, enc_nunits = eouts.size()
+        bs, enc_time, enc_nunits = eouts.size()
         device_id = eouts.get_device()
+        beam_width = params['beam_width']
 
         # For cold fusion
         if params['rnnlm_weight'] > 0 and not self.cold_fusion:
             assert self.rnnlm_cf
             self.rnnlm_cf.eval()
 
-        # For shallow fusion
-        if rnnlm is not None:
-            rnnlm.eval()
-
         if self.backward:
             sos, eos = self.eos, self.sos
         else:
             sos, eos = self.sos, self.eos
 
+        # For shallow fusion
+        if rnnlm is not None:
+            rnnlm.eval()
+        if rnnlm is not None and not self.rnnlm_cf:
+            # NOTE: RNNLM states are cached only during this call to bound the memory
+            rnnlm_cache = RNNLMCache(rnnlm)
+            lm_nodes = [rnnlm_cache.root] * (bs * beam_width)
+            y_np = [sos] * (bs * beam_width)
+        if self.backward:
+            ngram = None
+        if ngram is not None:
+            ngram_states = [ngram.initial_state()] * (bs * beam_width)
+
+        # For joint CTC/attention decoding
+        ctc_weight = params['recog_ctc_weight'] if hasattr(self, 'output_ctc') else 0
+        use_shortlist = params['shortlist_threshold'] > 0 and hasattr(self, 'output_ctc') and \
+            not self.adaptive_softmax
+        if (ctc_weight > 0 or use_shortlist) and ctc_log_probs is None:
+            ctc_log_probs = F.log_softmax(self.output_ctc(eouts), dim=-1)
+            ctc_elens = elens
+        if ctc_weight > 0:
+            ctc_prefix_score = CTCPrefixScore(ctc_log_probs, ctc_elens, 0, eos, beam_width)
+            ctc_state = ctc_prefix_score.initial_state()
+            ctc_beam = min(ctc_log_probs.size(-1), int(beam_width * CTC_SCORING_RATIO))
+
+        # Vocabulary shortlist
+        shortlist = None
+        if use_shortlist:
+            shortlist = self.make_shortlist(ctc_log_probs, ctc_elens, params['shortlist_threshold'],
+                                            params['shortlist_nfrequent'], eos, beam_width)
+            nfallbacks = eouts.new_zeros(1)
+
+        # Expand encoder outputs to `[B * beam_width, T, enc_units]`
+        eouts = eouts.unsqueeze(1).expand(bs, beam_width, enc_time, enc_nunits).contiguous()
+        eouts = eouts.view(bs * beam_width, enc_time, enc_nunits)
+        elens_beam = [elens[b] for b in range(bs) for _ in range(beam_width)]
+        max_lens = [int(math.floor(elens[b] * params['max_len_ratio'])) + 1 for b in range(bs)]
+        min_lens = [elens[b] * params['min_len_ratio'] for b in range(bs)]
+        max_lens_dev = eouts.new_tensor(max_lens)
+        min_lens_dev = eouts.new_tensor(min_lens)
+        beam_offset = torch.arange(0, bs * beam_width, beam_width, dtype=torch.long,
+                                   device=eouts.device).unsqueeze(1)  # `[B, 1]`
+        beam_offset_np = np.arange(0, bs * beam_width, beam_width)[:, None]
+
+        # Initialization
+        dout, dstate = self.init_dec_state(bs * beam_width, self.nlayers, device_id, eouts, elens_beam)
+        _dout, _dstate = self.init_dec_state(bs * beam_width, 1, device_id, eouts, elens_beam)
+        context = eouts.new_zeros(bs * beam_width, 1, enc_nunits)
+        self.score.reset()
+        aw = None
+        rnnlm_state = (None, None)
+
+        # NOTE: only the first hypothesis of each utterance is alive at the first step
+        scores = eouts.new_zeros(bs, beam_width)
+        scores[:, 1:] = -float('inf')
+        scores = scores.view(-1)
+        scores_raw = eouts.new_zeros(bs * beam_width)
+        cov = eouts.new_zeros(bs * beam_width)
+        aw_sum = None  # sum of attention weights of previous steps `[B * beam_width, (nheads), T]`
+
+        y = eouts.new_zeros(bs * beam_width, 1).fill_(sos).long()
+        # History of each step. Hypotheses at step t are traced back by backpointers.
+        ys_hist = []  # A list of length `[L]`, which contains arrays of size `[B * beam_width]`
+        bps_hist = []  # A list of length `[L]`, which contains arrays of size `[B * beam_width]`
+        scores_hist = []  # A list of length `[L]`, which contains arrays of size `[B * beam_width]`
+        aws_hist = [] if return_aws else None  # `[L]` of `[B * beam_width, (nheads), T]`
+
+        complete = [[] for _ in range(bs)]
+        not_complete = [[] for _ in range(bs)]
+        done = np.zeros(bs, dtype=np.bool_)
+        # NOTE: the number of complete hypotheses and finished utterances are also tracked on the device
+        # so that hypotheses are pruned without copying masks from the host
+        ncomplete = torch.zeros(bs, dtype=torch.long, device=eouts.device)
+        done_dev = torch.zeros(bs, dtype=torch.uint8, device=eouts.device) > 0
+        for t in range(max(max_lens)):
+            # Recurrency
+            y_emb = self.embed(y)
+            dout, dstate, _dout, _dstate = self.recurrency(y_emb, context, dstate, _dstate)
+
+            # Score
+            context, aw = self.score(eouts, elens_beam, dout, aw, params['attn_window'])
+
+            if self.rnnlm_cf:
+                # Update RNNLM states for cold fusion
+                y_lm_emb = self.rnnlm_cf.embed(y).squeeze(1)
+                logits_lm_t, lm_out, rnnlm_state = self.rnnlm_cf.predict(y_lm_emb, rnnlm_state)
+            elif rnnlm is not None:
+                # Update RNNLM states for shallow fusion, reusing states of identical prefixes
+                logits_lm_t, rnnlm_state, lm_nodes = rnnlm_cache.predict(lm_nodes, y_np, rnnlm_state)
+                lm_out = None
+            else:
+                logits_lm_t, lm_out = None, None
+
+            # Generate
+            attentional_t = self.generate(context, dout, logits_lm_t, lm_out)
+            if self.rnnlm_init and self.internal_lm:
+                # Residual connection
+                attentional_t += _dout
+            if shortlist is not None:
+                log_probs, is_fallback = self.shortlist_log_softmax(attentional_t.squeeze(1), shortlist,
+                                                                    params['shortlist_max_error'])
+                nfallbacks += is_fallback.float().sum()
+            else:
+                logits_t = self.output(attentional_t)
+
+                # Path through the softmax layer & convert to log-scale
+                log_probs = F.log_softmax(logits_t.squeeze(1), dim=1)  # `[B * beam_width, vocab]`
+            vocab = log_probs.size(1)
+
+            # Add length penalty
+            scores_raw_cand = scores_raw.unsqueeze(1) + log_probs
+            scores_cand = scores.unsqueeze(1) + log_probs * (1 - ctc_weight) + params['length_penalty']
+
+            # Add coverage penalty
+            if params['coverage_penalty'] > 0:
+                aw_sum_new = aw if aw_sum is None else aw_sum + aw  # `[B * beam_width, (nheads), T]`
+                cov_new = aw_sum_new
+                if params['coverage_threshold'] > 0:
+                    cov_new = cov_new * (cov_new > params['coverage_threshold']).float()
+                cov_new = cov_new.view(bs * beam_width, -1).sum(-1) / self.score.nheads
+                scores_cand += ((cov_new - cov) * params['coverage_penalty']).unsqueeze(1)
+
+            # Add RNNLM score
+            if params['rnnlm_weight'] > 0:
+                lm_log_probs = F.log_softmax(logits_lm_t.squeeze(1), dim=1)
+                assert log_probs.size() == lm_log_probs.size()
+                scores_cand += lm_log_probs * params['rnnlm_weight']
+
+            # Add n-gram LM score
+            if ngram is not None:
+                ngram_log_probs = ngram.scores_tensor(ngram_states, eouts.device)
+                assert log_probs.size() == ngram_log_probs.size()
+                scores_cand += ngram_log_probs * params['ngram_weight']
+
+            # Add CTC prefix score to the candidates pruned by the other scores
+            if ctc_weight > 0:
+                _, ctc_cands = torch.topk(scores_cand, k=ctc_beam, dim=1)
+                # NOTE: <eos> is always scored so that hypotheses alive for CTC can be completed
+                has_eos = (ctc_cands == eos).sum(1) > 0
+                ctc_cands[:, -1] = torch.where(has_eos, ctc_cands[:, -1], torch.full_like(ctc_cands[:, -1], eos))
+                y_prev = y.squeeze(1) if t > 0 else y.new_full((bs * beam_width,), -1)
+                ctc_scores, ctc_r, ctc_log_psi = ctc_prefix_score(t, y_prev, ctc_cands, ctc_state)
+                scores_cand = scores_cand.new_full(scores_cand.size(), -float('inf')).scatter_(
+                    1, ctc_cands, scores_cand.gather(1, ctc_cands) + ctc_scores * ctc_weight)
+
+            # Exclude short hypotheses
+            if t + 1 < max(min_lens):
+                is_short = (min_lens_dev > t + 1).unsqueeze(1).expand(bs, beam_width).contiguous().view(-1)
+                scores_cand[:, eos].masked_fill_(is_short, -float('inf'))
+
+            # Pick up the top-k scores over all hypotheses of each utterance
+            scores_topk, ids_topk = torch.topk(scores_cand.view(bs, -1), k=beam_width, dim=1,
+                                               largest=True, sorted=True)
+            ids_beam = (beam_offset + ids_topk // vocab).view(-1)  # backpointers `[B * beam_width]`
+            y = (ids_topk % vocab).view(-1, 1)
+            scores = scores_topk.view(-1)
+            scores_raw = scores_raw_cand.view(bs, -1).gather(1, ids_topk).view(-1)
+
+            # Find complete hypotheses and finished utterances
+            is_eos = y.view(bs, beam_width) == eos
+            is_finite = scores_topk > -float('inf')
+            is_complete = is_eos & is_finite & (done_dev.unsqueeze(1) == 0)
+            ncomplete += is_complete.long().sum(1)
+            nalive = (is_finite & (is_eos == 0)).long().sum(1)
+            is_done = (done_dev == 0) & ((ncomplete >= beam_width) | (max_lens_dev <= t + 1) | (nalive == 0))
+            done_dev = done_dev | is_done
+
+            # Copy everything needed on the host at once
+            # NOTE: token indices are exact in double precision
+            stats = tensor2np(torch.cat([scores_topk.double(), scores_raw.view(bs, -1).double(),
+                                         ids_topk.double(), is_complete.double(),
+                                         is_done.double().unsqueeze(1)], dim=1))
+            scores_np = stats[:, :beam_width].astype(np.float32)
+            scores_raw_np = stats[:, beam_width:beam_width * 2].astype(np.float32)
+            ids_topk_np = stats[:, beam_width * 2:beam_width * 3].astype(np.int64)
+            is_complete_np = stats[:, beam_width * 3:beam_width * 4] > 0
+            is_done_np = stats[:, -1] > 0
+            ids_beam_np = (beam_offset_np + ids_topk_np // vocab).reshape(-1)
+            y_np = (ids_topk_np % vocab).reshape(-1)
+
+            # Reorder states by backpointers
+            dstate = select_state(dstate, ids_beam)
+            if self.internal_lm:
+                _dstate = select_state(_dstate, ids_beam)
+            context = context.index_select(0, ids_beam)
+            aw = aw.index_select(0, ids_beam)
+            if rnnlm_state[0] is not None:
+                rnnlm_state = select_state(rnnlm_state, ids_beam)
+            if rnnlm is not None and not self.rnnlm_cf:
+                lm_nodes = [lm_nodes[i] for i in ids_beam_np]
+            if ngram is not None:
+                ngram_states = ngram.next_states([ngram_states[i] for i in ids_beam_np], y_np)
+            if params['coverage_penalty'] > 0:
+                cov = cov_new.index_select(0, ids_beam)
+                aw_sum = aw_sum_new.index_select(0, ids_beam)
+            if ctc_weight > 0:
+                ids_cand = (ctc_cands.index_select(0, ids_beam) == y).long().max(1)[1]
+                ctc_state = (ctc_r[:, :, ids_beam, ids_cand], ctc_log_psi[ids_beam, ids_cand])
+            ys_hist.append(y_np)
+            bps_hist.append(ids_beam_np)
+            scores_hist.append(scores_np.reshape(-1))
+            if return_aws:
+                aws_hist.append(aw)
+
+            # Remove complete hypotheses
+            for b, k in zip(*np.nonzero(is_complete_np)):
+                complete[b] += [self._make_hyp(b * beam_width + k, elens[b],
+                                               ys_hist, bps_hist, scores_hist, aws_hist,
+                                               scores_np[b, k], scores_raw_np[b, k])]
+            is_alive_np = (scores_np > -float('inf')) & (y_np.reshape(bs, beam_width) != eos)
+            for b in np.nonzero(is_done_np)[0]:
+                complete[b] = complete[b][:beam_width]
+                if len(complete[b]) < nbest:
+                    alive = np.nonzero(is_alive_np[b])[0]
+                    not_complete[b] = [self._make_hyp(b * beam_width + k, elens[b],
+                                                      ys_hist, bps_hist, scores_hist, aws_hist,
+                                                      scores_np[b, k], scores_raw_np[b, k])
+                                       for k in alive]
+            done |= is_done_np
+
+            if done.all():
+                break
+            scores.masked_fill_((is_eos | done_dev.unsqueeze(1)).view(-1), -float('inf'))
+
+        if rnnlm is not None and not self.rnnlm_cf:
+            logger.info('RNNLM cache hit rate: %.3f (%d/%d)' %
+                        (rnnlm_cache.hit_rate, rnnlm_cache.hits, rnnlm_cache.queries))
+        if shortlist is not None:
+            logger.info('shortlist: %d / %d tokens, full softmax for %d / %d hypotheses over %d steps' %
+                        (shortlist['ids'].size(0), shortlist['vocab'], nfallbacks.item(),
+                         bs * beam_width * (t + 1), t + 1))
+
         nbest_hyps, aws, scores = [], [], []
         eos_flags = []
         for b in range(bs):
-            # Initialization per utterance
-            dout, (hx_list, cx_list) = self.init_dec_state(1, self.nlayers, device_id, eouts[b:b + 1], elens[b:b + 1])
-            _dout, _dstate = self.init_dec_state(1, 1, device_id, eouts[b:b + 1], elens[b:b + 1])
-            context = eouts.new_zeros(1, 1, enc_nunits)
-            self.score.reset()
-
-            complete = []
-            beam = [{'hyp': [sos],
-                     'score': 0,
-                     'scores': [0],
-                     'score_raw': 0,
-                     'dout': dout,
-                     'hx_list': hx_list,
-                     'cx_list': cx_list,
-                     'context': context,
-                     'aws': [None],
-                     'rnnlm_hx_list': None,
-                     'rnnlm_cx_list': None,
-                     'prev_cov': 0,
-                     '_dout': _dout,
-                     '_dstate': _dstate}]
-            for t in range(int(math.floor(elens[b] * params['max_len_ratio'])) + 1):
-                new_beam = []
-                for i_beam in range(len(beam)):
-                    # Recurrency
-                    y = eouts.new_zeros(1, 1).fill_(beam[i_beam]['hyp'][-1]).long()
-                    y_emb = self.embed(y)
-                    dout, (hx_list, cx_list), _dout, _dstate = self.recurrency(
-                        y_emb, beam[i_beam]['context'],
-                        (beam[i_beam]['hx_list'], beam[i_beam]['cx_list']),
-                        beam[i_beam]['_dstate'])
-
-                    # Score
-                    context, aw = self.score(eouts[b:b + 1, :elens[b]],
-                                             elens[b:b + 1],
-                                             dout,
-                                             beam[i_beam]['aws'][-1])
-
-                    if self.rnnlm_cf:
-                        # Update RNNLM states for cold fusion
-                        y_lm = eouts.new_zeros(1, 1).fill_(beam[i_beam]['hyp'][-1]).long()
-                        y_lm_emb = self.rnnlm_cf.embed(y_lm).squeeze(1)
-                        logits_lm_t, lm_out, rnnlm_state = self.rnnlm_cf.predict(
-                            y_lm_emb, (beam[i_beam]['rnnlm_hx_list'], beam[i_beam]['rnnlm_cx_list']))
-                    elif rnnlm is not None:
-                        # Update RNNLM states for shallow fusion
-                        y_lm = eouts.new_zeros(1, 1).fill_(beam[i_beam]['hyp'][-1]).long()
-                        y_lm_emb = rnnlm.embed(y_lm).squeeze(1)
-                        logits_lm_t, lm_out, rnnlm_state = rnnlm.predict(
-                            y_lm_emb, (beam[i_beam]['rnnlm_hx_list'], beam[i_beam]['rnnlm_cx_list']))
-                    else:
-                        logits_lm_t, lm_out, rnnlm_state = None, None, None
-
-                    # Generate
-                    attentional_t = self.generate(context, dout, logits_lm_t, lm_out)
-                    if self.rnnlm_init and self.internal_lm:
-                        # Residual connection
-                        attentional_t += _dout
-                    logits_t = self.output(attentional_t)
-
-                    # Path through the softmax layer & convert to log-scale
-                    log_probs = F.log_softmax(logits_t.squeeze(1), dim=1)  # log-prob-level
-                    # log_probs = logits_t.squeeze(1)  # logits-level
-                    # NOTE: `[1 (B), 1, vocab]` -> `[1 (B), vocab]`
-
-                    # Pick up the top-k scores
-                    log_probs_topk, indices_topk = torch.topk(
-                        log_probs, k=params['beam_width'], dim=1, largest=True, sorted=True)
-
-                    for k in range(params['beam_width']):
-                        # Exclude short hypotheses
-                        if indices_topk[0, k].item() == eos and len(beam[i_beam]['hyp']) < elens[b] * params['min_len_ratio']:
-                            continue
-
-                        # Add length penalty
-                        score_raw = beam[i_beam]['score_raw'] + log_probs_topk[0, k].item()
-                        score = score_raw + params['length_penalty']
-
-                        # Add coverage penalty
-                        if params['coverage_penalty'] > 0:
-                            # Recompute converage penalty in each step
-                            score -= beam[i_beam]['prev_cov'] * params['coverage_penalty']
-                            aw_stack = torch.stack(beam[i_beam]['aws'][1:] + [aw], dim=-1)
-                            cov_sum = aw_stack.detach().cpu().numpy()
-                            if params['coverage_threshold'] == 0:
-                                cov_sum = np.sum(cov_sum) / self.score.nheads
-                            else:
-                                cov_sum = np.sum(
-                                    cov_sum[np.where(cov_sum > params['coverage_threshold'])[0]]) / self.score.nheads
-                            score += cov_sum * params['coverage_penalty']
-                        else:
-                            cov_sum = 0
-
-                        # Add RNNLM score
-                        if params['rnnlm_weight'] > 0:
-                            lm_log_probs = F.log_softmax(logits_lm_t.squeeze(1), dim=1)
-                            assert log_probs.size() == lm_log_probs.size()
-                            score += lm_log_probs[0, indices_topk[0, k].item()].item() * params['rnnlm_weight']
-
-                        new_beam.append(
-                            {'hyp': beam[i_beam]['hyp'] + [indices_topk[0, k].item()],
-                             'score': score,
-                             'scores': beam[i_beam]['scores'] + [score],
-                             'score_raw': score_raw,
-                             'score_lm': 0,  # TODO(hirofumi):
-                             'score_lp': 0,  # TODO(hirofumi):
-                             'score_cp': 0,  # TODO(hirofumi):
-                             'hx_list': hx_list[:],
-                             'cx_list': cx_list[:] if cx_list is not None else None,
-                             'dout': dout,
-                             'context': context,
-                             'aws': beam[i_beam]['aws'] + [aw],
-                             'rnnlm_hx_list': rnnlm_state[0][:] if rnnlm_state is not None else None,
-                             'rnnlm_cx_list': rnnlm_state[1][:] if rnnlm_state is not None else None,
-                             'prev_cov': cov_sum,
-                             '_dout': _dout,
-                             '_dstate': _dstate[:]})
-
-                new_beam = sorted(new_beam, key=lambda x: x['score'], reverse=True)
-
-                # Remove complete hypotheses
-                not_complete = []
-                for cand in new_beam[:params['beam_width']]:
-                    if cand['hyp'][-1] == eos:
-                        complete += [cand]
-                    else:
-                        not_complete += [cand]
-
-                if len(complete) >= params['beam_width']:
-                    complete = complete[:params['beam_width']]
-                    break
-
-                beam = not_complete[:params['beam_width']]
-
             # Sort by score
-            if len(complete) == 0:
-                complete = beam
-            elif len(complete) < nbest and nbest > 1:
-                complete.extend(beam[:nbest - len(complete)])
-            complete = sorted(complete, key=lambda x: x['score'], reverse=True)
+            if len(complete[b]) == 0:
+                complete[b] = not_complete[b]
+            elif len(complete[b]) < nbest and nbest > 1:
+                complete[b].extend(not_complete[b][:nbest - len(complete[b])])
+            complete[b] = sorted(complete[b], key=lambda x: x['score'], reverse=True)
+            # NOTE: fewer than nbest hypotheses survive when the beam exceeds the vocabulary
+            nbest_b = min(nbest, len(complete[b]))
 
             # N-best list
             if self.backward:
                 # Reverse the order
-                nbest_hyps += [[np.array(complete[n]['hyp'][1:][::-1]) for n in range(nbest)]]
-                if self.score.nheads > 1:
-                    aws += [[complete[n]['aws'][0, 1:][::-1] for n in range(nbest)]]
-                else:
-                    aws += [[complete[n]['aws'][1:][::-1] for n in range(nbest)]]
-                scores += [[complete[n]['scores'][1:][::-1] for n in range(nbest)]]
+                nbest_hyps += [[complete[b][n]['hyp'][::-1] for n in range(nbest_b)]]
+                if return_aws:
+                    aws += [[complete[b][n]['aws'][::-1] for n in range(nbest_b)]]
+                scores += [[complete[b][n]['scores'][::-1] for n in range(nbest_b)]]
             else:
-                nbest_hyps += [[np.array(complete[n]['hyp'][1:]) for n in range(nbest)]]
-                if self.score.nheads > 1:
-                    aws += [[complete[n]['aws'][0, 1:] for n in range(nbest)]]
-                else:
-                    aws += [[complete[n]['aws'][1:] for n in range(nbest)]]
-                scores += [[complete[n]['scores'][1:] for n in range(nbest)]]
-            # scores += [[complete[n]['score_raw'] for n in range(nbest)]]
+                nbest_hyps += [[complete[b][n]['hyp'] for n in range(nbest_b)]]
+                if return_aws:
+                    aws += [[complete[b][n]['aws'] for n in range(nbest_b)]]
+                scores += [[complete[b][n]['scores'] for n in range(nbest_b)]]
 
             # Check <eos>
-            eos_flag = [True if complete[n]['hyp'][-1] == eos else False for n in range(nbest)]
+            eos_flag = [True if complete[b][n]['hyp'][-1] == eos else False for n in range(nbest_b)]
             eos_flags.append(eos_flag)
 
             if id2token is not None:
                 if refs is not None:
                     logger.info('Ref: %s' % refs[b].lower())
-                for n in range(nbest):
-                    logger.info('Hyp: %s' % id2token(nbest_hyps[0][n]))
+                for n in range(nbest_b):
+                    logger.info('Hyp: %s' % id2token(nbest_hyps[b][n]))
             if refs is not None:
                 logger.info('log prob (ref): ')
-            for n in range(nbest):
-                logger.info('log prob (hyp): %.3f' % complete[n]['score'])
-                logger.info('log prob (hyp, raw): %.3f' % complete[n]['score_raw'])
-
-        # Concatenate in L dimension
-        for b in range(len(aws)):
-            for n in range(nbest):
-                aws[b][n] = tensor2np(torch.stack(aws[b][n], dim=1).squeeze(0))
+            for n in range(nbest_b):
+                logger.info('log prob (hyp): %.3f' % complete[b][n]['score'])
+                logger.info('log prob (hyp, raw): %.3f' % complete[b][n]['score_raw'])
 
         # Exclude <eos> (<sos> in case of the backward decoder)
         if exclude_eos:
             if self.backward:
                 nbest_hyps = [[nbest_hyps[b][n][1:] if eos_flags[b][n]
-                               else nbest_hyps[b][n] for n in range(nbest)] for b in range(bs)]
+                               else nbest_hyps[b][n] for n in range(len(eos_flags[b]))] for b in range(bs)]
             else:
                 nbest_hyps = [[nbest_hyps[b][n][:-1] if eos_flags[b][n]
-                               else nbest_hyps[b][n] for n in range(nbest)] for b in range(bs)]
+                               else nbest_hyps[b][n] for n in range(len(eos_flags[b]))] for b in range(bs)]
 
+        if not return_aws:
+            aws = None
         return nbest_hyps, aws, scores
 
-    def decode_ctc(self, eouts, x_lens, beam_width=1, rnnlm=None):
+    def _make_hyp(self, i, elen, ys_hist, bps_hist, scores_hist, aws_hist, score, score_raw):
+        """Trace back the i-th hypothesis at the last step in the mini-batch of beam search.
+
+        Args:
+            i (int): index in `[B * beam_width]`
+            elen (int): the length of encoder outputs
+            ys_hist (list): A list of length `[L]`, which contains arrays of size `[B * beam_width]`
+            bps_hist (list): A list of length `[L]`, which contains arrays of size `[B * beam_width]`
+            scores_hist (list): A list of length `[L]`, which contains arrays of size `[B * beam_width]`
+            aws_hist (list): A list of length `[L]`, which contains `[B * beam_width, (nheads), T]`
+                (None if attention weights are not kept)
+            score (float):
+            score_raw (float):
+        Returns:
+            hyp (dict):
+
+        """
+        ids = []
+        for bps in bps_hist[::-1]:
+            ids.append(i)
+            i = bps[i]
+        ids = ids[::-1]
+
+        aws = None
+        if aws_hist is not None:
+            aws = torch.stack([a[j] for a, j in zip(aws_hist, ids)], dim=0)
+            if self.score.nheads > 1:
+                aws = aws[:, 0]
+            aws = tensor2np(aws[:, :elen])
+        return {'hyp': np.array([ys[j] for ys, j in zip(ys_hist, ids)], dtype=np.int64),
+                'scores': [float(scores[j]) for scores, j in zip(scores_hist, ids)],
+                'aws': aws,
+                'score': float(score),
+                'score_raw': float(score_raw)}
+
+    def decode_ctc(self, eouts, x_lens, beam_width=1, rnnlm=None,
+                   rnnlm_weight=0., length_penalty=0., ngram=None, ngram_weight=0.,
+                   log_probs=None):
         """Decoding by the CTC layer in the inference stage.
 
             This is only used for Joint CTC-Attention model.
         Args:
             eouts (FloatTensor): `[B, T, enc_units]`
             beam_width (int): the size of beam
-            rnnlm ():
+            rnnlm (RNNLM):
+            rnnlm_weight (float): the weight of RNNLM score
+            length_penalty (float): insertion bonus
+            ngram (NgramScorer): n-gram LM for shallow fusion
+            ngram_weight (float): the weight of n-gram LM score
+            log_probs (FloatTensor): precomputed CTC log-posteriors `[B, T, vocab]`
         Returns:
             best_hyps (list): A list of length `[B]`, which contains arrays of size `[L]`
 
         """
-        logits_ctc = self.output_ctc(eouts)
+        if log_probs is None:
+            log_probs = F.log_softmax(self.output_ctc(eouts), dim=-1)
         if beam_width == 1:
-            best_hyps = self.decode_ctc_greedy(tensor2np(logits_ctc), x_lens)
+            # NOTE: the argmax of log-posteriors is the same as that of logits
+            best_hyps = self.decode_ctc_greedy(tensor2np(log_probs), x_lens)
         else:
-            best_hyps = self.decode_ctc_beam(F.log_softmax(logits_ctc, dim=-1),
-                                             x_lens, beam_width, rnnlm)
-            # TODO(hirofumi): decoding paramters
+            best_hyps = self.decode_ctc_beam(log_probs,
+                                             x_lens, beam_width, rnnlm,
+                                             rnnlm_weight, length_penalty,
+                                             ngram, ngram_weight)
 
         return best_hyps
 
+    def skip_blank_frames(self, eouts, elens, threshold, min_frames=1, merge=False, log_probs=None):
+        """Remove encoder outputs which the CTC layer assigns to blank with high confidence.
+
+            Attention in the following decoding works over the shorter encoder outputs,
+            so returned attention weights are also over the remaining frames.
+        Args:
+            eouts (FloatTensor): `[B, T, enc_units]`
+            elens (list): A list of length `[B]`
+            threshold (float): frames whose blank posterior is not less than this value are removed
+            min_frames (int): keep at least this number of frames (at least 1) per utterance,
+                which are the frames with the lowest blank posteriors
+            merge (bool): replace each run of removed frames with the average of them
+                instead of dropping the run
+            log_probs (FloatTensor): precomputed CTC log-posteriors `[B, T, vocab]`
+        Returns:
+            eouts (FloatTensor): `[B, T', enc_units]`
+            elens (list): A list of length `[B]`
+
+        """
+        if log_probs is None:
+            log_probs = F.log_softmax(self.output_ctc(eouts), dim=-1)
+        blank_probs = tensor2np(log_probs[:, :, 0].exp())
+        # NOTE: index 0 is reserved for blank
+
+        eouts_skip, elens_skip = [], []
+        for b in range(eouts.size(0)):
+            keep = blank_probs[b, :elens[b]] < threshold
+            # NOTE: attention needs at least one frame
+            n_min = min(max(min_frames, 1), elens[b])
+            if keep.sum() < n_min:
+                keep[np.argsort(blank_probs[b, :elens[b]], kind='mergesort')[:n_min]] = True
+
+            if merge:
+                # A segment starts at each kept frame and at the first frame of each removed run
+                is_start = keep | np.concatenate([[True], keep[:-1]])
+                seg_ids = eouts.new_tensor(np.cumsum(is_start) - 1).long()
+                nsegs = int(is_start.sum())
+                eouts_b = eouts.new_zeros(nsegs, eouts.size(2)).index_add_(0, seg_ids, eouts[b, :elens[b]])
+                counts = eouts.new_zeros(nsegs).index_add_(0, seg_ids, eouts.new_ones(elens[b]))
+                eouts_b = eouts_b / counts.unsqueeze(1)
+            else:
+                eouts_b = eouts[b].index_select(0, eouts.new_tensor(np.nonzero(keep)[0]).long())
+            eouts_skip.append(eouts_b)
+            elens_skip.append(eouts_b.size(0))
+
+        logger.debug('blank skipping: %d -> %d frames' % (sum(elens), sum(elens_skip)))
+        return pad_list(eouts_skip, 0.), elens_skip
+
+    def make_shortlist(self, ctc_log_probs, elens, threshold, nfrequent, eos, beam_width=1):
+        """Make vocabulary shortlists of utterances from CTC posteriors.
+
+            Tokens of each utterance are those whose CTC posterior exceeds the threshold at any frame,
+            the most frequent tokens (token indices are assumed to be sorted by frequency) and <eos>.
+            The output layer is computed for the union of shortlists in the mini-batch.
+        Args:
+            ctc_log_probs (FloatTensor): `[B, T, vocab]`
+            elens (list): A list of length `[B]`
+            threshold (float):
+            nfrequent (int): the number of the most frequent tokens
+            eos (int): the index of <eos>
+            beam_width (int): the number of hypotheses per utterance
+        Returns:
+            shortlist (dict):
+                ids (LongTensor): token indices of the union of shortlists `[S]`
+                weight (FloatTensor): rows of the output layer `[S, nunits]`
+                bias (FloatTensor): `[S]` (None if the output layer has no bias)
+                mask (FloatTensor): 0 for tokens in the shortlist of each hypothesis, otherwise -inf
+                    `[B * beam_width, S]`
+                norm_out (FloatTensor): the maximum norm of rows of tokens out of the shortlist
+                    `[B * beam_width]`
+                weight_max_out (FloatTensor): the maximum of each dimension over rows of tokens out of
+                    the shortlist `[B * beam_width, nunits]`
+                weight_min_out (FloatTensor): the minimum of each dimension over rows of tokens out of
+                    the shortlist `[B * beam_width, nunits]`
+                bias_out (FloatTensor): the maximum bias of tokens out of the shortlist `[B * beam_width]`
+                log_nout (FloatTensor): log of the number of tokens out of the shortlist `[B * beam_width]`
+                vocab (int):
+
+        """
+        bs, _, vocab = ctc_log_probs.size()
+        max_probs = torch.stack([ctc_log_probs[b, :elens[b]].max(0)[0] for b in range(bs)], dim=0).exp()
+        in_list = (max_probs > threshold).float()  # `[B, vocab]`
+        in_list[:, 0] = 0
+        # NOTE: index 0 is reserved for blank
+        in_list[:, :nfrequent] = 1
+        in_list[:, eos] = 1
+        ids = torch.nonzero(in_list.max(0)[0] > 0).view(-1)
+
+        weight = self.output.fc.weight
+        bias = self.output.fc.bias
+        out_list = (1 - in_list) > 0
+        # NOTE: these bounds are ignored when all tokens are in the shortlist (log_nout = -inf)
+        norm_out = weight.norm(p=2, dim=1).unsqueeze(0).expand(bs, vocab).masked_fill(out_list == 0, 0).max(1)[0]
+        bias_out = norm_out.new_zeros(bs)
+        if bias is not None and out_list.sum() > 0:
+            bias_out = bias.unsqueeze(0).expand(bs, vocab).masked_fill(out_list == 0, -float('inf')).max(1)[0]
+            bias_out = bias_out.masked_fill(bias_out == -float('inf'), 0)
+        log_nout = out_list.float().sum(1).log()
+        weight_max_out = weight.new_zeros(bs, weight.size(1))
+        weight_min_out = weight.new_zeros(bs, weight.size(1))
+        for b in range(bs):
+            if out_list[b].sum() > 0:
+                weight_out = weight[out_list[b]]
+                weight_max_out[b] = weight_out.max(0)[0]
+                weight_min_out[b] = weight_out.min(0)[0]
+
+        def expand(x):
+            # `[B, ...]` -> `[B * beam_width, ...]`
+            return x.unsqueeze(1).expand(*((bs, beam_width) + x.size()[1:])).contiguous().view(
+                *((bs * beam_width,) + x.size()[1:]))
+
+        in_list = in_list.index_select(1, ids)
+        mask = torch.zeros_like(in_list).masked_fill_(in_list == 0, -float('inf'))
+        return {'ids': ids,
+                'weight': weight.index_select(0, ids),
+                'bias': bias.index_select(0, ids) if bias is not None else None,
+                'mask': expand(mask),
+                'norm_out': expand(norm_out),
+                'weight_max_out': expand(weight_max_out),
+                'weight_min_out': expand(weight_min_out),
+                'bias_out': expand(bias_out),
+                'log_nout': expand(log_nout),
+                'vocab': vocab}
+
+    def shortlist_log_softmax(self, attentional, shortlist, max_error):
+        """Log-probabilities over the vocabulary computed only for tokens in the shortlist.
+
+            Tokens out of the shortlist get -inf. Renormalizing within the shortlist overestimates
+            log-probabilities by log(1 + Z_out / Z_in), where Z_in and Z_out are the partition functions
+            within and out of the shortlist. Z_out is bounded by the number of tokens times the exponent
+            of the maximum logit out of the shortlist, which is bounded by the minimum of |h| * max|w| and
+            sum_d max(h_d * max_w w_d, h_d * min_w w_d), plus max(b). The full softmax is used for
+            hypotheses whose bound of the error exceeds max_error.
+        Args:
+            attentional (FloatTensor): `[B * beam_width, nunits]`
+            shortlist (dict): outputs of make_shortlist()
+            max_error (float): the maximum error of log-probabilities
+        Returns:
+            log_probs (FloatTensor): `[B * beam_width, vocab]`
+            is_fallback (ByteTensor): 1 for hypotheses with the full softmax `[B * beam_width]`
+
+        """
+        logits = torch.matmul(attentional, shortlist['weight'].t())
+        if shortlist['bias'] is not None:
+            logits += shortlist['bias']
+        logits += shortlist['mask']
+        log_z_in = torch.logsumexp(logits, dim=1)
+        logit_out_max = torch.min(
+            attentional.norm(p=2, dim=1) * shortlist['norm_out'],
+            (attentional.clamp(min=0) * shortlist['weight_max_out'] +
+             attentional.clamp(max=0) * shortlist['weight_min_out']).sum(1)) + shortlist['bias_out']
+        error = F.softplus(shortlist['log_nout'] + logit_out_max - log_z_in)
+        is_fallback = error > max_error
+
+        log_probs = logits.new_full((logits.size(0), shortlist['vocab']), -float('inf'))
+        log_probs.scatter_(1, shortlist['ids'].unsqueeze(0).expand_as(logits), logits - log_z_in.unsqueeze(1))
+        if is_fallback.any():
+            log_probs = torch.where(is_fallback.unsqueeze(1).expand_as(log_probs),
+                                    F.log_softmax(self.output(attentional), dim=1), log_probs)
+        return log_probs, is_fallback
+
     def ctc_posteriors(self, eouts, x_lens, temperature, topk):
         # Path through the softmax layer
         logits_ctc = self.output_ctc(eouts)
@@ -1037,3 +1577,22 @@ class Decoder(nn.Module):
             topk = ctc_probs.size(-1)
         _, indices_topk = torch.topk(ctc_probs.sum(1), k=topk, dim=-1, largest=True, sorted=True)
         return tensor2np(ctc_probs), tensor2np(indices_topk)
+
+
+def select_state(state, ids):
+    """Select RNN states along the batch dimension.
+
+    Args:
+        state (tuple): A tuple of (hx_list, cx_list)
+            hx_list (list of FloatTensor):
+            cx_list (list of FloatTensor):
+        ids (LongTensor): `[B']`
+    Returns:
+        state (tuple): A tuple of (hx_list, cx_list)
+
+    """
+    hx_list, cx_list = state
+    hx_list = [h.index_select(0, ids) for h in hx_list]
+    if cx_list is not None:
+        cx_list = [c.index_select(0, ids) for c in cx_list]
+    return (hx_list, cx_list)
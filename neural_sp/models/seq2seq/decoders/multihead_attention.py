@@ -15,6 +15,7 @@ import torch.nn as nn
 import torch.nn.functional as F
 
 from neural_sp.models.linear import LinearND
+from neural_sp.models.seq2seq.decoders.attention import window_indices
 
 
 class MultiheadAttentionMechanism(nn.Module):
@@ -56,53 +57,53 @@ class MultiheadAttentionMechanism(nn.Module):
         self.attn_dim = attn_dim
         self.sharpening_factor = sharpening_factor
         self.sigmoid_smoothing = sigmoid_smoothing
+        self.conv_kernel_size = conv_kernel_size
         self.nheads = nheads
         self.enc_out_a = None
         self.mask = None
 
         # attention dropout applied AFTER the softmax layer
         if dropout > 0:
-            self.dropout = nn.ModuleList([nn.Dropout(p=dropout)] * nheads)
+            self.dropout = nn.Dropout(p=dropout)
         else:
             self.dropout = None
 
+        # NOTE: projections of all heads are stacked along the output dimension
+        # so that energies of all heads are computed with a single matmul.
+        # Head-wise projections (w_conv, v) are implemented as grouped 1x1 convolutions.
         if attn_type == 'add':
-            self.w_enc = nn.ModuleList([LinearND(enc_nunits, attn_dim)] * nheads)
-            self.w_dec = nn.ModuleList([LinearND(dec_nunits, attn_dim, bias=False)] * nheads)
-            self.v = nn.ModuleList([LinearND(attn_dim, 1, bias=False)] * nheads)
+            self.w_enc = LinearND(enc_nunits, attn_dim * nheads)
+            self.w_dec = LinearND(dec_nunits, attn_dim * nheads, bias=False)
+            self.v = nn.Conv1d(attn_dim * nheads, nheads, kernel_size=1, groups=nheads, bias=False)
 
         elif attn_type == 'location':
-            self.w_enc = nn.ModuleList([LinearND(enc_nunits, attn_dim)] * nheads)
-            self.w_dec = nn.ModuleList([LinearND(dec_nunits, attn_dim, bias=False)] * nheads)
-            self.w_conv = nn.ModuleList([LinearND(conv_out_channels, attn_dim, bias=False)] * nheads)
-            # self.conv = nn.ModuleList([nn.Conv1d(in_channels=1,
-            #                                       out_channels=conv_out_channels,
-            #                                       kernel_size=conv_kernel_size * 2 + 1,
-            #                                       stride=1,
-            #                                       padding=conv_kernel_size,
-            #                                       bias=False) for _ in range(nheads)] * nheads)
-            self.conv = nn.ModuleList([nn.Conv2d(in_channels=1,
-                                                 out_channels=conv_out_channels,
-                                                 kernel_size=(1, conv_kernel_size * 2 + 1),
-                                                 stride=1,
-                                                 padding=(0, conv_kernel_size),
-                                                 bias=False) for _ in range(nheads)] * nheads)
-            self.v = nn.ModuleList([LinearND(attn_dim, 1, bias=False)] * nheads)
+            self.w_enc = LinearND(enc_nunits, attn_dim * nheads)
+            self.w_dec = LinearND(dec_nunits, attn_dim * nheads, bias=False)
+            self.w_conv = nn.Conv1d(conv_out_channels * nheads, attn_dim * nheads,
+                                    kernel_size=1, groups=nheads, bias=False)
+            self.conv = nn.Conv2d(in_channels=nheads,
+                                  out_channels=conv_out_channels * nheads,
+                                  kernel_size=(1, conv_kernel_size * 2 + 1),
+                                  stride=1,
+                                  padding=(0, conv_kernel_size),
+                                  groups=nheads,
+                                  bias=False)
+            self.v = nn.Conv1d(attn_dim * nheads, nheads, kernel_size=1, groups=nheads, bias=False)
 
         elif attn_type == 'dot':
-            self.w_enc = nn.ModuleList([LinearND(enc_nunits, attn_dim, bias=False)] * nheads)
-            self.w_dec = nn.ModuleList([LinearND(dec_nunits, attn_dim, bias=False)] * nheads)
+            self.w_enc = LinearND(enc_nunits, attn_dim * nheads, bias=False)
+            self.w_dec = LinearND(dec_nunits, attn_dim * nheads, bias=False)
 
         elif attn_type == 'luong_dot':
             pass
             # NOTE: no additional parameters
 
         elif attn_type == 'luong_general':
-            self.w_enc = nn.ModuleList([LinearND(enc_nunits, dec_nunits, bias=False)] * nheads)
+            self.w_enc = LinearND(enc_nunits, dec_nunits * nheads, bias=False)
 
         elif attn_type == 'luong_concat':
-            self.w = nn.ModuleList([LinearND(enc_nunits + dec_nunits, attn_dim, bias=False)] * nheads)
-            self.v = nn.ModuleList([LinearND(attn_dim, 1, bias=False)] * nheads)
+            self.w = LinearND(enc_nunits + dec_nunits, attn_dim * nheads, bias=False)
+            self.v = nn.Conv1d(attn_dim * nheads, nheads, kernel_size=1, groups=nheads, bias=False)
 
         else:
             raise ValueError(attn_type)
@@ -113,82 +114,111 @@ class MultiheadAttentionMechanism(nn.Module):
         self.enc_out_a = None
         self.mask = None
 
-    def forward(self, enc_out, x_lens, dec_out, aw_step):
+    def forward(self, enc_out, x_lens, dec_out, aw_step, window=0):
         """Forward computation.
 
         Args:
             enc_out (FloatTensor): `[B, T, enc_units]`
             x_lens (list): A list of length `[B]`
             dec_out (FloatTensor): `[B, 1, dec_units]`
-            aw_step (FloatTensor): `[B, T, nheads]`
+            aw_step (FloatTensor): `[B, nheads, T]`
+            window (int): if larger than 0, restrict scoring to encoder frames
+                within `window` frames around the peak of the previous attention
+                weights averaged over heads (inference only). The first step always attends to all frames.
         Returns:
             context (FloatTensor): `[B, 1, enc_units]`
-            aw_step (FloatTensor): `[nheads, B, T]`
+            aw_step (FloatTensor): `[B, nheads, T]`
 
         """
         bs, enc_time = enc_out.size()[:2]
 
-        if aw_step is None:
-            aw_step = enc_out.new_ones(self.nheads, bs, enc_time)
-
         # Pre-computation of encoder-side features for computing scores
         if self.enc_out_a is None:
             if self.attn_type in ['add', 'location', 'dot', 'luong_general']:
-                self.enc_out_a = [self.w_enc[h](enc_out) for h in range(self.nheads)]
+                self.enc_out_a = self.w_enc(enc_out)  # `[B, T, nheads * attn_dim]`
 
         # Mask attention distribution
         if self.mask is None:
-            self.mask = enc_out.new_ones(bs, enc_time)
+            self.mask = enc_out.new_ones(bs, 1, enc_time)
             for b in range(bs):
                 if x_lens[b] < enc_time:
-                    self.mask[b, x_lens[b]:] = 0
-            # TODO(hirofumi): prepare mask per attention
-
-        # Compute per head
-        contexts = []
-        aw_steps = []
-        for h in range(self.nheads):
-            if self.attn_type == 'add':
-                dec_out_h = dec_out.expand_as(torch.zeros((bs, enc_time, dec_out.size(2))))
-                energy_h = self.v[h](F.tanh(self.enc_out_a[h] + self.w_dec[h](dec_out_h))).squeeze(2)
-
-            elif self.attn_type == 'location':
-                dec_out_h = dec_out.expand_as(torch.zeros((bs, enc_time, dec_out.size(2))))
-                # For 1D conv
-                # conv_feat = self.conv[h](aw_step[h][:, :].contiguous().unsqueeze(1))
-                # For 2D conv
-                conv_feat_h = self.conv[h](aw_step[h].view(bs, 1, 1, enc_time)
-                                           ).squeeze(2)  # `[B, conv_out_channels, T]`
-                conv_feat_h = conv_feat_h.transpose(1, 2).contiguous()  # `[B, T, conv_out_channels]`
-                energy_h = self.v[h](F.tanh(self.enc_out_a[h] + self.w_dec[h]
-                                            (dec_out_h) + self.w_conv[h](conv_feat_h))).squeeze(2)
-
-            elif self.attn_type == 'dot':
-                energy_h = torch.matmul(self.enc_out_a[h], self.w_dec[h](dec_out).transpose(-2, -1)).squeeze(2)
-
-            elif self.attn_type == 'luong_dot':
-                energy_h = torch.matmul(enc_out, dec_out.transpose(-2, -1)).squeeze(2)
-
-            elif self.attn_type == 'luong_general':
-                energy_h = torch.matmul(self.enc_out_a[h], dec_out.transpose(-2, -1)).squeeze(2)
-
-            elif self.attn_type == 'luong_concat':
-                dec_out_h = dec_out.expand_as(torch.zeros((bs, enc_time, dec_out.size(2))))
-                energy_h = self.v[h](F.tanh(self.w[h](torch.cat([enc_out, dec_out_h], dim=-1)))).squeeze(2)
-
-            # Compute attention weights
-            energy_h = energy_h.masked_fill_(self.mask == 0, -float('inf'))  # `[B, T]`
-            if self.sigmoid_smoothing:
-                aw_step_h = F.sigmoid(energy_h) / F.sigmoid(energy_h).sum(-1).unsqueeze(-1)
-            else:
-                aw_step_h = F.softmax(energy_h * self.sharpening_factor, dim=-1)  # `[B, T]`
-            # attention dropout
-            if self.dropout is not None:
-                aw_step_h = self.dropout[h](aw_step_h)
-            aw_steps.append(aw_step_h)
+                    self.mask[b, :, x_lens[b]:] = 0
 
-            # Compute context vector (weighted sum of encoder outputs)
-            context = torch.matmul(aw_step[h].unsqueeze(1), enc_out)
-            contexts.append(context)
+        if aw_step is None:
+            aw_step = enc_out.new_zeros(bs, self.nheads, enc_time)
+            window = 0
+
+        if window > 0 and 2 * window + 1 < enc_time:
+            # Gather frames around the peak of each utterance (or hypothesis), which is shared by heads
+            # NOTE: the size of windows is fixed, so that no host synchronization is required
+            peaks = aw_step.sum(1).argmax(-1)  # `[B]`
+            ids, valid = window_indices(peaks, window, enc_time)  # `[B, W]`
+            enc_out_w = enc_out.gather(1, ids.unsqueeze(2).expand(-1, -1, enc_out.size(2)))
+            if self.enc_out_a is not None:
+                enc_out_a_w = self.enc_out_a.gather(1, ids.unsqueeze(2).expand(-1, -1, self.enc_out_a.size(2)))
+            mask = self.mask.gather(2, ids.unsqueeze(1)) * valid.unsqueeze(1)
+        else:
+            window = 0
+            enc_out_w, enc_out_a_w, mask = enc_out, self.enc_out_a, self.mask
+        win_time = enc_out_w.size(1)
+
+        # Compute energies of all heads at once
+        if self.attn_type == 'add':
+            feat = torch.tanh(enc_out_a_w + self.w_dec(dec_out))  # `[B, T, nheads * attn_dim]`
+            energy = self.v(feat.transpose(1, 2))  # `[B, nheads, T]`
+
+        elif self.attn_type == 'location':
+            # For 2D conv (head-wise by groups)
+            if window > 0:
+                # NOTE: convolve weights around the window as well so that the
+                # features inside the window are identical to the full computation
+                ids_conv, valid_conv = window_indices(peaks, window, enc_time, margin=self.conv_kernel_size)
+                aw_conv = aw_step.gather(2, ids_conv.unsqueeze(1).expand(-1, self.nheads, -1)) * valid_conv.unsqueeze(1)
+                conv_feat = self.conv(aw_conv.unsqueeze(2)).squeeze(2)
+                conv_feat = conv_feat[:, :, self.conv_kernel_size:self.conv_kernel_size + win_time]
+            else:
+                conv_feat = self.conv(aw_step.unsqueeze(2)).squeeze(2)  # `[B, nheads * conv_out_channels, T]`
+            conv_feat = self.w_conv(conv_feat).transpose(1, 2)  # `[B, T, nheads * attn_dim]`
+            feat = torch.tanh(enc_out_a_w + self.w_dec(dec_out) + conv_feat)
+            energy = self.v(feat.transpose(1, 2))  # `[B, nheads, T]`
+
+        elif self.attn_type == 'dot':
+            enc_out_a = enc_out_a_w.view(bs, win_time, self.nheads, -1).transpose(1, 2)  # `[B, nheads, T, attn_dim]`
+            dec_out_a = self.w_dec(dec_out).view(bs, self.nheads, -1, 1)  # `[B, nheads, attn_dim, 1]`
+            energy = torch.matmul(enc_out_a, dec_out_a).squeeze(3)
+
+        elif self.attn_type == 'luong_dot':
+            energy = torch.matmul(enc_out_w, dec_out.transpose(-2, -1)).transpose(1, 2)  # `[B, 1, T]`
+            energy = energy.expand(bs, self.nheads, win_time).contiguous()
+
+        elif self.attn_type == 'luong_general':
+            enc_out_a = enc_out_a_w.view(bs, win_time, self.nheads, -1).transpose(1, 2)  # `[B, nheads, T, dec_units]`
+            energy = torch.matmul(enc_out_a, dec_out.transpose(-2, -1).unsqueeze(1)).squeeze(3)
+
+        elif self.attn_type == 'luong_concat':
+            dec_out = dec_out.expand(bs, win_time, dec_out.size(2))
+            feat = torch.tanh(self.w(torch.cat([enc_out_w, dec_out], dim=-1)))
+            energy = self.v(feat.transpose(1, 2))  # `[B, nheads, T]`
+
+        # Compute attention weights
+        energy = energy.masked_fill_(mask == 0, -float('inf'))  # `[B, nheads, T]`
+        if self.sigmoid_smoothing:
+            aw_w = F.sigmoid(energy) / F.sigmoid(energy).sum(-1).unsqueeze(-1)
+        else:
+            aw_w = F.softmax(energy * self.sharpening_factor, dim=-1)  # `[B, nheads, T]`
+        # attention dropout
+        if self.dropout is not None:
+            aw_w = self.dropout(aw_w)
+
+        # Compute context vectors of all heads (weighted sum of encoder outputs)
+        context = torch.matmul(aw_w, enc_out_w)  # `[B, nheads, enc_units]`
+        context = context.view(bs, 1, -1)  # `[B, 1, nheads * enc_units]`
+
+        if window > 0:
+            # NOTE: weights of frames outside the encoder outputs are 0
+            aw_step = enc_out.new_zeros(bs, self.nheads, enc_time).scatter_add_(
+                2, ids.unsqueeze(1).expand(-1, self.nheads, -1), aw_w)
+        else:
+            aw_step = aw_w
 
-        return self.w_out(torch.cat(contexts, dim=-1)), torch.stack(aw_steps, dim=0)
+        return self.w_out(context), aw_step
@@ -0,0 +1,98 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""On-disk cache of encoder outputs and CTC log-posteriors."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import codecs
+import hashlib
+import numpy as np
+import os
+
+
+class EncoderCache(object):
+    """Cache of encoder outputs and CTC log-posteriors of each utterance.
+
+        Encoder outputs only depend on the checkpoint, so they are shared by any decoding parameters.
+        Arrays are saved as .npy files in a directory keyed by the model path and the epoch,
+        and loaded as memory-mapped arrays.
+
+    Args:
+        cache_dir (str): root directory of caches
+        model_path (str): path to the model
+        epoch (int): the epoch of the checkpoint
+
+    """
+
+    def __init__(self, cache_dir, model_path, epoch):
+        key = '%s:%d' % (os.path.abspath(model_path), epoch)
+        self.cache_dir = os.path.join(cache_dir, hashlib.sha1(key.encode('utf-8')).hexdigest()[:16])
+        if not os.path.isdir(self.cache_dir):
+            try:
+                os.makedirs(self.cache_dir)
+            except OSError:
+                # Created by another process
+                pass
+            with codecs.open(os.path.join(self.cache_dir, 'model.txt'), 'w', 'utf-8') as f:
+                f.write(key + '\n')
+
+        self.hits = 0
+        self.queries = 0
+
+    def _path(self, utt_id, task, name):
+        if isinstance(utt_id, bytes):
+            utt_id = utt_id.decode('utf-8')
+        return os.path.join(self.cache_dir, task, utt_id.replace('/', '_') + '.' + name + '.npy')
+
+    def load(self, utt_id, task):
+        """Load cached arrays of an utterance.
+
+        Args:
+            utt_id (str): the utterance ID
+            task (str): ys or ys_sub1 or ys_sub2
+        Returns:
+            eouts (np.ndarray): `[T, enc_units]` (None if not cached)
+            ctc_log_probs (np.ndarray): `[T, vocab]` (None if not cached)
+
+        """
+        self.queries += 1
+        path = self._path(utt_id, task, 'eouts')
+        if not os.path.isfile(path):
+            return None, None
+        self.hits += 1
+        eouts = np.load(path, mmap_mode='r')
+        path = self._path(utt_id, task, 'ctc')
+        ctc_log_probs = np.load(path, mmap_mode='r') if os.path.isfile(path) else None
+        return eouts, ctc_log_probs
+
+    def save(self, utt_id, task, eouts, ctc_log_probs=None):
+        """Save arrays of an utterance.
+
+        Args:
+            utt_id (str): the utterance ID
+            task (str): ys or ys_sub1 or ys_sub2
+            eouts (np.ndarray): `[T, enc_units]`
+            ctc_log_probs (np.ndarray): `[T, vocab]`
+
+        """
+        if not os.path.isdir(os.path.join(self.cache_dir, task)):
+            try:
+                os.makedirs(os.path.join(self.cache_dir, task))
+            except OSError:
+                pass
+        # NOTE: CTC log-posteriors are saved first because encoder outputs mark the entry as complete
+        if ctc_log_probs is not None:
+            self._save_atomic(self._path(utt_id, task, 'ctc'), ctc_log_probs)
+        self._save_atomic(self._path(utt_id, task, 'eouts'), eouts)
+
+    def _save_atomic(self, path, array):
+        tmp_path = path + '.tmp%d' % os.getpid()
+        with open(tmp_path, 'wb') as f:
+            np.save(f, np.ascontiguousarray(array, dtype=np.float32))
+        os.rename(tmp_path, path)
@@ -373,7 +373,11 @@ class RNNEncoder(nn.Module):
                             xs = torch.cat(xs, dim=0).transpose(0, 1)
 
                         # Update xlens
-                        xlens = [x.size(0) for x in xs]
+                        if self.subsample_type == 'drop':
+                            xlens = [max(1, (xlen - 2) // self.subsample[l] + 1) for xlen in xlens]
+                        else:
+                            xlens = [max(1, xlen // self.subsample[l]) for xlen in xlens]
+                        # NOTE: not the length of the padded mini-batch
 
                     # Projection layer
                     if self.nprojs > 0:
@@ -401,7 +405,7 @@ class RNNEncoder(nn.Module):
                             xs_lower = xs
                     # NOTE: Exclude residual connection from the raw inputs
 
-        if task == 'ys.ctc' and self.task_specific_layer:
+        if task in ['all', 'ys.ctc'] and self.task_specific_layer:
             self.rnn_top_ctc.flatten_parameters()
             xs_ctc = pack_padded_sequence(xs, xlens, batch_first=True)
             xs_ctc, _ = self.rnn_top_ctc(xs_ctc, hx=None)
@@ -14,6 +14,7 @@ import copy
 import logging
 import numpy as np
 import torch
+import torch.nn.functional as F
 
 from neural_sp.models.base import ModelBase
 from neural_sp.models.linear import Embedding
@@ -25,6 +26,7 @@ from neural_sp.models.seq2seq.encoders.rnn import RNNEncoder
 from neural_sp.models.seq2seq.encoders.splicing import splice
 from neural_sp.models.torch_utils import np2tensor
 from neural_sp.models.torch_utils import pad_list
+from neural_sp.models.torch_utils import tensor2np
 
 logger = logging.getLogger("training")
 
@@ -168,6 +170,10 @@ class Seq2seq(ModelBase):
                 args.focal_loss_gamma = 2.0
             if not hasattr(args, 'tie_embedding'):
                 args.tie_embedding = False
+            if not hasattr(args, 'adaptive_softmax'):
+                args.adaptive_softmax = False
+            if not hasattr(args, 'ctc_backend'):
+                args.ctc_backend = 'warpctc'
 
             # Decoder
             dec = Decoder(
@@ -201,6 +207,7 @@ class Seq2seq(ModelBase):
                 init_with_enc=args.init_with_enc,
                 ctc_weight=self.ctc_weight if dir == 'fwd' else 0,
                 ctc_fc_list=[int(fc) for fc in args.ctc_fc_list.split('_')] if len(args.ctc_fc_list) > 0 else [],
+                ctc_backend=args.ctc_backend,
                 input_feeding=args.input_feeding,
                 backward=(dir == 'bwd'),
                 rnnlm_cold_fusion=args.rnnlm_cold_fusion,
@@ -211,7 +218,8 @@ class Seq2seq(ModelBase):
                 share_lm_softmax=args.share_lm_softmax,
                 global_weight=self.main_weight - self.bwd_weight if dir == 'fwd' else self.bwd_weight,
                 mtl_per_batch=args.mtl_per_batch,
-                vocab_char=args.vocab_sub1)
+                vocab_char=args.vocab_sub1,
+                adaptive_softmax=args.adaptive_softmax)
             setattr(self, 'dec_' + dir, dec)
 
         # sub task (only for fwd)
@@ -250,6 +258,7 @@ class Seq2seq(ModelBase):
                     ctc_weight=getattr(self, 'ctc_weight_' + sub),
                     ctc_fc_list=[int(fc) for fc in getattr(args, 'ctc_fc_list_' + sub).split('_')
                                  ] if len(getattr(args, 'ctc_fc_list_' + sub)) > 0 else [],
+                    ctc_backend=args.ctc_backend,
                     input_feeding=args.input_feeding,
                     internal_lm=args.internal_lm,
                     lmobj_weight=getattr(args, 'lmobj_weight_' + sub),
@@ -268,6 +277,9 @@ class Seq2seq(ModelBase):
                                           dropout=args.dropout_emb,
                                           ignore_index=self.pad)
 
+        # Cache of encoder outputs for decoding (set in evaluation)
+        self.enc_cache = None
+
         # Initialize weight matrices
         self.init_weights(args.param_init, dist=args.param_init_dist, ignore_keys=['bias'])
 
@@ -306,21 +318,23 @@ class Seq2seq(ModelBase):
                 ys_sub2 (list): A list of lenght `[B]`, which contains arrays of size `[L_sub2]`
                 ys_sub3 (list): A list of lenght `[B]`, which contains arrays of size `[L_sub3]`
             reporter ():
-            task (str): all or ys or ys_sub1 or ys_sub2
+            task (str or list): all or ys or ys_sub1 or ys_sub2
+                If a list of tasks is given, losses of all tasks are computed with a single encoder pass
             is_eval (bool): the history will not be saved.
                 This should be used in inference model for memory efficiency.
         Returns:
-            loss (FloatTensor): `[1]`
+            loss (FloatTensor or list): `[1]` (a list of `[1]` per task)
             reporter ():
 
         """
+        _forward = self._forward_mtl if isinstance(task, list) else self._forward
         if is_eval:
             self.eval()
             with torch.no_grad():
-                loss, observation = self._forward(batch, task)
+                loss, observation = _forward(batch, task)
         else:
             self.train()
-            loss, observation = self._forward(batch, task)
+            loss, observation = _forward(batch, task)
 
         # Report here
         if reporter is not None:
@@ -328,20 +342,39 @@ class Seq2seq(ModelBase):
 
         return loss, reporter
 
-    def _forward(self, batch, task):
-        # Encode input features
+    def _forward_mtl(self, batch, tasks):
+        # Encode input features once for all tasks
         if self.input_type == 'speech':
-            if self.mtl_per_batch:
-                flip = True if 'bwd' in task else False
-                enc_outs, perm_ids = self.encode(batch['xs'], task, flip=flip)
-            else:
-                flip = True if self.bwd_weight == 1 else False
-                enc_outs, perm_ids = self.encode(batch['xs'], 'all', flip=flip)
+            enc_outs, perm_ids = self.encode(batch['xs'], 'all')
         else:
             enc_outs, perm_ids = self.encode(batch['ys_sub1'])
 
+        losses, observation = [], {}
+        for task in tasks:
+            if task == 'ys.bwd' and self.input_type == 'speech':
+                # NOTE: the backward decoder takes flipped acoustic features
+                loss, obs = self._forward(batch, task)
+            else:
+                loss, obs = self._forward(batch, task, enc_outs, perm_ids)
+            losses.append(loss)
+            observation.update(obs)
+        return losses, observation
+
+    def _forward(self, batch, task, enc_outs=None, perm_ids=None):
+        # Encode input features
+        if enc_outs is None:
+            if self.input_type == 'speech':
+                if self.mtl_per_batch:
+                    flip = True if 'bwd' in task else False
+                    enc_outs, perm_ids = self.encode(batch['xs'], task, flip=flip)
+                else:
+                    flip = True if self.bwd_weight == 1 else False
+                    enc_outs, perm_ids = self.encode(batch['xs'], 'all', flip=flip)
+            else:
+                enc_outs, perm_ids = self.encode(batch['ys_sub1'])
+
         observation = {}
-        loss = torch.zeros((1,), dtype=torch.float32).cuda(self.device_id)
+        loss = np2tensor(np.zeros((1,), dtype=np.float32), self.device_id)
 
         # Compute XE loss for the forward decoder
         if self.fwd_weight > 0 and task in ['all', 'ys', 'ys.ctc', 'ys.lmobj']:
@@ -443,7 +476,7 @@ class Seq2seq(ModelBase):
                 xlens = [len(x) for x in xs]
                 # Flip acoustic features in the reverse order
                 if flip:
-                    xs = [torch.from_numpy(np.flip(x, axis=0).copy()).float().cuda(self.device_id) for x in xs]
+                    xs = [np2tensor(np.flip(x, axis=0).copy(), self.device_id).float() for x in xs]
                 else:
                     xs = [np2tensor(x, self.device_id).float() for x in xs]
                 xs = pad_list(xs)
@@ -471,28 +504,78 @@ class Seq2seq(ModelBase):
 
             return enc_outs, perm_ids
 
+    def encode_cached(self, xs, utt_ids, task='ys'):
+        """Encode acoustic features, reusing encoder outputs in `self.enc_cache`.
+
+            Only utterances missing in the cache are encoded, and their encoder outputs
+            and CTC log-posteriors are saved to the cache.
+        Args:
+            xs (list): A list of length `[B]`, which contains arrays of size `[T, input_dim]`
+            utt_ids (list): A list of length `[B]`
+            task (str): ys or ys_sub1 or ys_sub2
+        Returns:
+            enc_outs (dict): the same as in encode(), and CTC log-posteriors `[B, T, vocab]`
+                in enc_outs[task]['ctc_log_probs'] if the model has the CTC layer
+            perm_ids (list): A list of length `[B]`
+
+        """
+        # Sort by lenghts in the descending order as in encode()
+        perm_ids = sorted(list(range(0, len(xs), 1)),
+                          key=lambda i: len(xs[i]), reverse=True)
+        cached = [self.enc_cache.load(utt_ids[i], task) for i in perm_ids]
+
+        misses = [j for j in range(len(xs)) if cached[j][0] is None]
+        if len(misses) > 0:
+            enc_outs, perm_ids_miss = self.encode([xs[perm_ids[j]] for j in misses], task)
+            eouts, elens = enc_outs[task]['xs'], enc_outs[task]['xlens']
+            dec = getattr(self, 'dec_' + self._get_dir(task))
+            ctc_log_probs = None
+            if hasattr(dec, 'output_ctc'):
+                ctc_log_probs = tensor2np(F.log_softmax(dec.output_ctc(eouts), dim=-1))
+            eouts = tensor2np(eouts)
+            for k, j in enumerate(perm_ids_miss):
+                j = misses[j]
+                cached[j] = (eouts[k, :elens[k]],
+                             ctc_log_probs[k, :elens[k]] if ctc_log_probs is not None else None)
+                self.enc_cache.save(utt_ids[perm_ids[j]], task, cached[j][0], cached[j][1])
+
+        elens = [len(eouts) for eouts, _ in cached]
+        eouts = pad_list([np2tensor(np.array(eouts), self.device_id).float() for eouts, _ in cached], 0.)
+        enc_outs = {task: {'xs': eouts, 'xlens': elens}}
+        if all(ctc_log_probs is not None for _, ctc_log_probs in cached):
+            enc_outs[task]['ctc_log_probs'] = pad_list(
+                [np2tensor(np.array(ctc_log_probs), self.device_id).float() for _, ctc_log_probs in cached], 0.)
+        return enc_outs, perm_ids
+
+    def _get_dir(self, task):
+        dir = 'fwd' if self.fwd_weight >= self.bwd_weight else 'bwd'
+        if task == 'ys_sub1':
+            dir += '_sub1'
+        elif task == 'ys_sub2':
+            dir += '_sub2'
+        return dir
+
     def get_ctc_posteriors(self, xs, task='ys', temperature=1, topk=None):
         self.eval()
         with torch.no_grad():
             enc_outs, perm_ids = self.encode(xs, task)
-            dir = 'fwd' if self.fwd_weight >= self.bwd_weight else 'bwd'
-            if task == 'ys_sub1':
-                dir += '_sub1'
-            elif task == 'ys_sub2':
-                dir += '_sub2'
-
-            if task == 'ys':
-                assert self.ctc_weight > 0
-            elif task == 'ys_sub1':
-                assert self.ctc_weight_sub1 > 0
-            elif task == 'ys_sub2':
-                assert self.ctc_weight_sub2 > 0
-            ctc_probs, indices_topk = getattr(self, 'dec_' + dir).ctc_posteriors(
-                enc_outs[task]['xs'], enc_outs[task]['xlens'], temperature, topk)
-            return ctc_probs, indices_topk, enc_outs[task]['xlens']
+            return self._get_ctc_posteriors(enc_outs, task, temperature, topk)
+
+    def _get_ctc_posteriors(self, enc_outs, task, temperature, topk):
+        dir = self._get_dir(task)
+
+        if task == 'ys':
+            assert self.ctc_weight > 0
+        elif task == 'ys_sub1':
+            assert self.ctc_weight_sub1 > 0
+        elif task == 'ys_sub2':
+            assert self.ctc_weight_sub2 > 0
+        ctc_probs, indices_topk = getattr(self, 'dec_' + dir).ctc_posteriors(
+            enc_outs[task]['xs'], enc_outs[task]['xlens'], temperature, topk)
+        return ctc_probs, indices_topk, enc_outs[task]['xlens']
 
     def decode(self, xs, decode_params, nbest=1, exclude_eos=False,
-               id2token=None, refs=None, ctc=False, task='ys'):
+               id2token=None, refs=None, ctc=False, task='ys', return_aws=True, utt_ids=None):
         """Decoding in the inference stage.
 
         Args:
@@ -505,6 +588,19 @@ class Seq2seq(ModelBase):
                 cov_penalty (float): coverage penalty
                 cov_threshold (float): threshold for coverage penalty
                 rnnlm_weight (float): the weight of RNNLM score
+                attn_window (int): restrict attention to a window around the previous peak
+                blank_skip_threshold (float): remove frames whose CTC blank posterior is not less than
+                    this value before attention-based decoding (0 means no skipping)
+                blank_skip_min_frames (int): the minimum number of frames kept per utterance (at least 1)
+                blank_skip_merge (bool): merge each run of blank frames into one frame instead of removing it
+                shortlist_threshold (float): restrict the output layer in beam search to tokens whose
+                    CTC posterior exceeds this value (0 means the full vocabulary)
+                shortlist_nfrequent (int): the number of the most frequent tokens always in the shortlist
+                shortlist_max_error (float): the maximum error of log-probabilities by the shortlist
+                recog_ctc_weight (float): the weight of CTC prefix score in joint CTC/attention decoding
+                ngram_weight (float): the weight of n-gram LM score
+                rescore_bwd_weight (float): the weight of the backward decoder score in N-best rescoring
+                rescore_rnnlm_weight (float): the weight of RNNLM score in N-best rescoring
                 resolving_unk (bool): not used (to make compatible)
                 fwd_bwd_attention (bool):
             nbest (int):
@@ -513,6 +609,8 @@ class Seq2seq(ModelBase):
             refs (list): gold transcriptions to compute log likelihood
             ctc (bool):
             task (str): ys or ys_sub1 or ys_sub2
+            return_aws (bool): return attention weights
+            utt_ids (list): utterance IDs to look up encoder outputs in `self.enc_cache`
         Returns:
             best_hyps (list): A list of length `[B]`, which contains arrays of size `[L]`
             aws (list): A list of length `[B]`, which contains arrays of size `[L, T]`
@@ -521,67 +619,206 @@ class Seq2seq(ModelBase):
         """
         self.eval()
         with torch.no_grad():
-            enc_outs, perm_ids = self.encode(xs, task)
-            dir = 'fwd' if self.fwd_weight >= self.bwd_weight else 'bwd'
-            if task == 'ys_sub1':
-                dir += '_sub1'
-            elif task == 'ys_sub2':
-                dir += '_sub2'
-
-            if self.ctc_weight == 1 or (self.ctc_weight > 0 and ctc):
-                # Set RNNLM
-                if decode_params['rnnlm_weight'] > 0:
-                    assert hasattr(self, 'rnnlm_' + dir)
-                    rnnlm = getattr(self, 'rnnlm_' + dir)
+            if self.enc_cache is not None and utt_ids is not None:
+                enc_outs, perm_ids = self.encode_cached(xs, utt_ids, task)
+            else:
+                enc_outs, perm_ids = self.encode(xs, task)
+            return self._decode(enc_outs, decode_params, nbest, exclude_eos,
+                                id2token, refs, ctc, task, return_aws) + (perm_ids,)
+
+    def decode_multi(self, xs, decode_params, outputs=['ys'], exclude_eos=False,
+                     id2token=None, refs=None, ctc=False, temperature=1, topk=None):
+        """Decode multiple outputs with a single encoder pass in the inference stage.
+
+        Args:
+            xs (list): A list of length `[B]`, which contains arrays of size `[T, input_dim]`
+            decode_params (dict): the same as in decode()
+            outputs (list): any combination of
+                ys, ys_sub1, ys_sub2: hypotheses and attention weights of each task
+                ys.ctc, ys_sub1.ctc, ys_sub2.ctc: CTC posteriors and top-k indices of each task
+                eouts: encoder outputs
+            exclude_eos (bool): exclude <eos> from best_hyps
+            id2token (): converter from index to token
+            refs (list): gold transcriptions to compute log likelihood
+            ctc (bool): decode hypotheses with CTC
+            temperature (float): temperature for CTC posteriors
+            topk (int): the number of top-k indices of CTC posteriors
+        Returns:
+            results (dict):
+                ys* (tuple): (best_hyps, aws)
+                ys*.ctc (tuple): (ctc_probs, indices_topk, xlens)
+                eouts (dict): outputs of encode()
+            perm_ids (list): A list of length `[B]`
+
+        """
+        self.eval()
+        with torch.no_grad():
+            tasks = list(set([o.replace('.ctc', '') for o in outputs if o != 'eouts']))
+            enc_outs, perm_ids = self.encode(xs, tasks[0] if len(tasks) == 1 else 'all')
+
+            results = {}
+            for o in outputs:
+                if o == 'eouts':
+                    results[o] = enc_outs
+                elif '.ctc' in o:
+                    results[o] = self._get_ctc_posteriors(enc_outs, o.replace('.ctc', ''), temperature, topk)
                 else:
-                    rnnlm = None
+                    results[o] = self._decode(enc_outs, decode_params, 1, exclude_eos,
+                                              id2token, refs, ctc, o)
+            return results, perm_ids
+
+    def _decode(self, enc_outs, decode_params, nbest=1, exclude_eos=False,
+                id2token=None, refs=None, ctc=False, task='ys', return_aws=True):
+        dir = self._get_dir(task)
+
+        # Set n-gram LM
+        if decode_params['ngram_weight'] > 0:
+            assert hasattr(self, 'ngram_' + dir)
+            ngram = getattr(self, 'ngram_' + dir)
+        else:
+            ngram = None
 
-                best_hyps = getattr(self, 'dec_' + dir).decode_ctc(
-                    enc_outs[task]['xs'], enc_outs[task]['xlens'],
-                    decode_params['beam_width'], rnnlm)
-                return best_hyps, None, perm_ids
+        if self.ctc_weight == 1 or (self.ctc_weight > 0 and ctc):
+            # Set RNNLM
+            if decode_params['rnnlm_weight'] > 0:
+                assert hasattr(self, 'rnnlm_' + dir)
+                rnnlm = getattr(self, 'rnnlm_' + dir)
             else:
-                if decode_params['beam_width'] == 1 and not decode_params['fwd_bwd_attention']:
-                    best_hyps, aws = getattr(self, 'dec_' + dir).greedy(
-                        enc_outs[task]['xs'], enc_outs[task]['xlens'],
-                        decode_params['max_len_ratio'], exclude_eos)
+                rnnlm = None
+
+            best_hyps = getattr(self, 'dec_' + dir).decode_ctc(
+                enc_outs[task]['xs'], enc_outs[task]['xlens'],
+                decode_params['beam_width'], rnnlm,
+                decode_params['rnnlm_weight'], decode_params['length_penalty'],
+                ngram, decode_params['ngram_weight'],
+                enc_outs[task].get('ctc_log_probs'))
+            return best_hyps, None
+        else:
+            eouts, elens = enc_outs[task]['xs'], enc_outs[task]['xlens']
+            # NOTE: CTC scores and shortlists are computed over all frames of the encoder outputs
+            ctc_log_probs = enc_outs[task].get('ctc_log_probs')
+            if decode_params['blank_skip_threshold'] > 0:
+                # Remove blank frames before attention
+                assert hasattr(getattr(self, 'dec_' + dir), 'output_ctc')
+                if ctc_log_probs is None:
+                    ctc_log_probs = F.log_softmax(getattr(self, 'dec_' + dir).output_ctc(eouts), dim=-1)
+                eouts, elens = getattr(self, 'dec_' + dir).skip_blank_frames(
+                    eouts, elens, decode_params['blank_skip_threshold'],
+                    decode_params['blank_skip_min_frames'], decode_params['blank_skip_merge'],
+                    ctc_log_probs)
+                # Do not shorten the maximum length of hypotheses
+                decode_params = dict(decode_params, max_len_ratio=decode_params['max_len_ratio'] * max(
+                    [elen / max(elen_skip, 1) for elen, elen_skip in zip(enc_outs[task]['xlens'], elens)]))
+
+            if decode_params['beam_width'] == 1 and not decode_params['fwd_bwd_attention']:
+                best_hyps, aws = getattr(self, 'dec_' + dir).greedy(
+                    eouts, elens,
+                    decode_params['max_len_ratio'], exclude_eos,
+                    decode_params['attn_window'], return_aws)
+            else:
+                if decode_params['fwd_bwd_attention']:
+                    rnnlm_fwd = None
+                    nbest_hyps_fwd, aws_fwd, scores_fwd = self.dec_fwd.beam_search(
+                        eouts, elens,
+                        decode_params, rnnlm_fwd,
+                        decode_params['beam_width'], False, id2token, refs,
+                        ctc_log_probs=ctc_log_probs, ctc_elens=enc_outs[task]['xlens'])
+
+                    rnnlm_bwd = None
+                    nbest_hyps_bwd, aws_bwd, scores_bwd = self.dec_bwd.beam_search(
+                        eouts, elens,
+                        decode_params, rnnlm_bwd,
+                        decode_params['beam_width'], False, id2token, refs)
+                    best_hyps = fwd_bwd_attention(nbest_hyps_fwd, aws_fwd, scores_fwd,
+                                                  nbest_hyps_bwd, aws_bwd, scores_bwd,
+                                                  id2token, refs)
+                    aws = None
                 else:
-                    if decode_params['fwd_bwd_attention']:
-                        rnnlm_fwd = None
-                        nbest_hyps_fwd, aws_fwd, scores_fwd = self.dec_fwd.beam_search(
-                            enc_outs[task]['xs'], enc_outs[task]['xlens'],
-                            decode_params, rnnlm_fwd,
-                            decode_params['beam_width'], False, id2token, refs)
-
-                        rnnlm_bwd = None
-                        nbest_hyps_bwd, aws_bwd, scores_bwd = self.dec_bwd.beam_search(
-                            enc_outs[task]['xs'], enc_outs[task]['xlens'],
-                            decode_params, rnnlm_bwd,
-                            decode_params['beam_width'], False, id2token, refs)
-                        best_hyps = fwd_bwd_attention(nbest_hyps_fwd, aws_fwd, scores_fwd,
-                                                      nbest_hyps_bwd, aws_bwd, scores_bwd,
-                                                      id2token, refs)
-                        aws = None
+                    # Set RNNLM
+                    if decode_params['rnnlm_weight'] > 0:
+                        assert hasattr(self, 'rnnlm_' + dir)
+                        rnnlm = getattr(self, 'rnnlm_' + dir)
                     else:
-                        # Set RNNLM
-                        if decode_params['rnnlm_weight'] > 0:
-                            assert hasattr(self, 'rnnlm_' + dir)
-                            rnnlm = getattr(self, 'rnnlm_' + dir)
-                        else:
-                            rnnlm = None
-                        nbest_hyps, aws, scores = getattr(self, 'dec_' + dir).beam_search(
-                            enc_outs[task]['xs'], enc_outs[task]['xlens'],
-                            decode_params, rnnlm,
-                            nbest, exclude_eos, id2token, refs)
-
-                        if nbest == 1:
-                            best_hyps = [hyp[0] for hyp in nbest_hyps]
+                        rnnlm = None
+
+                    # N-best rescoring of the forward decoder
+                    rescore = nbest == 1 and dir == 'fwd' and \
+                        (decode_params['rescore_bwd_weight'] > 0 or decode_params['rescore_rnnlm_weight'] > 0)
+                    nbest_hyps, aws, scores = getattr(self, 'dec_' + dir).beam_search(
+                        eouts, elens,
+                        decode_params, rnnlm,
+                        decode_params['beam_width'] if rescore else nbest,
+                        False if rescore else exclude_eos,
+                        id2token, refs, ngram, return_aws,
+                        ctc_log_probs, enc_outs[task]['xlens'])
+
+                    if rescore:
+                        nbest_hyps_noeos = [[hyp[:-1] if len(hyp) > 0 and hyp[-1] == self.eos else hyp
+                                             for hyp in hyps] for hyps in nbest_hyps]
+                        scores_rescored = self.rescore(enc_outs, nbest_hyps_noeos,
+                                                       [[s[-1] for s in scores_b] for scores_b in scores],
+                                                       decode_params, task)
+                        best_ids = [int(np.argmax(s)) for s in scores_rescored]
+                        if exclude_eos:
+                            nbest_hyps = nbest_hyps_noeos
+                        nbest_hyps = [[hyps[i]] for hyps, i in zip(nbest_hyps, best_ids)]
+                        if return_aws:
+                            aws = [[aw[i]] for aw, i in zip(aws, best_ids)]
+
+                    if nbest == 1:
+                        best_hyps = [hyp[0] for hyp in nbest_hyps]
+                        if return_aws:
                             aws = [aw[0] for aw in aws]
-                        else:
-                            return nbest_hyps, aws, scores, perm_ids
-                        # NOTE: nbest >= 2 is used for MWER training only
+                    else:
+                        return nbest_hyps, aws, scores
+                    # NOTE: nbest >= 2 is used for MWER training only
+
+            return best_hyps, aws
+
+    def rescore(self, enc_outs, nbest_hyps, scores, rescore_params, task='ys'):
+        """Rescore N-best hypotheses of the forward decoder in teacher-forcing mode.
+
+            Hypotheses of all utterances are scored by the backward decoder and SeqRNNLM
+            as a single padded mini-batch.
+        Args:
+            enc_outs (dict): outputs of encode()
+            nbest_hyps (list): A list of length `[B]`, which contains list of n arrays of size `[L]`
+                (without <eos>)
+            scores (list): A list of length `[B]`, which contains list of n scores of beam search
+            rescore_params (dict):
+                rescore_bwd_weight (float): the weight of the backward decoder score
+                rescore_rnnlm_weight (float): the weight of RNNLM score
+            task (str): ys or ys_sub1 or ys_sub2
+        Returns:
+            scores (list): A list of length `[B]`, which contains arrays of size `[n]`
+
+        """
+        bwd_weight = rescore_params['rescore_bwd_weight']
+        rnnlm_weight = rescore_params['rescore_rnnlm_weight']
+
+        # Flatten hypotheses of all utterances
+        utt_ids = [b for b, hyps in enumerate(nbest_hyps) for _ in hyps]
+        ys = [hyp for hyps in nbest_hyps for hyp in hyps]
+        scores_all = np.array([s for scores_b in scores for s in scores_b], dtype=np.float64)
 
-                return best_hyps, aws, perm_ids
+        with torch.no_grad():
+            if bwd_weight > 0:
+                assert hasattr(self, 'dec_bwd')
+                eouts = enc_outs[task]['xs']
+                eouts = eouts.index_select(0, eouts.new_tensor(utt_ids).long())
+                elens = [enc_outs[task]['xlens'][b] for b in utt_ids]
+                scores_bwd = self.dec_bwd.score_sequences(eouts, elens, ys)
+                scores_all += tensor2np(scores_bwd) * bwd_weight
+            if rnnlm_weight > 0:
+                assert hasattr(self, 'seq_rnnlm')
+                scores_all += tensor2np(self.seq_rnnlm.score(ys)) * rnnlm_weight
+
+        scores_rescored = []
+        offset = 0
+        for hyps in nbest_hyps:
+            scores_rescored.append(scores_all[offset:offset + len(hyps)])
+            offset += len(hyps)
+        return scores_rescored
 
 
 def fwd_bwd_attention(nbest_hyps_fwd, aws_fwd, scores_fwd,
@@ -635,34 +872,49 @@ def fwd_bwd_attention(nbest_hyps_fwd, aws_fwd, scores_fwd,
                 # <eos> only
                 logger.info(nbest_hyps_bwd[b][n])
 
+        # Attention peaks of all positions `[L]`
+        peaks_fwd = [np.asarray(aws_fwd[b][n]).argmax(-1) for n in range(nbest)]
+        peaks_bwd = [np.asarray(aws_bwd[b][n]).argmax(-1) for n in range(nbest)]
+        n_matches = 0
         for n_f in range(nbest):
+            len_f = len(aws_fwd[b][n_f]) - 1
+            if len_f <= 0:
+                continue
+            # NOTE: index -1 refers to the last position as in Python lists
+            i_f = np.arange(len_f)
+            hyp_fwd = np.asarray(nbest_hyps_fwd[b][n_f])
+            s_fwd = np.asarray(scores_fwd[b][n_f], dtype=np.float64)
+            score_prev_fwd = s_fwd[i_f - 1]
+            score_curr_fwd = s_fwd[i_f] - score_prev_fwd
+            t_curr = peaks_fwd[n_f][:len_f]
             for n_b in range(nbest):
-                for i_f in range(len(aws_fwd[b][n_f]) - 1):
-                    for i_b in range(len(aws_bwd[b][n_b]) - 1):
-                        t_prev = aws_bwd[b][n_b][i_b + 1].argmax(-1).item()
-                        t_curr = aws_fwd[b][n_f][i_f].argmax(-1).item()
-                        t_next = aws_bwd[b][n_b][i_b - 1].argmax(-1).item()
-
-                        # the same token at the same time
-                        if t_curr >= t_prev and t_curr <= t_next and nbest_hyps_fwd[b][n_f][i_f] == nbest_hyps_bwd[b][n_b][i_b]:
-                            new_hyp = nbest_hyps_fwd[b][n_f][:i_f + 1].tolist() + \
-                                nbest_hyps_bwd[b][n_b][i_b + 1:].tolist()
-                            score_curr_fwd = scores_fwd[b][n_f][i_f] - scores_fwd[b][n_f][i_f - 1]
-                            score_curr_bwd = scores_bwd[b][n_b][i_b] - scores_bwd[b][n_b][i_b + 1]
-                            score_curr = max(score_curr_fwd, score_curr_bwd)
-                            new_score = scores_fwd[b][n_f][i_f - 1] + scores_bwd[b][n_b][i_b + 1] + score_curr
-                            merged.append({'hyp': new_hyp, 'score': new_score})
-
-                            logger.info('time matching')
-                            if id2token is not None:
-                                if refs is not None:
-                                    logger.info('Ref: %s' % refs[b].lower())
-                                logger.info('hyp (fwd): %s' % id2token(nbest_hyps_fwd[b][n_f]))
-                                logger.info('hyp (bwd): %s' % id2token(nbest_hyps_bwd[b][n_b]))
-                                logger.info('hyp (fwd-bwd): %s' % id2token(new_hyp))
-                            logger.info('log prob (fwd): %.3f' % scores_fwd[b][n_f][-1])
-                            logger.info('log prob (bwd): %.3f' % scores_bwd[b][n_b][0])
-                            logger.info('log prob (fwd-bwd): %.3f' % new_score)
+                len_b = len(aws_bwd[b][n_b]) - 1
+                if len_b <= 0:
+                    continue
+                i_b = np.arange(len_b)
+                hyp_bwd = np.asarray(nbest_hyps_bwd[b][n_b])
+                s_bwd = np.asarray(scores_bwd[b][n_b], dtype=np.float64)
+                t_prev = peaks_bwd[n_b][i_b + 1]
+                t_next = peaks_bwd[n_b][i_b - 1]
+
+                # the same token at the same time `[len_f, len_b]`
+                is_match = (t_curr[:, None] >= t_prev[None, :]) & (t_curr[:, None] <= t_next[None, :]) & \
+                    (hyp_fwd[:len_f, None] == hyp_bwd[None, :len_b])
+                if not is_match.any():
+                    continue
+                score_curr_bwd = s_bwd[i_b] - s_bwd[i_b + 1]
+                new_scores = score_prev_fwd[:, None] + s_bwd[None, i_b + 1] + \
+                    np.maximum(score_curr_fwd[:, None], score_curr_bwd[None, :])
+                for i, j in zip(*np.nonzero(is_match)):
+                    new_hyp = nbest_hyps_fwd[b][n_f][:i + 1].tolist() + nbest_hyps_bwd[b][n_b][j + 1:].tolist()
+                    merged.append({'hyp': new_hyp, 'score': float(new_scores[i, j])})
+                    n_matches += 1
+
+                    if logger.isEnabledFor(logging.DEBUG):
+                        if id2token is not None:
+                            logger.debug('hyp (fwd-bwd): %s' % id2token(new_hyp))
+                        logger.debug('log prob (fwd-bwd): %.3f' % new_scores[i, j])
+        logger.info('time matching: %d' % n_matches)
 
         merged = sorted(merged, key=lambda x: x['score'], reverse=True)
         best_hyps.append(merged[0]['hyp'])
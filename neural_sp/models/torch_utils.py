@@ -61,3 +61,23 @@ def pad_list(xs, pad_value=float("nan")):
     for b in range(bs):
         xs_pad[b, :xs[b].size(0)] = xs[b]
     return xs_pad
+
+
+def make_pad_mask(seq_lens, device_id=-1):
+    """Make a mask for padded positions.
+
+    Args:
+        seq_lens (list): A list of length `[B]`
+        device_id (int): the index of the device
+    Returns:
+        mask (ByteTensor): `[B, T]`, where 1 means a non-padded position
+
+    """
+    bs = len(seq_lens)
+    max_time = max(seq_lens)
+    seq_range = torch.arange(0, max_time, dtype=torch.long).unsqueeze(0).expand(bs, max_time)
+    seq_lens = seq_range.new_tensor(seq_lens).unsqueeze(-1)
+    mask = seq_range < seq_lens
+    if device_id < 0:
+        return mask
+    return mask.cuda(device_id)
@@ -10,6 +10,7 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import gc
 import multiprocessing as mp
 
 
@@ -41,3 +42,24 @@ def make_parallel(func, args, core=mp.cpu_count() - 1):
         raise KeyboardInterrupt
 
     return result_tuple
+
+
+def share_model(model):
+    """Move parameters of the model (including RNNLMs) into shared memory on CPUs before forking workers.
+
+        Workers read the same pages of parameters, so that each additional worker costs almost no memory
+        for the model. Objects alive at this point are also moved out of the garbage collector (python>=3.7),
+        which would otherwise touch and copy their pages in every worker.
+
+    Args:
+        model (torch.nn.Module):
+    Returns:
+        nbytes (int): the size of shared parameters
+
+    """
+    model.cpu()
+    model.share_memory()
+    gc.collect()
+    if hasattr(gc, 'freeze'):
+        gc.freeze()
+    return sum([p.numel() * p.element_size() for p in model.parameters()])
@@ -0,0 +1,110 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Compare the speed of multi-head attention with a loop over single-head attention layers.
+
+    python test/bench_attention.py --nheads 4 8
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import time
+import torch
+import torch.nn as nn
+
+from neural_sp.models.linear import LinearND
+from neural_sp.models.seq2seq.decoders.attention import AttentionMechanism
+from neural_sp.models.seq2seq.decoders.multihead_attention import MultiheadAttentionMechanism
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--nheads', type=int, nargs='+', default=[4, 8],
+                    help='the number of heads')
+parser.add_argument('--attn_type', type=str, default='location',
+                    help='the type of attention mechanisms')
+parser.add_argument('--batch_size', type=int, default=32,
+                    help='the size of mini-batch')
+parser.add_argument('--enc_time', type=int, default=200,
+                    help='the number of encoder frames')
+parser.add_argument('--enc_nunits', type=int, default=640,
+                    help='the number of units in each layer of the encoder')
+parser.add_argument('--dec_nunits', type=int, default=320,
+                    help='the number of units in each layer of the decoder')
+parser.add_argument('--attn_dim', type=int, default=128,
+                    help='the dimension of the attention layer')
+parser.add_argument('--nsteps', type=int, default=50,
+                    help='the number of decoding steps')
+parser.add_argument('--ntrials', type=int, default=5,
+                    help='the number of trials (the best one is reported)')
+parser.add_argument('--gpu', action='store_true',
+                    help='run on a GPU')
+args = parser.parse_args()
+
+
+class LoopAttention(nn.Module):
+    """Heads computed one by one in a python loop."""
+
+    def __init__(self, nheads):
+        super(LoopAttention, self).__init__()
+        self.heads = nn.ModuleList([AttentionMechanism(args.enc_nunits, args.dec_nunits, args.attn_type, args.attn_dim,
+                                                       conv_out_channels=10, conv_kernel_size=100)
+                                    for _ in range(nheads)])
+        self.w_out = LinearND(args.enc_nunits * nheads, args.enc_nunits)
+
+    def reset(self):
+        for head in self.heads:
+            head.reset()
+
+    def forward(self, enc_out, x_lens, dec_out, aw_step):
+        contexts, aw_steps = [], []
+        for h, head in enumerate(self.heads):
+            context, aw_step_h = head(enc_out, x_lens, dec_out, None if aw_step is None else aw_step[:, h])
+            contexts.append(context)
+            aw_steps.append(aw_step_h)
+        return self.w_out(torch.cat(contexts, dim=-1)), torch.stack(aw_steps, dim=1)
+
+
+def decode(attn, enc_out, x_lens, dec_out):
+    """Time attention of all decoding steps."""
+    if args.gpu:
+        torch.cuda.synchronize()
+    start = time.time()
+    attn.reset()
+    aw_step = None
+    for _ in range(args.nsteps):
+        _, aw_step = attn(enc_out, x_lens, dec_out, aw_step)
+    if args.gpu:
+        torch.cuda.synchronize()
+    return time.time() - start
+
+
+def main():
+    torch.manual_seed(1)
+    device = torch.device('cuda' if args.gpu else 'cpu')
+    enc_out = torch.randn(args.batch_size, args.enc_time, args.enc_nunits, device=device)
+    x_lens = [args.enc_time - b for b in range(args.batch_size)]
+    dec_out = torch.randn(args.batch_size, 1, args.dec_nunits, device=device)
+
+    print('%-8s %12s %12s %8s' % ('nheads', 'loop [ms]', 'batch [ms]', 'speedup'))
+    for nheads in args.nheads:
+        attns = [LoopAttention(nheads),
+                 MultiheadAttentionMechanism(args.enc_nunits, args.dec_nunits, args.attn_type, args.attn_dim,
+                                             conv_out_channels=10, conv_kernel_size=100, nheads=nheads)]
+        elapsed = []
+        with torch.no_grad():
+            for attn in attns:
+                attn.to(device).eval()
+                decode(attn, enc_out, x_lens, dec_out)  # warm up
+                elapsed.append(min([decode(attn, enc_out, x_lens, dec_out) for _ in range(args.ntrials)]))
+        print('%-8d %12.2f %12.2f %7.2fx' % (nheads, elapsed[0] * 1000 / args.nsteps,
+                                             elapsed[1] * 1000 / args.nsteps, elapsed[0] / elapsed[1]))
+
+
+if __name__ == '__main__':
+    main()
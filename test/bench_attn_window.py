@@ -0,0 +1,57 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Compare the latency of decoding with windowed attention and the full attention.
+
+    Error rates are computed against hypotheses with the full attention.
+
+    python test/bench_attn_window.py --windows 0 5 10 20 --beam_width 1 4
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import numpy as np
+
+from bench_utils import add_model_args
+from bench_utils import decode_params
+from bench_utils import error_rate
+from bench_utils import load_feats
+from bench_utils import load_model
+from bench_utils import timed_decode
+
+parser = add_model_args(argparse.ArgumentParser())
+parser.add_argument('--windows', type=int, nargs='+', default=[0, 5, 10, 20],
+                    help='the sizes of windows (0 means the full attention)')
+parser.add_argument('--beam_width', type=int, nargs='+', default=[1, 4],
+                    help='the sizes of beam')
+args = parser.parse_args()
+
+
+def main():
+    model = load_model(args)
+    xs = load_feats(args)
+    print('%d utterances, %.1f frames on average' % (len(xs), np.mean([len(x) for x in xs])))
+
+    print('%-6s %-8s %12s %12s %10s' % ('beam', 'window', 'mean [ms]', 'p90 [ms]', 'ERR [%]'))
+    for beam_width in args.beam_width:
+        refs = None
+        for window in args.windows:
+            params = decode_params(beam_width=beam_width, attn_window=window)
+            timed_decode(model, xs[:1], params, args.gpu)  # warm up
+            hyps, elapsed = timed_decode(model, xs, params, args.gpu)
+            if refs is None:
+                refs = hyps
+            elapsed = np.array(elapsed) * 1000
+            print('%-6d %-8d %12.2f %12.2f %10.2f' % (beam_width, window, elapsed.mean(),
+                                                       np.percentile(elapsed, 90), error_rate(refs, hyps)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Compare the real-time factor (RTF) of fixed-size mini-batches and length-sorted frame-budget mini-batches.
+
+    Mini-batches are sampled by `Base.sample_index` as in eval.py with --batch_size or --max_nframes_batch.
+    The RTF assumes the frame shift of 10ms. Error rates are computed against hypotheses decoded one by one.
+
+    python test/bench_batching.py --batch_size 1 8 --max_nframes_batch 4000 8000 --beam_width 1 4
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import numpy as np
+import pandas as pd
+import time
+import torch
+
+from bench_utils import add_model_args
+from bench_utils import decode_params
+from bench_utils import error_rate
+from bench_utils import load_feats
+from bench_utils import load_model
+from neural_sp.datasets.base import Base
+
+parser = add_model_args(argparse.ArgumentParser())
+parser.add_argument('--batch_size', type=int, nargs='+', default=[1, 8],
+                    help='the sizes of mini-batch in the original order')
+parser.add_argument('--max_nframes_batch', type=int, nargs='+', default=[4000, 8000],
+                    help='the numbers of padded frames in a mini-batch in the length order')
+parser.add_argument('--beam_width', type=int, nargs='+', default=[1, 4],
+                    help='the sizes of beam')
+args = parser.parse_args()
+
+
+class FeatBatches(Base):
+    """Mini-batches of indices of input features, sampled as in the evaluation of loader_asr.Dataset.
+
+    Args:
+        xs (list): A list of length `[N]`, which contains arrays of size `[T, input_dim]`
+        batch_size (int): the size of mini-batch (ignored if max_nframes_batch > 0)
+        max_nframes_batch (int): the maximum number of padded frames in a mini-batch
+
+    """
+
+    def __init__(self, xs, batch_size, max_nframes_batch=0):
+        super(FeatBatches, self).__init__()
+        self.batch_size = batch_size
+        self.max_nframes_batch = max_nframes_batch
+        self.sort_by_input_length = max_nframes_batch > 0
+        self.shuffle = False
+        self.sort_stop_epoch = None
+        df = pd.DataFrame({'x_len': [len(x) for x in xs]})
+        if self.sort_by_input_length:
+            df = df.sort_values(by='x_len', ascending=False)
+        self.df = df
+        self._reset()
+
+    def __iter__(self):
+        while True:
+            data_indices, is_new_epoch = self.sample_index(self.batch_size)
+            yield data_indices
+            if is_new_epoch:
+                break
+
+
+def timed_decode_batches(model, xs, params, batches, gpu=False):
+    """Decode utterances by mini-batches.
+
+    Returns:
+        hyps (list): A list of length `[N]`, which contains lists of token indices in the original order
+        elapsed (float): decoding time in seconds
+
+    """
+    hyps = [None] * len(xs)
+    if gpu:
+        torch.cuda.synchronize()
+    start = time.time()
+    for data_indices in batches:
+        best_hyps, _, perm_ids = model.decode([xs[i] for i in data_indices], params, exclude_eos=True)
+        for i, hyp in zip(perm_ids, best_hyps):
+            hyps[data_indices[i]] = [int(y) for y in hyp]
+    if gpu:
+        torch.cuda.synchronize()
+    return hyps, time.time() - start
+
+
+def main():
+    model = load_model(args)
+    xs = load_feats(args)
+    duration = sum([len(x) for x in xs]) * 0.01
+    print('%d utterances, %.1f frames on average' % (len(xs), np.mean([len(x) for x in xs])))
+
+    print('%-6s %-22s %10s %10s %10s' % ('beam', 'mini-batch', '#batches', 'RTF', 'ERR [%]'))
+    for beam_width in args.beam_width:
+        params = decode_params(beam_width=beam_width)
+        timed_decode_batches(model, xs[:1], params, [[0]], args.gpu)  # warm up
+        refs = None
+        settings = [('batch_size=%d' % b, FeatBatches(xs, b)) for b in args.batch_size] + \
+            [('max_nframes_batch=%d' % n, FeatBatches(xs, 1, n)) for n in args.max_nframes_batch]
+        for name, batches in settings:
+            batches = list(batches)
+            hyps, elapsed = timed_decode_batches(model, xs, params, batches, args.gpu)
+            if refs is None:
+                refs = hyps
+            print('%-6d %-22s %10d %10.3f %10.2f' % (beam_width, name, len(batches), elapsed / duration,
+                                                     error_rate(refs, hyps)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Compare the latency of decoding with and without skipping blank frames by the CTC posteriors.
+
+    Error rates are computed against hypotheses decoded from all frames. Random models have
+    flat CTC posteriors and skip few frames, so give a trained model with --model.
+
+    python test/bench_blank_skip.py --thresholds 0 0.9 0.95 0.99 --beam_width 1 4 --ctc_weight 0 0.3
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import numpy as np
+
+from bench_utils import add_model_args
+from bench_utils import decode_params
+from bench_utils import error_rate
+from bench_utils import load_feats
+from bench_utils import load_model
+from bench_utils import timed_decode
+
+parser = add_model_args(argparse.ArgumentParser())
+parser.add_argument('--thresholds', type=float, nargs='+', default=[0, 0.9, 0.95, 0.99],
+                    help='the thresholds of the blank posterior (0 means no skipping)')
+parser.add_argument('--min_frames', type=int, default=1,
+                    help='the minimum number of frames kept per utterance')
+parser.add_argument('--beam_width', type=int, nargs='+', default=[1, 4],
+                    help='the sizes of beam')
+parser.add_argument('--ctc_weight', type=float, nargs='+', default=[0, 0.3],
+                    help='the weights of CTC scores in the beam search')
+args = parser.parse_args()
+
+
+def main():
+    model = load_model(args)
+    xs = load_feats(args)
+    print('%d utterances, %.1f frames on average' % (len(xs), np.mean([len(x) for x in xs])))
+
+    print('%-6s %-6s %-10s %12s %12s %10s' % ('beam', 'ctc', 'threshold', 'mean [ms]', 'p90 [ms]', 'ERR [%]'))
+    for beam_width in args.beam_width:
+        for ctc_weight in args.ctc_weight:
+            if beam_width == 1 and ctc_weight > 0:
+                # CTC scores are used only in the beam search
+                continue
+            refs = None
+            for threshold in args.thresholds:
+                params = decode_params(beam_width=beam_width, recog_ctc_weight=ctc_weight,
+                                       blank_skip_threshold=threshold,
+                                       blank_skip_min_frames=args.min_frames)
+                timed_decode(model, xs[:1], params, args.gpu)  # warm up
+                hyps, elapsed = timed_decode(model, xs, params, args.gpu)
+                if refs is None:
+                    refs = hyps
+                elapsed = np.array(elapsed) * 1000
+                print('%-6d %-6.2f %-10.2f %12.2f %12.2f %10.2f' % (beam_width, ctc_weight, threshold, elapsed.mean(),
+                                                                    np.percentile(elapsed, 90),
+                                                                    error_rate(refs, hyps)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Compare the speed of criterions with loops over utterances (forward and backward).
+
+    python test/bench_criterion.py --batch_size 50 --max_len 100 --vocab 1000
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import time
+import torch
+
+from neural_sp.models.criterion import cross_entropy_lsm
+from neural_sp.models.criterion import focal_loss
+from neural_sp.models.criterion import kldiv_lsm_ctc
+from test_criterion import cross_entropy_lsm_loop
+from test_criterion import focal_loss_loop
+from test_criterion import kldiv_lsm_ctc_loop
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--batch_size', type=int, default=50,
+                    help='the size of mini-batch')
+parser.add_argument('--max_len', type=int, default=100,
+                    help='the maximum length of label sequences')
+parser.add_argument('--vocab', type=int, default=1000,
+                    help='the size of vocabulary')
+parser.add_argument('--ntrials', type=int, default=5,
+                    help='the number of trials (the best one is reported)')
+args = parser.parse_args()
+
+
+def measure(fn, logits):
+    """Time forward and backward computation."""
+    elapsed = []
+    for _ in range(args.ntrials):
+        x = logits.clone().requires_grad_()
+        start = time.time()
+        fn(x).backward()
+        elapsed.append(time.time() - start)
+    return min(elapsed)
+
+
+def main():
+    torch.manual_seed(1)
+    y_lens = torch.randint(1, args.max_len + 1, (args.batch_size,)).tolist()
+    logits = torch.randn(args.batch_size, max(y_lens), args.vocab)
+    ys = torch.randint(0, args.vocab, (args.batch_size, max(y_lens)), dtype=torch.long)
+
+    criterions = [
+        ('cross_entropy_lsm', lambda x: cross_entropy_lsm(x, ys, y_lens, 0.1),
+         lambda x: cross_entropy_lsm_loop(x, ys, y_lens, 0.1)),
+        ('focal_loss', lambda x: focal_loss(x, ys, y_lens, 2.0),
+         lambda x: focal_loss_loop(x, ys, y_lens, 2.0)),
+        ('kldiv_lsm_ctc', lambda x: kldiv_lsm_ctc(x, y_lens, 0.1),
+         lambda x: kldiv_lsm_ctc_loop(x, y_lens, 0.1)),
+    ]
+    print('%-20s %12s %12s %8s' % ('criterion', 'loop [ms]', 'vector [ms]', 'speedup'))
+    for name, fn, fn_loop in criterions:
+        elapsed_loop = measure(fn_loop, logits)
+        elapsed = measure(fn, logits)
+        print('%-20s %12.2f %12.2f %7.2fx' % (name, elapsed_loop * 1000, elapsed * 1000, elapsed_loop / elapsed))
+
+
+if __name__ == '__main__':
+    main()
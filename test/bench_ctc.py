@@ -0,0 +1,80 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Compare the speed of the native CTC loss and warpctc_pytorch (forward and backward).
+
+    python test/bench_ctc.py --batch_size 32 --max_len 400 --vocab 1000
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import numpy as np
+import time
+import torch
+
+from conftest import make_model
+from neural_sp.models.seq2seq.decoders import decoder as decoder_module
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--batch_size', type=int, default=32,
+                    help='the size of mini-batch')
+parser.add_argument('--max_len', type=int, default=400,
+                    help='the maximum number of encoder frames')
+parser.add_argument('--label_ratio', type=float, default=0.2,
+                    help='the ratio of the length of labels to the number of frames')
+parser.add_argument('--vocab', type=int, default=1000,
+                    help='the size of vocabulary')
+parser.add_argument('--ntrials', type=int, default=5,
+                    help='the number of trials (the best one is reported)')
+parser.add_argument('--gpu', action='store_true',
+                    help='run on a GPU')
+args = parser.parse_args()
+
+
+def measure(dec, eouts, elens, ys, device_id):
+    """Time forward and backward computation."""
+    elapsed = []
+    for _ in range(args.ntrials + 1):
+        x = eouts.detach().requires_grad_()
+        if args.gpu:
+            torch.cuda.synchronize()
+        start = time.time()
+        dec.forward_ctc(x, elens, ys, device_id).backward()
+        if args.gpu:
+            torch.cuda.synchronize()
+        elapsed.append(time.time() - start)
+    return min(elapsed[1:])  # the first trial is for warm up
+
+
+def main():
+    rng = np.random.RandomState(0)
+    elens = sorted(rng.randint(args.max_len // 2, args.max_len + 1, args.batch_size).tolist(), reverse=True)
+    ys = [rng.randint(1, args.vocab, int(elen * args.label_ratio)).tolist() for elen in elens]
+    device_id = 0 if args.gpu else -1
+
+    backends = ['native']
+    if decoder_module.warpctc_pytorch is not None:
+        backends.append('warpctc')
+    else:
+        print('warpctc_pytorch is not installed')
+
+    print('%-10s %12s' % ('backend', 'time [ms]'))
+    for backend in backends:
+        model = make_model(ctc_backend=backend, ctc_weight=1., vocab=args.vocab)
+        eouts = torch.randn(args.batch_size, args.max_len, model.enc_nunits)
+        if args.gpu:
+            model.cuda()
+            eouts = eouts.cuda()
+        elapsed = measure(model.dec_fwd, eouts, elens, ys, device_id)
+        print('%-10s %12.2f' % (backend, elapsed * 1000))
+
+
+if __name__ == '__main__':
+    main()
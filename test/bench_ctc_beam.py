@@ -0,0 +1,59 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Compare the speed of the CTC prefix beam search with the previous decoder.
+
+    Hypotheses of the previous decoder (without prefix merging) are used as references of error rates.
+
+    python test/bench_ctc_beam.py --batch_size 4 --max_len 200 --vocab 100 --beam_width 4 10
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import time
+
+from bench_utils import error_rate
+from neural_sp.models.seq2seq.decoders.ctc_beam_search_decoder import BeamSearchDecoder
+from test_ctc_beam_search import BeamSearchDecoderRef
+from test_ctc_beam_search import peaky_log_probs
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--batch_size', type=int, default=4,
+                    help='the size of mini-batch')
+parser.add_argument('--max_len', type=int, default=200,
+                    help='the maximum number of frames')
+parser.add_argument('--vocab', type=int, default=100,
+                    help='the size of vocabulary')
+parser.add_argument('--beam_width', type=int, nargs='+', default=[4, 10],
+                    help='the sizes of beam')
+args = parser.parse_args()
+
+
+def main():
+    log_probs = peaky_log_probs(args.batch_size, args.max_len, args.vocab, seed=0)
+    x_lens = [args.max_len - b * args.max_len // (2 * args.batch_size) for b in range(args.batch_size)]
+
+    print('%-6s %14s %14s %10s' % ('beam', 'previous [ms]', 'merged [ms]', 'ERR [%]'))
+    for beam_width in args.beam_width:
+        start = time.time()
+        hyps_ref = BeamSearchDecoderRef(blank_index=0)(log_probs, x_lens, beam_width)
+        elapsed_ref = time.time() - start
+
+        start = time.time()
+        hyps = BeamSearchDecoder(blank_index=0)(log_probs, x_lens, beam_width)
+        elapsed = time.time() - start
+
+        print('%-6d %14.2f %14.2f %10.2f' % (beam_width, elapsed_ref * 1000, elapsed * 1000,
+                                             error_rate([h.tolist() for h in hyps_ref],
+                                                        [h.tolist() for h in hyps])))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Compare the step time of multi-task training with mtl_per_batch.
+
+    A 3-task model like the CSJ recipe (words, characters and kana with sub-task encoder layers)
+    is trained with an encoder pass per task, or with a single encoder pass per mini-batch
+    (--mtl_encode_once combined/per_task of train.py).
+
+    python test/bench_mtl.py --batch_size 20 --max_len 800 --nunits 320
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import numpy as np
+import time
+import torch
+
+from conftest import make_model
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--batch_size', type=int, default=20,
+                    help='the size of mini-batch')
+parser.add_argument('--max_len', type=int, default=800,
+                    help='the maximum number of frames')
+parser.add_argument('--input_dim', type=int, default=40,
+                    help='the dimension of input features')
+parser.add_argument('--nunits', type=int, default=128,
+                    help='the number of units of the encoder and the decoders')
+parser.add_argument('--vocab', type=int, nargs=3, default=[1000, 300, 100],
+                    help='the size of vocabulary of the main task and the two sub tasks')
+parser.add_argument('--nsteps', type=int, default=5,
+                    help='the number of steps (the first one is not counted for warm up)')
+parser.add_argument('--gpu', action='store_true',
+                    help='train on a GPU')
+args = parser.parse_args()
+
+TASKS = ['ys_sub2', 'ys_sub1', 'ys']
+
+
+def make_batch(rng):
+    xlens = sorted(rng.randint(args.max_len // 2, args.max_len + 1, args.batch_size).tolist(), reverse=True)
+    batch = {'xs': [rng.randn(xlen, args.input_dim).astype(np.float32) for xlen in xlens]}
+    # NOTE: the lengths of labels are about a tenth, a fifth and a quarter of the frames
+    for key, vocab, ratio in zip(['ys', 'ys_sub1', 'ys_sub2'], args.vocab, [0.1, 0.2, 0.25]):
+        batch[key] = [rng.randint(4, vocab, int(xlen * ratio)).tolist() for xlen in xlens]
+    return batch
+
+
+def train_step(model, batch, encode_once):
+    """One training step of train.py with mtl_per_batch."""
+    if encode_once:
+        model.optimizer.zero_grad()
+        losses, _ = model(batch, task=TASKS)
+        if encode_once == 'combined':
+            losses = [sum(losses)]
+        grads = []
+        for i, loss in enumerate(losses):
+            model.optimizer.zero_grad()
+            loss.backward(retain_graph=i < len(losses) - 1)
+            grads.append([p.grad.clone() if p.grad is not None else None for p in model.parameters()])
+        for grad in grads:
+            for p, g in zip(model.parameters(), grad):
+                p.grad = g
+            model.optimizer.step()
+    else:
+        for task in TASKS:
+            model.optimizer.zero_grad()
+            loss, _ = model(batch, task=task)
+            loss.backward()
+            model.optimizer.step()
+
+
+def main():
+    rng = np.random.RandomState(0)
+    batches = [make_batch(rng) for _ in range(args.nsteps)]
+
+    print('%-12s %14s' % ('encode once', 'step [ms]'))
+    for encode_once in ['', 'combined', 'per_task']:
+        model = make_model(input_dim=args.input_dim, enc_nunits=args.nunits, enc_nlayers=5,
+                           enc_nlayers_sub1=4, enc_nlayers_sub2=3, subsample='1_2_2_1_1',
+                           dec_nunits=args.nunits, attn_dim=args.nunits, emb_dim=args.nunits,
+                           vocab=args.vocab[0], vocab_sub1=args.vocab[1], vocab_sub2=args.vocab[2],
+                           sub1_weight=0.2, sub2_weight=0.2, mtl_per_batch=True)
+        model.set_optimizer('adam', 1e-3)
+        if args.gpu:
+            model.cuda()
+        elapsed = []
+        for batch in batches:
+            if args.gpu:
+                torch.cuda.synchronize()
+            start = time.time()
+            train_step(model, batch, encode_once)
+            if args.gpu:
+                torch.cuda.synchronize()
+            elapsed.append(time.time() - start)
+        print('%-12s %14.2f' % (encode_once or 'no', np.mean(elapsed[1:]) * 1000))
+
+
+if __name__ == '__main__':
+    main()
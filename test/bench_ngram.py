@@ -0,0 +1,130 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Measure the latency of lookups in the n-gram LM in microseconds.
+
+    A random ARPA file is used unless --arpa is given. The script fails if a lookup
+    of a word score takes longer than --max_us on average.
+
+    python test/bench_ngram.py --nwords 300 --order 3 --max_us 50
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import numpy as np
+import os
+import shutil
+import sys
+import tempfile
+import time
+import torch
+
+from neural_sp.models.ngram.ngram import NgramLM
+from neural_sp.models.ngram.ngram import NgramScorer
+from test_ngram import random_ngrams
+from test_ngram import write_arpa
+from test_ngram import write_dict
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--arpa', type=str, default=None,
+                    help='path to an ARPA file (a random model is built if not given)')
+parser.add_argument('--nwords', type=int, default=300,
+                    help='the number of words of the random model')
+parser.add_argument('--order', type=int, default=3,
+                    help='the order of the random model')
+parser.add_argument('--ratio', type=float, default=0.05,
+                    help='the ratio of n-grams kept in the random model')
+parser.add_argument('--nqueries', type=int, default=10000,
+                    help='the number of queries')
+parser.add_argument('--beam_width', type=int, default=10,
+                    help='the number of hypotheses scored at once')
+parser.add_argument('--max_us', type=float, default=50.,
+                    help='the maximum average latency of a lookup of a word score in microseconds')
+args = parser.parse_args()
+
+
+def timeit(fn, n):
+    """Average time of a call in microseconds."""
+    start = time.time()
+    for _ in range(n):
+        fn()
+    return (time.time() - start) / n * 1e6
+
+
+def main():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        arpa_path = args.arpa
+        if arpa_path is None:
+            arpa_path = os.path.join(tmpdir, 'lm.arpa')
+            words = ['w%d' % i for i in range(args.nwords)]
+            write_arpa(arpa_path, random_ngrams(words, args.order, seed=0, ratio=args.ratio))
+        lm = NgramLM.from_arpa(arpa_path)
+        words = [w for w in lm.vocab if w not in ['<s>', '</s>', '<unk>']]
+        write_dict(os.path.join(tmpdir, 'dict.txt'), words)
+        scorer = NgramScorer(lm, os.path.join(tmpdir, 'dict.txt'), 'word')
+    finally:
+        shutil.rmtree(tmpdir)
+
+    # Random histories and next words
+    rng = np.random.RandomState(0)
+    ids = rng.randint(0, len(lm.vocab), (args.nqueries, args.order))
+    states = [lm.next_state(lm.next_state(lm.initial_state(), int(w1)), int(w2)) for w1, w2, _ in ids]
+    queries = iter([])
+
+    def score():
+        state, w = next(queries)
+        lm.score(state, w)
+
+    def log_probs():
+        lm.cache.entries.clear()
+        lm.log_probs(next(queries)[0])
+
+    def log_probs_cached():
+        lm.log_probs(next(queries)[0])
+
+    hyps = [(state, '') for state in states]
+    tokens = rng.randint(4, 4 + len(words), args.nqueries)
+    beams = [(hyps[i:i + args.beam_width], tokens[i:i + args.beam_width])
+             for i in range(0, args.nqueries - args.beam_width + 1, args.beam_width)]
+    batches = iter([])
+
+    def scores_tensor():
+        scorer.scores_tensor(next(batches)[0], torch.device('cpu'))
+
+    def next_states():
+        scorer.next_states(*next(batches))
+
+    print('order: %d, vocab: %d' % (lm.order, len(lm.vocab)))
+    print('%-20s %14s' % ('lookup', 'latency [us]'))
+    results = {}
+    for name, fn, n in [('score', score, args.nqueries),
+                        ('log_probs', log_probs, args.nqueries),
+                        ('log_probs (cached)', log_probs_cached, args.nqueries),
+                        ('scores_tensor', scores_tensor, len(beams)),
+                        ('next_states', next_states, len(beams))]:
+        if name == 'log_probs (cached)':
+            for state in states:
+                lm.log_probs(state)
+        queries = iter([(state, int(w)) for state, w in zip(states, ids[:, -1])])
+        batches = iter(beams)
+        results[name] = timeit(fn, n)
+        if name in ['scores_tensor', 'next_states']:
+            # Per hypothesis
+            results[name] /= args.beam_width
+        print('%-20s %14.2f' % (name, results[name]))
+
+    if results['score'] > args.max_us:
+        print('FAILED: a lookup takes %.2f us > %.2f us' % (results['score'], args.max_us))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
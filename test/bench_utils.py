@@ -0,0 +1,103 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Utilities shared by benchmarks of decoding."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import numpy as np
+import time
+import torch
+
+from conftest import DECODE_PARAMS
+from conftest import make_model
+from neural_sp.bin.asr.train_utils import load_config
+from neural_sp.evaluators.edit_distance import compute_wer
+from neural_sp.models.seq2seq.seq2seq import Seq2seq
+
+
+def add_model_args(parser):
+    """Add arguments to load a trained model or to build a random one."""
+    parser.add_argument('--model', type=str, default=None,
+                        help='directory of a trained model (a random model is built if not given)')
+    parser.add_argument('--feats', type=str, nargs='*', default=[],
+                        help='.npy files of input features (random features if not given)')
+    parser.add_argument('--nutts', type=int, default=20,
+                        help='the number of random utterances')
+    parser.add_argument('--min_len', type=int, default=200,
+                        help='the minimum number of frames of random utterances')
+    parser.add_argument('--max_len', type=int, default=800,
+                        help='the maximum number of frames of random utterances')
+    parser.add_argument('--input_dim', type=int, default=40,
+                        help='the dimension of random input features')
+    parser.add_argument('--vocab', type=int, default=500,
+                        help='the size of vocabulary of the random model')
+    parser.add_argument('--nunits', type=int, default=128,
+                        help='the number of units of the random model')
+    parser.add_argument('--gpu', action='store_true',
+                        help='decode on a GPU')
+    return parser
+
+
+def load_model(args, **kwargs):
+    """Load a trained model, or build a random model with the hyperparameters overridden by kwargs."""
+    if args.model is not None:
+        model = Seq2seq(argparse.Namespace(**load_config(args.model + '/config.yml')))
+        model.load_checkpoint(args.model, epoch=-1)
+    else:
+        kwargs = dict(dict(input_dim=args.input_dim, vocab=args.vocab, enc_nunits=args.nunits,
+                           enc_nlayers=4, subsample='1_2_2_1', dec_nunits=args.nunits,
+                           attn_dim=args.nunits, attn_conv_nchannels=10, attn_conv_width=50,
+                           emb_dim=args.nunits), **kwargs)
+        model = make_model(**kwargs)
+    if args.gpu:
+        model.cuda()
+    model.eval()
+    return model
+
+
+def load_feats(args):
+    """Load input features, or generate random features."""
+    if len(args.feats) > 0:
+        return [np.load(path).astype(np.float32) for path in args.feats]
+    rng = np.random.RandomState(0)
+    return [rng.randn(rng.randint(args.min_len, args.max_len + 1), args.input_dim).astype(np.float32)
+            for _ in range(args.nutts)]
+
+
+def decode_params(**kwargs):
+    """Decoding parameters of eval.py overridden by kwargs."""
+    return dict(DECODE_PARAMS, **kwargs)
+
+
+def timed_decode(model, xs, params, gpu=False):
+    """Decode utterances one by one.
+
+    Returns:
+        hyps (list): A list of length `[B]`, which contains lists of token indices
+        elapsed (list): decoding time of each utterance in seconds
+
+    """
+    hyps, elapsed = [], []
+    for x in xs:
+        if gpu:
+            torch.cuda.synchronize()
+        start = time.time()
+        best_hyps, _, _ = model.decode([x], params, exclude_eos=True)
+        if gpu:
+            torch.cuda.synchronize()
+        elapsed.append(time.time() - start)
+        hyps.append([int(y) for y in best_hyps[0]])
+    return hyps, elapsed
+
+
+def error_rate(refs, hyps):
+    """Token error rate [%] of hypotheses against references (e.g. hypotheses of the baseline)."""
+    nerrs = sum([int(compute_wer(ref, hyp)[0]) for ref, hyp in zip(refs, hyps)])
+    return nerrs * 100 / max(sum([len(ref) for ref in refs]), 1)
@@ -0,0 +1,134 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Fixtures of a tiny ASR model decoded on CPUs."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import codecs
+import numpy as np
+import os
+import pytest
+import torch
+
+from neural_sp.bin.asr.train_utils import save_config
+from neural_sp.models.rnnlm.rnnlm import RNNLM
+from neural_sp.models.rnnlm.rnnlm_seq import SeqRNNLM
+from neural_sp.models.seq2seq.seq2seq import Seq2seq
+
+VOCAB = 12
+INPUT_DIM = 5
+
+# Hyperparameters of train.py except for the size of the model
+MODEL_CONFIG = {
+    'input_type': 'speech', 'nsplices': 1, 'nstacks': 1, 'nskips': 1,
+    'conv_in_channel': 1, 'conv_channels': '', 'conv_kernel_sizes': '', 'conv_strides': '',
+    'conv_poolings': '', 'conv_batch_norm': False,
+    'enc_type': 'blstm', 'enc_nunits': 8, 'enc_nprojs': 0, 'enc_nlayers': 2,
+    'enc_nlayers_sub1': 0, 'enc_nlayers_sub2': 0, 'enc_residual': False,
+    'subsample': '1_1', 'subsample_type': 'drop',
+    'attn_type': 'location', 'attn_dim': 8, 'attn_conv_nchannels': 4, 'attn_conv_width': 3,
+    'attn_nheads': 1, 'attn_sharpening': 1.0, 'attn_sigmoid': False, 'bridge_layer': False,
+    'dec_type': 'lstm', 'dec_nunits': 8, 'dec_nprojs': 0, 'dec_nlayers': 1, 'dec_residual': False,
+    'init_with_enc': False, 'emb_dim': 6, 'tie_embedding': False, 'adaptive_softmax': False,
+    'input_feeding': False, 'ctc_fc_list': '', 'ctc_fc_list_sub1': '', 'ctc_fc_list_sub2': '',
+    'ctc_weight': 0.3, 'ctc_weight_sub1': 0., 'ctc_weight_sub2': 0.,
+    'ctc_backend': 'native', 'sub1_weight': 0., 'sub2_weight': 0., 'mtl_per_batch': False,
+    'task_specific_layer': False, 'bwd_weight': 0., 'bwd_weight_sub1': 0., 'bwd_weight_sub2': 0.,
+    'cold_fusion': 'hidden', 'rnnlm_cold_fusion': False, 'internal_lm': False, 'rnnlm_init': None,
+    'lmobj_weight': 0., 'lmobj_weight_sub1': 0., 'lmobj_weight_sub2': 0., 'share_lm_softmax': False,
+    'param_init': 0.1, 'param_init_dist': 'uniform', 'rec_weight_orthogonal': False,
+    'dropout_in': 0., 'dropout_enc': 0., 'dropout_dec': 0., 'dropout_emb': 0., 'dropout_att': 0.,
+    'logits_temp': 1.0, 'ss_prob': 0., 'lsm_prob': 0., 'layer_norm': False,
+    'focal_loss_weight': 0., 'focal_loss_gamma': 2.0,
+    'unit': 'word', 'vocab': VOCAB, 'vocab_sub1': None, 'vocab_sub2': None, 'input_dim': INPUT_DIM,
+}
+
+# Hyperparameters of lm/train.py
+# NOTE: the layer-wise implementation (residual connections) is used for the step-wise prediction
+RNNLM_CONFIG = {
+    'emb_dim': 6, 'rnn_type': 'lstm', 'nunits': 8, 'nlayers': 1, 'num_layers': 1, 'nprojs': 0,
+    'residual': True, 'tie_weights': False, 'backward': False, 'adaptive_softmax': False,
+    'dropout_emb': 0., 'dropout_hidden': 0., 'dropout_out': 0.,
+    'param_init': 0.1, 'param_init_dist': 'uniform', 'rec_weight_orthogonal': False, 'vocab': VOCAB,
+}
+
+# Decoding parameters of eval.py
+DECODE_PARAMS = {
+    'batch_size': 4, 'beam_width': 1, 'max_len_ratio': 1., 'min_len_ratio': 0.,
+    'length_penalty': 0., 'coverage_penalty': 0., 'coverage_threshold': 0.,
+    'rnnlm_weight': 0., 'ngram_weight': 0., 'recog_ctc_weight': 0., 'attn_window': 0,
+    'blank_skip_threshold': 0., 'blank_skip_min_frames': 1, 'blank_skip_merge': False,
+    'shortlist_threshold': 0., 'shortlist_nfrequent': 0, 'shortlist_max_error': 0.01,
+    'rescore_bwd_weight': 0., 'rescore_rnnlm_weight': 0.,
+    'resolving_unk': False, 'fwd_bwd_attention': False,
+}
+
+
+def make_model(**kwargs):
+    """Build a tiny Seq2seq model on CPUs.
+
+    Args:
+        kwargs: hyperparameters to override MODEL_CONFIG
+    Returns:
+        model (Seq2seq):
+
+    """
+    torch.manual_seed(1)
+    args = argparse.Namespace(**dict(MODEL_CONFIG, **kwargs))
+    model = Seq2seq(args)
+    model.eval()
+    return model
+
+
+def make_rnnlm(seq=False, **kwargs):
+    """Build a tiny RNNLM on CPUs.
+
+    Args:
+        seq (bool): build a sequence-level RNNLM (SeqRNNLM)
+        kwargs: hyperparameters to override RNNLM_CONFIG
+    Returns:
+        rnnlm (RNNLM or SeqRNNLM):
+
+    """
+    torch.manual_seed(2)
+    args = argparse.Namespace(**dict(RNNLM_CONFIG, **kwargs))
+    rnnlm = SeqRNNLM(args) if seq else RNNLM(args)
+    rnnlm.eval()
+    return rnnlm
+
+
+@pytest.fixture
+def model():
+    return make_model()
+
+
+@pytest.fixture
+def decode_params():
+    return dict(DECODE_PARAMS)
+
+
+@pytest.fixture
+def xs():
+    rng = np.random.RandomState(0)
+    return [rng.randn(xlen, INPUT_DIM).astype(np.float32) for xlen in [7, 12, 9, 4]]
+
+
+@pytest.fixture
+def model_dir(tmpdir, model):
+    """A directory of the model saved in the same layout as train.py."""
+    save_path = str(tmpdir.mkdir('model'))
+    save_config(MODEL_CONFIG, save_path)
+    with codecs.open(os.path.join(save_path, 'dict.txt'), 'w', 'utf-8') as f:
+        for i, w in enumerate(['<unk>', '<eos>', '<pad>'] + ['w%d' % i for i in range(VOCAB - 4)]):
+            f.write('%s %d\n' % (w, i + 1))
+    torch.save({'state_dict': model.state_dict(), 'optimizer': None,
+                'epoch': 1, 'step': 0, 'lr': 0., 'metric_dev_best': 0.},
+               os.path.join(save_path, 'model.epoch-1'))
+    return save_path
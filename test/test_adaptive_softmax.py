@@ -0,0 +1,81 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Test the adaptive softmax layer against a loop over clusters."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import pytest
+import torch
+import torch.nn.functional as F
+
+from conftest import make_model
+from neural_sp.models.linear import AdaptiveSoftmax
+
+VOCAB = 30
+NUNITS = 16
+
+
+def log_probs_loop(asm, xs):
+    """Log-probabilities of each token computed one by one from the head and the tail clusters."""
+    head_log_probs = F.log_softmax(asm.head(xs), dim=-1)
+    log_probs = xs.new_zeros(xs.size(0), asm.n_classes)
+    for i in range(xs.size(0)):
+        for c in range(asm.n_classes):
+            if c < asm.shortlist_size:
+                log_probs[i, c] = head_log_probs[i, c]
+                continue
+            for j in range(len(asm.cutoffs) - 1):
+                if asm.cutoffs[j] <= c < asm.cutoffs[j + 1]:
+                    tail_log_probs = F.log_softmax(asm.tail[j](xs[i:i + 1]), dim=-1)[0]
+                    log_probs[i, c] = head_log_probs[i, asm.shortlist_size + j] + \
+                        tail_log_probs[c - asm.cutoffs[j]]
+    return log_probs
+
+
+@pytest.fixture
+def asm():
+    torch.manual_seed(1)
+    return AdaptiveSoftmax(NUNITS, VOCAB, cutoffs=[4, 12])
+
+
+def test_log_probs(asm):
+    xs = torch.randn(2, 3, NUNITS)
+    log_probs = asm(xs)
+    assert log_probs.size() == (2, 3, VOCAB)
+    assert torch.allclose(log_probs.view(-1, VOCAB), log_probs_loop(asm.asm, xs.view(-1, NUNITS)), atol=1e-6)
+    assert torch.allclose(log_probs.exp().sum(-1), torch.ones(2, 3), atol=1e-6)
+
+
+def test_loss(asm):
+    xs = torch.randn(2, 5, NUNITS)
+    ys = torch.randint(0, VOCAB, (2, 5), dtype=torch.long)
+    ys[1, 3:] = -1
+    loss, acc = asm.loss(xs, ys, ignore_index=-1)
+
+    # The loss over the clusters of the references is the negative log-likelihood of the full distribution
+    log_probs = asm(xs)
+    loss_ref = F.nll_loss(log_probs.view(-1, VOCAB), ys.view(-1), ignore_index=-1, reduction='sum')
+    assert torch.allclose(loss, loss_ref, atol=1e-5)
+    mask = ys != -1
+    acc_ref = float((log_probs.argmax(-1) == ys).masked_select(mask).sum()) * 100 / float(mask.sum())
+    assert acc == pytest.approx(acc_ref)
+
+
+def test_decoder_loss():
+    # The cluster-wise loss of the decoder is the same as the loss over the full distribution
+    model = make_model(adaptive_softmax=True, ctc_weight=0., dec_nunits=16)
+    ys = [[4, 5, 6], [7, 8]]
+    eouts = torch.randn(2, 6, 16)
+    dec = model.dec_fwd
+    torch.manual_seed(0)
+    loss, _, _ = dec.forward_att(eouts, [6, 4], ys, -1)
+    dec.lsm_prob = 1e-12
+    torch.manual_seed(0)
+    loss_full, _, _ = dec.forward_att(eouts, [6, 4], ys, -1)
+    assert torch.allclose(loss, loss_full, atol=1e-4)
@@ -0,0 +1,125 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Test attention layers."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import pytest
+import torch
+
+from neural_sp.models.seq2seq.decoders.attention import AttentionMechanism
+from neural_sp.models.seq2seq.decoders.multihead_attention import MultiheadAttentionMechanism
+
+ENC_NUNITS = 6
+DEC_NUNITS = 6
+ATTN_TYPES = ['add', 'location', 'dot', 'luong_dot', 'luong_general', 'luong_concat']
+
+
+def make_attention(attn_type, nheads):
+    torch.manual_seed(1)
+    if nheads > 1:
+        return MultiheadAttentionMechanism(ENC_NUNITS, DEC_NUNITS, attn_type, 4,
+                                           conv_out_channels=3, conv_kernel_size=2, nheads=nheads)
+    return AttentionMechanism(ENC_NUNITS, DEC_NUNITS, attn_type, 4,
+                              conv_out_channels=3, conv_kernel_size=2)
+
+
+def make_inputs(nheads):
+    torch.manual_seed(0)
+    x_lens = [20, 13, 20, 6]
+    enc_out = torch.randn(len(x_lens), 20, ENC_NUNITS)
+    dec_out = torch.randn(len(x_lens), 1, DEC_NUNITS)
+    # Peaks of attention weights of the previous step differ among utterances
+    # including the first and last frames
+    peaks = [0, 12, 10, 5]
+    aw_step = torch.rand(len(x_lens), 20) * 0.1
+    for b, peak in enumerate(peaks):
+        aw_step[b, x_lens[b]:] = 0
+        aw_step[b, peak] = 1
+    aw_step = aw_step / aw_step.sum(-1, keepdim=True)
+    if nheads > 1:
+        aw_step = aw_step.unsqueeze(1).repeat(1, nheads, 1)
+    return enc_out, x_lens, dec_out, aw_step, peaks
+
+
+@pytest.mark.parametrize('attn_type', ATTN_TYPES)
+@pytest.mark.parametrize('nheads', [1, 2])
+@pytest.mark.parametrize('window', [1, 3])
+def test_window(monkeypatch, attn_type, nheads, window):
+    attn = make_attention(attn_type, nheads)
+    enc_out, x_lens, dec_out, aw_step, peaks = make_inputs(nheads)
+
+    # Reference: attend to all frames with energies outside windows masked
+    with torch.no_grad():
+        attn.reset()
+        attn(enc_out, x_lens, dec_out, None)
+        for b, peak in enumerate(peaks):
+            attn.mask[b, ..., :max(peak - window, 0)] = 0
+            attn.mask[b, ..., peak + window + 1:] = 0
+        context_ref, aw_ref = attn(enc_out, x_lens, dec_out, aw_step)
+
+    # Windows are computed on the device without synchronization with the host
+    def item(self):
+        raise AssertionError('Tensor.item() is called')
+    monkeypatch.setattr(torch.Tensor, 'item', item)
+    with torch.no_grad():
+        attn.reset()
+        context, aw = attn(enc_out, x_lens, dec_out, aw_step, window=window)
+    assert aw.size() == aw_step.size()
+    assert torch.allclose(context, context_ref, atol=1e-6)
+    assert torch.allclose(aw, aw_ref, atol=1e-6)
+
+
+@pytest.mark.parametrize('attn_type', ATTN_TYPES)
+@pytest.mark.parametrize('nheads', [1, 2])
+def test_window_covering_all_frames(attn_type, nheads):
+    attn = make_attention(attn_type, nheads)
+    enc_out, x_lens, dec_out, aw_step, _ = make_inputs(nheads)
+    with torch.no_grad():
+        attn.reset()
+        context_ref, aw_ref = attn(enc_out, x_lens, dec_out, aw_step)
+        for window in [10, 100]:
+            attn.reset()
+            context, aw = attn(enc_out, x_lens, dec_out, aw_step, window=window)
+            assert torch.allclose(context, context_ref, atol=1e-6)
+            assert torch.allclose(aw, aw_ref, atol=1e-6)
+
+
+def copy_single_head(single, multi):
+    """Copy parameters of AttentionMechanism to MultiheadAttentionMechanism of a single head."""
+    for name in ['w_enc', 'w_dec', 'w']:
+        if hasattr(single, name):
+            getattr(multi, name).load_state_dict(getattr(single, name).state_dict())
+    # Linear layers as 1x1 convolutions
+    for name in ['v', 'w_conv']:
+        if hasattr(single, name):
+            getattr(multi, name).weight.data.copy_(getattr(single, name).fc.weight.data.unsqueeze(2))
+    if hasattr(single, 'conv'):
+        multi.conv.weight.data.copy_(single.conv.weight.data)
+    # The output projection is the identity
+    multi.w_out.fc.weight.data.copy_(torch.eye(ENC_NUNITS))
+    multi.w_out.fc.bias.data.zero_()
+
+
+@pytest.mark.parametrize('attn_type', ATTN_TYPES)
+def test_single_head(attn_type):
+    single = make_attention(attn_type, nheads=1)
+    multi = MultiheadAttentionMechanism(ENC_NUNITS, DEC_NUNITS, attn_type, 4,
+                                        conv_out_channels=3, conv_kernel_size=2, nheads=1)
+    copy_single_head(single, multi)
+    enc_out, x_lens, dec_out, aw_step, _ = make_inputs(nheads=1)
+
+    with torch.no_grad():
+        for prev in [None, aw_step]:
+            single.reset()
+            multi.reset()
+            context_ref, aw_ref = single(enc_out, x_lens, dec_out, prev)
+            context, aw = multi(enc_out, x_lens, dec_out, None if prev is None else prev.unsqueeze(1))
+            assert torch.allclose(context, context_ref, atol=1e-6)
+            assert torch.allclose(aw.squeeze(1), aw_ref, atol=1e-6)
@@ -0,0 +1,37 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Test that decoding results do not depend on the other utterances in the mini-batch."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import pytest
+import torch
+
+from conftest import make_model
+
+
+@pytest.mark.parametrize('subsample', ['1_1_1', '1_2_1', '2_3_1'])
+def test_encoder_lengths(xs, subsample):
+    model = make_model(enc_nlayers=3, subsample=subsample)
+    with torch.no_grad():
+        enc_outs, perm_ids = model.encode(xs, 'ys')
+        for i, b in enumerate(perm_ids):
+            enc_out = model.encode([xs[b]], 'ys')[0]['ys']
+            assert enc_outs['ys']['xlens'][i] == enc_out['xlens'][0]
+            assert torch.allclose(enc_outs['ys']['xs'][i, :enc_out['xlens'][0]], enc_out['xs'][0], atol=1e-6)
+
+
+@pytest.mark.parametrize('beam_width', [1, 2])
+def test_decode(xs, decode_params, beam_width):
+    decode_params.update({'beam_width': beam_width})
+    model = make_model(enc_nlayers=3, subsample='1_2_1', param_init=1.)
+    best_hyps, _, perm_ids = model.decode(xs, decode_params, exclude_eos=True)
+    for i, b in enumerate(perm_ids):
+        assert np.array_equal(best_hyps[i], model.decode([xs[b]], decode_params, exclude_eos=True)[0][0])
@@ -0,0 +1,113 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Test the batched beam search against beam search of each utterance."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import math
+import numpy as np
+import pytest
+import torch
+import torch.nn.functional as F
+
+from conftest import make_model
+
+
+def beam_search_ref(dec, eouts, elen, beam_width, max_len_ratio, min_len_ratio,
+                    coverage_penalty=0., coverage_threshold=0.):
+    """Beam search of an utterance, which expands hypotheses one by one.
+
+    Args:
+        dec (Decoder):
+        eouts (FloatTensor): `[1, T, enc_units]`
+        elen (int):
+        beam_width (int):
+        max_len_ratio (float):
+        min_len_ratio (float):
+        coverage_penalty (float):
+        coverage_threshold (float):
+    Returns:
+        best (dict): the best hypothesis
+
+    """
+    eouts = eouts[:, :elen]
+    dec.score.reset()
+    _, dstate = dec.init_dec_state(1, dec.nlayers, -1, eouts, [elen])
+    _, _dstate = dec.init_dec_state(1, 1, -1, eouts, [elen])
+    beam = [{'hyp': [dec.sos], 'score': eouts.new_zeros(()), 'dstate': dstate, '_dstate': _dstate,
+             'context': eouts.new_zeros(1, 1, eouts.size(2)), 'aw': None, 'aws': [], 'cov': 0.}]
+    complete = []
+    for t in range(int(math.floor(elen * max_len_ratio)) + 1):
+        new_beam = []
+        for hyp in beam:
+            y = eouts.new_zeros(1, 1).fill_(hyp['hyp'][-1]).long()
+            # NOTE: lists of states are updated in place
+            dstate = tuple([list(s) if s is not None else None for s in hyp['dstate']])
+            _dstate = tuple([list(s) if s is not None else None for s in hyp['_dstate']])
+            dout, dstate, _, _dstate = dec.recurrency(dec.embed(y), hyp['context'], dstate, _dstate)
+            context, aw = dec.score(eouts, [elen], dout, hyp['aw'])
+            log_probs = F.log_softmax(dec.output(dec.generate(context, dout)).squeeze(1), dim=-1)[0]
+            # Recompute coverage from attention weights of all steps
+            aws = hyp['aws'] + [aw]
+            aw_sum = torch.stack(aws, dim=0).sum(0)
+            cov = aw_sum[aw_sum > coverage_threshold].sum() / dec.score.nheads
+            for c in range(log_probs.size(0)):
+                if c == dec.eos and t + 1 < elen * min_len_ratio:
+                    continue
+                score = hyp['score'] + log_probs[c]
+                if coverage_penalty > 0:
+                    score = score + (cov - hyp['cov']) * coverage_penalty
+                new_beam.append({'hyp': hyp['hyp'] + [c], 'score': score,
+                                 'dstate': dstate, '_dstate': _dstate, 'context': context, 'aw': aw,
+                                 'aws': aws, 'cov': cov})
+        new_beam = sorted(new_beam, key=lambda x: float(x['score']), reverse=True)[:beam_width]
+        complete += [hyp for hyp in new_beam if hyp['hyp'][-1] == dec.eos]
+        beam = [hyp for hyp in new_beam if hyp['hyp'][-1] != dec.eos]
+        if len(complete) >= beam_width or len(beam) == 0:
+            break
+    complete = complete[:beam_width] if len(complete) > 0 else beam
+    return sorted(complete, key=lambda x: float(x['score']), reverse=True)[0]
+
+
+@pytest.mark.parametrize('beam_width', [1, 2, 4])
+@pytest.mark.parametrize('min_len_ratio', [0., 0.5])
+def test_beam_search(xs, decode_params, beam_width, min_len_ratio):
+    decode_params.update({'beam_width': beam_width, 'min_len_ratio': min_len_ratio})
+    # NOTE: large weights avoid ties of hypotheses up to rounding errors
+    model = make_model(param_init=1.)
+    dec = model.dec_fwd
+    with torch.no_grad():
+        enc_outs, _ = model.encode(xs, 'ys')
+        eouts, elens = enc_outs['ys']['xs'], enc_outs['ys']['xlens']
+        nbest_hyps, _, scores = dec.beam_search(eouts, elens, decode_params, None)
+        for b in range(len(xs)):
+            ref = beam_search_ref(dec, eouts[b:b + 1], elens[b], beam_width,
+                                  decode_params['max_len_ratio'], min_len_ratio)
+            assert np.array_equal(nbest_hyps[b][0], ref['hyp'][1:])
+            assert scores[b][0][-1] == pytest.approx(float(ref['score']), rel=1e-5)
+
+
+@pytest.mark.parametrize('beam_width', [2, 4])
+@pytest.mark.parametrize('coverage_threshold', [0., 0.2])
+def test_coverage(xs, decode_params, beam_width, coverage_threshold):
+    # Running sums of attention weights give the same coverage as recomputation in each step
+    decode_params.update({'beam_width': beam_width, 'coverage_penalty': 0.5,
+                          'coverage_threshold': coverage_threshold})
+    model = make_model(param_init=1.)
+    dec = model.dec_fwd
+    with torch.no_grad():
+        enc_outs, _ = model.encode(xs, 'ys')
+        eouts, elens = enc_outs['ys']['xs'], enc_outs['ys']['xlens']
+        nbest_hyps, _, scores = dec.beam_search(eouts, elens, decode_params, None)
+        for b in range(len(xs)):
+            ref = beam_search_ref(dec, eouts[b:b + 1], elens[b], beam_width,
+                                  decode_params['max_len_ratio'], decode_params['min_len_ratio'],
+                                  coverage_penalty=0.5, coverage_threshold=coverage_threshold)
+            assert np.array_equal(nbest_hyps[b][0], ref['hyp'][1:])
+            assert scores[b][0][-1] == pytest.approx(float(ref['score']), rel=1e-5)
@@ -0,0 +1,67 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Test cold fusion with scheduled sampling in training."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import pytest
+import torch
+
+from conftest import make_rnnlm
+from conftest import VOCAB
+from neural_sp.models.seq2seq.decoders import decoder as decoder_module
+from neural_sp.models.seq2seq.decoders.decoder import Decoder
+
+ENC_NUNITS = 8
+
+
+def make_decoder(ss_prob):
+    torch.manual_seed(1)
+    return Decoder(sos=2, eos=2, pad=3, enc_nunits=ENC_NUNITS,
+                   attn_type='location', attn_dim=8, attn_sharpening_factor=1., attn_sigmoid_smoothing=False,
+                   attn_conv_out_channels=4, attn_conv_kernel_size=3, attn_nheads=1, dropout_att=0.,
+                   rnn_type='lstm', nunits=8, nlayers=1, residual=False, emb_dim=6, tie_embedding=False,
+                   vocab=VOCAB, logits_temp=1., dropout=0., dropout_emb=0., ss_prob=ss_prob, lsm_prob=0.,
+                   layer_norm=False, fl_weight=0., fl_gamma=2., rnnlm_cold_fusion=make_rnnlm(seq=True))
+
+
+@pytest.fixture
+def inputs():
+    torch.manual_seed(0)
+    return torch.randn(2, 6, ENC_NUNITS), [6, 4], [[4, 5, 6, 7], [8, 9]]
+
+
+def test_no_sampled_steps(inputs, monkeypatch):
+    # Scheduled sampling without sampled steps is the same as teacher forcing
+    loss, _, _ = make_decoder(ss_prob=0.).forward_att(*inputs, device_id=-1)
+    monkeypatch.setattr(decoder_module.random, 'random', lambda: 1.)
+    loss_ss, _, _ = make_decoder(ss_prob=0.5).forward_att(*inputs, device_id=-1)
+    assert torch.allclose(loss, loss_ss, atol=1e-6)
+
+
+def test_sampled_steps(inputs, monkeypatch):
+    # The RNNLM is run once per step on the sampled history
+    dec = make_decoder(ss_prob=0.5)
+    predict = dec.rnnlm_cf.predict
+    calls = []
+
+    def predict_record(y_emb, state):
+        logits, out, state = predict(y_emb, state)
+        calls.append((y_emb, out))
+        return logits, out, state
+
+    monkeypatch.setattr(dec.rnnlm_cf, 'predict', predict_record)
+    monkeypatch.setattr(decoder_module.random, 'random', lambda: 0.)
+    dec.forward_att(*inputs, device_id=-1)
+    assert len(calls) == max([len(y) for y in inputs[2]]) + 1
+    assert all([y_emb.size(1) == 1 for y_emb, _ in calls])
+
+    # The step-wise outputs are the same as those of the whole history at once
+    _, outs, _ = predict(torch.cat([y_emb for y_emb, _ in calls], dim=1), None)
+    assert torch.allclose(outs, torch.cat([out for _, out in calls], dim=1), atol=1e-6)
@@ -0,0 +1,113 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Test criterions against loops over utterances."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import math
+import pytest
+import torch
+import torch.nn.functional as F
+
+from neural_sp.models.criterion import cross_entropy_lsm
+from neural_sp.models.criterion import focal_loss
+from neural_sp.models.criterion import kldiv_lsm_ctc
+
+VOCAB = 7
+
+
+def cross_entropy_lsm_loop(logits, ys, y_lens, lsm_prob, size_average=False):
+    bs, _, vocab = logits.size()
+    fill_val = lsm_prob / (vocab - 1)
+    ys_lsm = torch.zeros_like(logits).fill_(fill_val)
+    for b in range(bs):
+        for t in range(y_lens[b]):
+            ys_lsm[b, t, ys[b, t]] = 1 - lsm_prob
+    log_probs = F.log_softmax(logits, dim=-1)
+    loss = sum([(- ys_lsm[b, :y_lens[b]] * log_probs[b, :y_lens[b]]).sum() for b in range(bs)])
+    if size_average:
+        loss /= bs
+    return loss
+
+
+def kldiv_lsm_ctc_loop(logits, y_lens, lsm_prob, size_average=False):
+    bs, _, vocab = logits.size()
+    log_uniform = torch.zeros_like(logits).fill_(math.log(lsm_prob))
+    probs = F.softmax(logits, dim=-1)
+    log_probs = F.log_softmax(logits, dim=-1)
+    kl_div = torch.mul(probs, log_probs) - torch.mul(probs, log_uniform)
+    loss = sum([kl_div[b, :y_lens[b]].sum() for b in range(bs)])
+    if size_average:
+        loss /= bs
+    return loss
+
+
+def focal_loss_loop(logits, ys, y_lens, gamma, size_average=False):
+    bs = ys.size(0)
+    ys_onehot = torch.zeros_like(logits)
+    for b in range(bs):
+        for t in range(y_lens[b]):
+            ys_onehot[b, t, ys[b, t]] = 1
+    log_probs = F.log_softmax(logits, dim=-1)
+    probs = F.softmax(logits, dim=-1)
+    loss = sum([(- ys_onehot[b, :y_lens[b]] * log_probs[b, :y_lens[b]] *
+                 torch.pow(1 - probs[b, :y_lens[b]], gamma)).sum() for b in range(bs)])
+    if size_average:
+        loss /= bs
+    return loss
+
+
+@pytest.fixture
+def batch():
+    """Padded mini-batch of ragged lengths, where logits are longer than the longest label sequence."""
+    torch.manual_seed(0)
+    y_lens = [5, 1, 3, 5, 2]
+    logits = torch.randn(len(y_lens), max(y_lens) + 2, VOCAB, dtype=torch.float64)
+    ys = torch.randint(0, VOCAB, (len(y_lens), max(y_lens)), dtype=torch.long)
+    for b, y_len in enumerate(y_lens):
+        ys[b, y_len:] = -1
+    return logits, ys, y_lens
+
+
+def check(fn, fn_loop, logits, y_lens):
+    """Check values and gradients w.r.t. logits."""
+    logits = logits.clone().requires_grad_()
+    loss = fn(logits)
+    grad, = torch.autograd.grad(loss, logits)
+    logits_ref = logits.detach().clone().requires_grad_()
+    loss_ref = fn_loop(logits_ref)
+    grad_ref, = torch.autograd.grad(loss_ref, logits_ref)
+    assert torch.allclose(loss, loss_ref)
+    assert torch.allclose(grad, grad_ref)
+    # No gradients flow from padded positions
+    assert grad[:, max(y_lens):].abs().sum() == 0
+
+
+@pytest.mark.parametrize('lsm_prob', [0., 0.1, 0.5])
+@pytest.mark.parametrize('size_average', [False, True])
+def test_cross_entropy_lsm(batch, lsm_prob, size_average):
+    logits, ys, y_lens = batch
+    check(lambda x: cross_entropy_lsm(x, ys, y_lens, lsm_prob, size_average),
+          lambda x: cross_entropy_lsm_loop(x, ys, y_lens, lsm_prob, size_average), logits, y_lens)
+
+
+@pytest.mark.parametrize('gamma', [0., 1., 2.])
+@pytest.mark.parametrize('size_average', [False, True])
+def test_focal_loss(batch, gamma, size_average):
+    logits, ys, y_lens = batch
+    check(lambda x: focal_loss(x, ys, y_lens, gamma, size_average),
+          lambda x: focal_loss_loop(x, ys, y_lens, gamma, size_average), logits, y_lens)
+
+
+@pytest.mark.parametrize('lsm_prob', [0.1, 0.5])
+@pytest.mark.parametrize('size_average', [False, True])
+def test_kldiv_lsm_ctc(batch, lsm_prob, size_average):
+    logits, _, y_lens = batch
+    check(lambda x: kldiv_lsm_ctc(x, y_lens, lsm_prob, size_average),
+          lambda x: kldiv_lsm_ctc_loop(x, y_lens, lsm_prob, size_average), logits, y_lens)
@@ -0,0 +1,75 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Test the CTC loss of the decoder."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import itertools
+import math
+import pytest
+import torch
+import torch.nn.functional as F
+
+from conftest import make_model
+from neural_sp.models.seq2seq.decoders import decoder as decoder_module
+
+
+def ctc_loss_enumerate(log_probs, ys):
+    """Negative log-likelihood of labels summed over all alignments `[T, vocab]`."""
+    total = -float('inf')
+    for path in itertools.product(range(log_probs.size(1)), repeat=log_probs.size(0)):
+        # Collapse repeated tokens and remove blanks
+        labels = [c for i, c in enumerate(path) if c != 0 and (i == 0 or c != path[i - 1])]
+        if labels == list(ys):
+            score = float(sum([log_probs[t, c] for t, c in enumerate(path)]))
+            total = max(total, score) + math.log1p(math.exp(-abs(total - score)))
+    return -total
+
+
+def test_native_loss():
+    model = make_model(ctc_backend='native', vocab=4, dec_nunits=4)
+    dec = model.dec_fwd
+    torch.manual_seed(0)
+    eouts = torch.randn(3, 5, 16)
+    elens = [5, 4, 3]
+    ys = [[1, 1], [3, 2, 1], [2]]
+    loss = dec.forward_ctc(eouts, elens, ys, -1)
+
+    log_probs = F.log_softmax(dec.output_ctc(eouts), dim=-1).detach()
+    loss_ref = sum([ctc_loss_enumerate(log_probs[b, :elens[b]], ys[b]) for b in range(3)]) / 3
+    assert loss.item() == pytest.approx(loss_ref, rel=1e-5)
+
+
+def test_infeasible_labels():
+    model = make_model(ctc_backend='native')
+    dec = model.dec_fwd
+    eouts = torch.randn(2, 4, 16, requires_grad=True)
+    # The first labels need at least 5 frames
+    loss = dec.forward_ctc(eouts, [3, 4], [[4, 4, 5], [6, 7]], -1)
+    loss.backward()
+    assert torch.isfinite(loss).all()
+    assert torch.isfinite(eouts.grad).all()
+
+
+@pytest.mark.skipif(decoder_module.warpctc_pytorch is not None, reason='warpctc_pytorch is installed')
+def test_fallback_to_native():
+    # Configs saved before the native backend was added
+    model = make_model(ctc_backend='warpctc')
+    assert model.dec_fwd.ctc_backend == 'native'
+
+
+@pytest.mark.skipif(decoder_module.warpctc_pytorch is None, reason='warpctc_pytorch is not installed')
+def test_warpctc():
+    torch.manual_seed(0)
+    eouts = torch.randn(3, 6, 16)
+    elens = [6, 4, 5]
+    ys = [[4, 4], [5, 6, 7], [8]]
+    losses = [make_model(ctc_backend=backend).dec_fwd.forward_ctc(eouts, elens, ys, -1)
+              for backend in ['native', 'warpctc']]
+    assert losses[0].item() == pytest.approx(losses[1].item(), rel=1e-4)
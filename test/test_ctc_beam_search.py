@@ -0,0 +1,140 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Test the CTC prefix beam search against the previous decoder and exhaustive search."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import itertools
+import numpy as np
+import pytest
+import torch
+import torch.nn.functional as F
+
+from neural_sp.models.seq2seq.decoders.ctc_beam_search_decoder import BeamSearchDecoder
+from neural_sp.models.torch_utils import tensor2np
+
+LOG_0 = -float("inf")
+LOG_1 = 0
+
+
+class BeamSearchDecoderRef(object):
+    """The previous decoder, which does not merge identical prefixes (without RNNLM)."""
+
+    def __init__(self, blank_index):
+        self.blank = blank_index
+
+    def __call__(self, log_probs, x_lens, beam_width=1):
+        batch_size, _, vocab = log_probs.size()
+        best_hyps = []
+
+        for b in range(batch_size):
+            # Elements in the beam are (prefix, (p_blank, p_no_blank))
+            beam = [{'hyp': [],
+                     'p_blank': LOG_1,
+                     'p_nonblank': LOG_1}]
+
+            for t in range(x_lens[b]):
+                new_beam = []
+
+                # Pick up the top-k scores
+                log_probs_topk, indices_topk = torch.topk(
+                    log_probs[:, t, :], k=beam_width, dim=-1, largest=True, sorted=True)
+
+                for c in tensor2np(indices_topk)[b]:
+                    p_t = log_probs[b, t, c].item()
+
+                    for i_beam in range(len(beam)):
+                        prefix = beam[i_beam]['hyp']
+                        p_blank = beam[i_beam]['p_blank']
+                        p_nonblank = beam[i_beam]['p_nonblank']
+
+                        # If we propose a blank the prefix doesn't change.
+                        if c == self.blank:
+                            new_p_blank = np.logaddexp(
+                                p_blank + p_t, p_nonblank + p_t)
+                            new_beam.append({'hyp': beam[i_beam]['hyp'],
+                                             'p_blank': new_p_blank,
+                                             'p_nonblank': LOG_0})
+                            continue
+
+                        # Extend the prefix by the new character c
+                        prefix_end = prefix[-1] if len(prefix) > 0 else None
+                        new_p_blank = LOG_0
+                        new_p_nonblank = LOG_0
+                        if c != prefix_end:
+                            new_p_nonblank = np.logaddexp(
+                                p_blank + p_t, p_nonblank + p_t)
+                        else:
+                            new_p_nonblank = p_blank + p_t
+
+                        new_beam.append({'hyp': beam[i_beam]['hyp'] + [c],
+                                         'p_blank': new_p_blank,
+                                         'p_nonblank': new_p_nonblank})
+
+                        # If c is repeated at the end we also update the unchanged prefix.
+                        if c == prefix_end:
+                            new_p_nonblank = p_nonblank + p_t
+                            new_beam.append({'hyp': beam[i_beam]['hyp'],
+                                             'p_blank': new_p_blank,
+                                             'p_nonblank': new_p_nonblank})
+
+                # Sort and trim the beam before moving on to the next time-step.
+                beam = sorted(new_beam,
+                              key=lambda x: np.logaddexp(x['p_blank'], x['p_nonblank']),
+                              reverse=True)
+                beam = beam[:beam_width]
+
+            best_hyps.append(np.array(beam[0]['hyp']))
+
+        return best_hyps
+
+
+def best_labels_exhaustive(log_probs):
+    """The label sequence with the highest probability summed over all alignments `[T, vocab]`."""
+    probs = {}
+    for path in itertools.product(range(log_probs.shape[1]), repeat=log_probs.shape[0]):
+        # Collapse repeated labels and remove blanks
+        labels = tuple([c for i, c in enumerate(path) if c != 0 and (i == 0 or c != path[i - 1])])
+        probs[labels] = np.logaddexp(probs.get(labels, LOG_0), sum([log_probs[t, c] for t, c in enumerate(path)]))
+    return max(probs.items(), key=lambda x: x[1])[0]
+
+
+def peaky_log_probs(bs, max_len, vocab, seed):
+    """CTC posteriors, most of which are dominated by a label or blank."""
+    rng = np.random.RandomState(seed)
+    logits = rng.randn(bs, max_len, vocab) + 5 * np.eye(vocab)[rng.randint(0, vocab, (bs, max_len))]
+    return F.log_softmax(torch.from_numpy(logits.astype(np.float32)), dim=-1)
+
+
+@pytest.mark.parametrize('beam_width', [1, 2, 4, 8])
+@pytest.mark.parametrize('seed', range(5))
+def test_same_as_previous_decoder(beam_width, seed):
+    log_probs = peaky_log_probs(3, 20, 10, seed)
+    x_lens = [20, 17, 9]
+    hyps = BeamSearchDecoder(blank_index=0)(log_probs, x_lens, beam_width)
+    hyps_ref = BeamSearchDecoderRef(blank_index=0)(log_probs, x_lens, beam_width)
+    for hyp, hyp_ref in zip(hyps, hyps_ref):
+        assert hyp.tolist() == hyp_ref.tolist()
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_exhaustive(seed):
+    # All prefixes are kept in the beam, so prefix search is exact
+    T, vocab = 4, 3
+    log_probs = F.log_softmax(torch.from_numpy(np.random.RandomState(seed).randn(1, T, vocab)), dim=-1)
+    hyp = BeamSearchDecoder(blank_index=0)(log_probs, [T], beam_width=(vocab - 1) ** (T + 1))[0]
+    assert tuple(hyp.tolist()) == best_labels_exhaustive(tensor2np(log_probs[0]))
+
+
+def test_merge_alignments():
+    # The best path is [1, 0, 0] -> (1,), but (1, 2) is more likely over all alignments
+    log_probs = torch.tensor([[0.4, 0.6, 0.], [0.6, 0., 0.4], [0.6, 0., 0.4]]).log().unsqueeze(0)
+    assert best_labels_exhaustive(tensor2np(log_probs[0])) == (1, 2)
+    hyp = BeamSearchDecoder(blank_index=0)(log_probs, [3], beam_width=4)[0]
+    assert hyp.tolist() == [1, 2]
@@ -0,0 +1,85 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Test CTC prefix scores against enumeration of all alignments."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import itertools
+import numpy as np
+import pytest
+import torch
+import torch.nn.functional as F
+
+from neural_sp.models.seq2seq.decoders.ctc_prefix_score import CTCPrefixScore
+from neural_sp.models.seq2seq.decoders.ctc_prefix_score import LOG_0
+
+BLANK = 0
+EOS = 2
+VOCAB = 5
+
+
+def prefix_probs_enumerate(log_probs):
+    """Log-probabilities of label sequences and of their prefixes summed over all alignments.
+
+    Args:
+        log_probs (np.ndarray): `[T, vocab]`
+    Returns:
+        seq_probs (dict): log-probabilities of label sequences
+        prefix_probs (dict): log-probabilities of all label sequences starting with each prefix
+
+    """
+    seq_probs, prefix_probs = {}, {}
+    for path in itertools.product(range(log_probs.shape[1]), repeat=log_probs.shape[0]):
+        # Collapse repeated labels and remove blanks
+        labels = tuple([c for i, c in enumerate(path) if c != BLANK and (i == 0 or c != path[i - 1])])
+        p = sum([log_probs[t, c] for t, c in enumerate(path)])
+        seq_probs[labels] = np.logaddexp(seq_probs.get(labels, -np.inf), p)
+        for i in range(len(labels) + 1):
+            prefix_probs[labels[:i]] = np.logaddexp(prefix_probs.get(labels[:i], -np.inf), p)
+    return seq_probs, prefix_probs
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_prefix_scores(seed):
+    elens = [5, 3]
+    beam_width = 2
+    # Hypotheses of each utterance, including repeated labels
+    hyps = [[1, 3, 3], [4, 1, 1], [3, 4, 1], [1, 1, 4]]
+    torch.manual_seed(seed)
+    log_probs = F.log_softmax(torch.randn(len(elens), max(elens), VOCAB), dim=-1)
+    refs = [prefix_probs_enumerate(log_probs[b, :elens[b]].double().numpy()) for b in range(len(elens))]
+
+    ctc_prefix_score = CTCPrefixScore(log_probs, elens, BLANK, EOS, beam_width)
+    state = ctc_prefix_score.initial_state()
+    ids_hyp = torch.arange(len(hyps))
+    cands = torch.arange(VOCAB).unsqueeze(0).expand(len(hyps), VOCAB).contiguous()
+    y_prev = torch.full((len(hyps),), -1, dtype=torch.long)
+    for t in range(len(hyps[0])):
+        scores, r, log_psi = ctc_prefix_score(t, y_prev, cands, state)
+        for i, hyp in enumerate(hyps):
+            seq_probs, prefix_probs = refs[i // beam_width]
+            for c in range(VOCAB):
+                if c == BLANK:
+                    assert scores[i, c] == -float('inf')
+                    continue
+                if c == EOS:
+                    ref = seq_probs.get(tuple(hyp[:t]), -np.inf)
+                else:
+                    ref = prefix_probs.get(tuple(hyp[:t] + [c]), -np.inf)
+                if ref == -np.inf:
+                    # The prefix cannot be emitted within the input length
+                    assert log_psi[i, c] <= LOG_0 / 2
+                    assert scores[i, c] == -float('inf')
+                else:
+                    assert log_psi[i, c].item() == pytest.approx(ref, abs=1e-4)
+                    assert (scores[i, c] + state[1][i]).item() == pytest.approx(ref, abs=1e-4)
+
+        # Extend each hypothesis by its next label
+        y_prev = torch.tensor([hyp[t] for hyp in hyps])
+        state = (r[:, :, ids_hyp, y_prev], log_psi[ids_hyp, y_prev])
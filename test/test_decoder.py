@@ -0,0 +1,111 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Test the attention-based decoder."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import pytest
+import torch
+import torch.nn.functional as F
+
+from conftest import VOCAB
+from neural_sp.models.seq2seq.decoders import decoder as decoder_module
+
+
+@pytest.mark.parametrize('merge', [False, True])
+@pytest.mark.parametrize('min_frames', [0, 1, 3])
+def test_skip_all_blank_frames(model, xs, decode_params, merge, min_frames):
+    dec = model.dec_fwd
+    with torch.no_grad():
+        enc_outs, _ = model.encode(xs, 'ys')
+        eouts, elens = enc_outs['ys']['xs'], enc_outs['ys']['xlens']
+
+        # Every frame is regarded as blank
+        eouts_skip, elens_skip = dec.skip_blank_frames(eouts, elens, threshold=1e-9, min_frames=min_frames,
+                                                       merge=merge)
+    for elen, elen_skip in zip(elens, elens_skip):
+        if merge:
+            assert 1 <= elen_skip <= elen
+        else:
+            assert elen_skip == min(max(min_frames, 1), elen)
+    assert eouts_skip.size(1) == max(elens_skip)
+
+    decode_params.update({'blank_skip_threshold': 1e-9, 'blank_skip_min_frames': min_frames,
+                          'blank_skip_merge': merge})
+    for beam_width in [1, 3]:
+        decode_params['beam_width'] = beam_width
+        best_hyps, _, _ = model.decode(xs, decode_params, exclude_eos=True)
+        assert len(best_hyps) == len(xs)
+
+
+def test_skip_no_frames(model, xs, decode_params):
+    # A threshold above 1 keeps all frames
+    ref = model.decode(xs, decode_params, exclude_eos=True)[0]
+    decode_params['blank_skip_threshold'] = 1.1
+    hyps = model.decode(xs, decode_params, exclude_eos=True)[0]
+    assert all([np.array_equal(h, r) for h, r in zip(hyps, ref)])
+
+
+@pytest.mark.parametrize('shortlist_threshold', [0., 0.01])
+def test_skip_ctc_original_frames(model, xs, decode_params, monkeypatch, shortlist_threshold):
+    # CTC prefix scores and shortlists are computed over all frames before blank skipping
+    calls = []
+    CTCPrefixScore = decoder_module.CTCPrefixScore
+
+    def ctc_prefix_score(log_probs, elens, *args):
+        calls.append((log_probs.size(1), list(elens)))
+        return CTCPrefixScore(log_probs, elens, *args)
+
+    monkeypatch.setattr(decoder_module, 'CTCPrefixScore', ctc_prefix_score)
+    with torch.no_grad():
+        enc_outs, _ = model.encode(xs, 'ys')
+    decode_params.update({'beam_width': 3, 'recog_ctc_weight': 0.3, 'shortlist_threshold': shortlist_threshold,
+                          'blank_skip_threshold': 1e-9, 'blank_skip_min_frames': 2})
+    best_hyps, _, _ = model.decode(xs, decode_params, exclude_eos=True)
+    assert len(best_hyps) == len(xs)
+    assert calls == [(enc_outs['ys']['xs'].size(1), enc_outs['ys']['xlens'])]
+
+
+@pytest.mark.parametrize('max_error', [0.01, 0.1, 1.])
+def test_shortlist_fallback(model, xs, max_error):
+    dec = model.dec_fwd
+    torch.manual_seed(0)
+    with torch.no_grad():
+        enc_outs, _ = model.encode(xs, 'ys')
+        ctc_log_probs = F.log_softmax(dec.output_ctc(enc_outs['ys']['xs']), dim=-1)
+        shortlist = dec.make_shortlist(ctc_log_probs, enc_outs['ys']['xlens'], threshold=0.05,
+                                       nfrequent=0, eos=2, beam_width=4)
+        attentional = torch.randn(len(xs) * 4, dec.output.fc.weight.size(1))
+        log_probs, is_fallback = dec.shortlist_log_softmax(attentional, shortlist, max_error)
+        log_probs_full = F.log_softmax(dec.output(attentional), dim=1)
+    assert 0 < shortlist['ids'].size(0) < VOCAB
+
+    # Hypotheses over the bound get the full softmax, and the others are within the bound
+    is_fallback = is_fallback.numpy() > 0
+    in_list = (shortlist['mask'].numpy() == 0)
+    for i in range(log_probs.size(0)):
+        if is_fallback[i]:
+            assert torch.allclose(log_probs[i], log_probs_full[i])
+        else:
+            ids = shortlist['ids'].numpy()[in_list[i]]
+            error = (log_probs[i] - log_probs_full[i]).numpy()[ids]
+            assert (error > -1e-5).all() and (error < max_error + 1e-5).all()
+            assert len(ids) + int(np.isinf(log_probs[i].numpy()).sum()) == VOCAB
+
+    # The bound of the maximum logit out of the shortlist is not looser than the Cauchy-Schwarz bound
+    logit_out_max_cs = attentional.norm(p=2, dim=1) * shortlist['norm_out'] + shortlist['bias_out']
+    error_cs = F.softplus(shortlist['log_nout'] + logit_out_max_cs -
+                          torch.logsumexp(torch.matmul(attentional, shortlist['weight'].t()) +
+                                          shortlist['bias'] + shortlist['mask'], dim=1))
+    is_fallback_cs = error_cs.numpy() > max_error
+    assert (is_fallback <= is_fallback_cs).all()
+    if max_error == 0.1:
+        # Fallbacks are decided per hypothesis
+        assert 0 < is_fallback.sum() < len(is_fallback)
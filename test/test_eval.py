@@ -0,0 +1,47 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Test sharding of evaluation sets for parallel decoding."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import importlib
+import pandas as pd
+import pytest
+import sys
+
+
+@pytest.fixture
+def eval_module(monkeypatch):
+    monkeypatch.setattr(sys, 'argv', ['eval.py'])
+    return importlib.import_module('neural_sp.bin.asr.eval')
+
+
+@pytest.fixture
+def eval_set():
+    df = pd.DataFrame({'utt_id': ['spk1_%07d_%07d' % (i, i + 1) for i in range(6)],
+                       'x_len': [50, 300, 120, 80, 200, 10],
+                       'text': [u'あい う', u'a b c', u'えお', u'か き く け', u'x', u'さ']})
+    return argparse.Namespace(df=df)
+
+
+def test_make_shards(eval_module, eval_set):
+    shards = eval_module.make_shards(eval_set, 3)
+    assert sorted(sum(shards, [])) == list(eval_set.df.index)
+    for indices in shards:
+        assert indices == sorted(indices)
+    nframes = [eval_set.df['x_len'][indices].sum() for indices in shards]
+    assert max(nframes) - min(nframes) <= eval_set.df['x_len'].max()
+
+
+def test_count_units(eval_module, eval_set):
+    # Characters are counted instead of bytes of utf-8
+    assert eval_module.count_units(eval_set, [0]) == (2, 4)
+    assert eval_module.count_units(eval_set, [0, 1, 2]) == (2 + 3 + 1, 4 + 5 + 2)
+
@@ -0,0 +1,101 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Test the vectorized merging of forward and backward hypotheses against the previous loops."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import pytest
+
+from neural_sp.models.seq2seq.seq2seq import fwd_bwd_attention
+
+EOS = 2
+
+
+def fwd_bwd_attention_ref(nbest_hyps_fwd, aws_fwd, scores_fwd,
+                          nbest_hyps_bwd, aws_bwd, scores_bwd):
+    """The previous implementation with nested loops over positions (without logging)."""
+    batch_size = len(nbest_hyps_fwd)
+    nbest = len(nbest_hyps_fwd[0])
+
+    best_hyps = []
+    for b in range(batch_size):
+        merged = []
+        for n in range(nbest):
+            # forward
+            if len(nbest_hyps_fwd[b][n]) > 1:
+                if nbest_hyps_fwd[b][n][-1] == EOS:
+                    merged.append({'hyp': nbest_hyps_fwd[b][n][:-1],
+                                   'score': scores_fwd[b][n][-2]})
+                else:
+                    merged.append({'hyp': nbest_hyps_fwd[b][n],
+                                   'score': scores_fwd[b][n][-1]})
+
+            # backward
+            if len(nbest_hyps_bwd[b][n]) > 1:
+                if nbest_hyps_bwd[b][n][0] == EOS:
+                    merged.append({'hyp': nbest_hyps_bwd[b][n][1:],
+                                   'score': scores_bwd[b][n][1]})
+                else:
+                    merged.append({'hyp': nbest_hyps_bwd[b][n],
+                                   'score': scores_bwd[b][n][0]})
+
+        for n_f in range(nbest):
+            for n_b in range(nbest):
+                for i_f in range(len(aws_fwd[b][n_f]) - 1):
+                    for i_b in range(len(aws_bwd[b][n_b]) - 1):
+                        t_prev = aws_bwd[b][n_b][i_b + 1].argmax(-1).item()
+                        t_curr = aws_fwd[b][n_f][i_f].argmax(-1).item()
+                        t_next = aws_bwd[b][n_b][i_b - 1].argmax(-1).item()
+
+                        # the same token at the same time
+                        if t_curr >= t_prev and t_curr <= t_next and \
+                                nbest_hyps_fwd[b][n_f][i_f] == nbest_hyps_bwd[b][n_b][i_b]:
+                            new_hyp = nbest_hyps_fwd[b][n_f][:i_f + 1].tolist() + \
+                                nbest_hyps_bwd[b][n_b][i_b + 1:].tolist()
+                            score_curr_fwd = scores_fwd[b][n_f][i_f] - scores_fwd[b][n_f][i_f - 1]
+                            score_curr_bwd = scores_bwd[b][n_b][i_b] - scores_bwd[b][n_b][i_b + 1]
+                            score_curr = max(score_curr_fwd, score_curr_bwd)
+                            new_score = scores_fwd[b][n_f][i_f - 1] + scores_bwd[b][n_b][i_b + 1] + score_curr
+                            merged.append({'hyp': new_hyp, 'score': new_score})
+
+        merged = sorted(merged, key=lambda x: x['score'], reverse=True)
+        best_hyps.append(merged[0]['hyp'])
+
+    return best_hyps
+
+
+def random_nbest(rng, nbest, T, vocab, backward):
+    """Random N-best hypotheses with attention weights and cumulative scores."""
+    hyps, aws, scores = [], [], []
+    for _ in range(nbest):
+        L = rng.randint(1, 8)
+        hyp = rng.randint(4, vocab, L)
+        if rng.rand() < 0.8:
+            hyp[0 if backward else -1] = EOS
+        hyps.append(hyp)
+        aws.append(rng.rand(L, T))
+        score = np.cumsum(-rng.rand(L))
+        scores.append(score[::-1].copy() if backward else score)
+    return hyps, aws, scores
+
+
+@pytest.mark.parametrize('nbest', [1, 2, 4])
+@pytest.mark.parametrize('seed', range(20))
+def test_fwd_bwd_attention(nbest, seed):
+    rng = np.random.RandomState(seed)
+    batch_size, T, vocab = 3, 6, 6
+    fwd = [random_nbest(rng, nbest, T, vocab, backward=False) for _ in range(batch_size)]
+    bwd = [random_nbest(rng, nbest, T, vocab, backward=True) for _ in range(batch_size)]
+    inputs = [[x[i] for x in fwd] for i in range(3)] + [[x[i] for x in bwd] for i in range(3)]
+
+    best_hyps = fwd_bwd_attention(*inputs)
+    best_hyps_ref = fwd_bwd_attention_ref(*inputs)
+    for hyp, hyp_ref in zip(best_hyps, best_hyps_ref):
+        assert list(hyp) == list(hyp_ref)
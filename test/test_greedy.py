@@ -0,0 +1,73 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Test the batched greedy decoding against greedy decoding of each utterance."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import math
+import numpy as np
+import pytest
+import torch
+
+from conftest import make_model
+from neural_sp.models.torch_utils import tensor2np
+
+
+def greedy_ref(dec, eouts, elen, max_len):
+    """Greedy decoding of an utterance, which stops at the first <eos>.
+
+    Args:
+        dec (Decoder):
+        eouts (FloatTensor): `[1, T, enc_units]`
+        elen (int):
+        max_len (int):
+    Returns:
+        hyp (np.ndarray): `[L]`
+        aws (np.ndarray): `[L, elen]`
+
+    """
+    eouts = eouts[:, :elen]
+    dec.score.reset()
+    _, dstate = dec.init_dec_state(1, dec.nlayers, -1, eouts, [elen])
+    _, _dstate = dec.init_dec_state(1, 1, -1, eouts, [elen])
+    context = eouts.new_zeros(1, 1, eouts.size(2))
+    y = eouts.new_zeros(1, 1).fill_(dec.sos).long()
+    aw = None
+    hyp, aws = [], []
+    for t in range(max_len):
+        dout, dstate, _, _dstate = dec.recurrency(dec.embed(y), context, dstate, _dstate)
+        context, aw = dec.score(eouts, [elen], dout, aw)
+        y = dec.output(dec.generate(context, dout)).argmax(-1)
+        hyp.append(y.item())
+        aws.append(aw[0])
+        if y.item() == dec.eos:
+            break
+    return np.array(hyp), tensor2np(torch.stack(aws, dim=0))
+
+
+@pytest.mark.parametrize('check_interval', [1, 2, 3, 8, 100])
+@pytest.mark.parametrize('exclude_eos', [False, True])
+def test_greedy(xs, check_interval, exclude_eos):
+    # NOTE: large weights make utterances finish at different steps
+    model = make_model(param_init=1.)
+    dec = model.dec_fwd
+    with torch.no_grad():
+        enc_outs, _ = model.encode(xs, 'ys')
+        eouts, elens = enc_outs['ys']['xs'], enc_outs['ys']['xlens']
+        best_hyps, aws = dec.greedy(eouts, elens, max_len_ratio=1., exclude_eos=exclude_eos,
+                                    check_interval=check_interval)
+        for b in range(len(xs)):
+            max_len = int(math.floor(elens[b] * 1.)) + 1
+            hyp_ref, aws_ref = greedy_ref(dec, eouts[b:b + 1], elens[b], max_len)
+            if exclude_eos and hyp_ref[-1] == dec.eos:
+                assert np.array_equal(best_hyps[b], hyp_ref[:-1])
+            else:
+                assert np.array_equal(best_hyps[b], hyp_ref)
+            assert np.allclose(aws[b][:, :elens[b]], aws_ref, atol=1e-6)
+            assert (aws[b][:, elens[b]:] == 0).all()
@@ -0,0 +1,32 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Test multi-task training with a single encoder pass per mini-batch."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import pytest
+
+from conftest import make_model
+
+
+def test_encode_once(xs):
+    model = make_model(enc_nlayers=3, enc_nlayers_sub1=2, enc_nlayers_sub2=1, subsample='1_1_1',
+                       vocab_sub1=10, vocab_sub2=8, sub1_weight=0.2, sub2_weight=0.2, mtl_per_batch=True)
+    rng = np.random.RandomState(0)
+    batch = {'xs': xs}
+    for key, vocab in zip(['ys', 'ys_sub1', 'ys_sub2'], [12, 10, 8]):
+        batch[key] = [rng.randint(4, vocab, len(x) // 3 + 1).tolist() for x in xs]
+    tasks = ['ys_sub2', 'ys_sub1', 'ys']
+
+    losses, _ = model(batch, task=tasks, is_eval=True)
+    assert len(losses) == len(tasks)
+    for task, loss in zip(tasks, losses):
+        loss_ref, _ = model(batch, task=task, is_eval=True)
+        assert loss.item() == pytest.approx(loss_ref.item(), rel=1e-5)
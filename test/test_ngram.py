@@ -0,0 +1,136 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Test the n-gram LM and its scorer of ASR tokens."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import codecs
+import numpy as np
+import pytest
+import torch
+
+from neural_sp.models.ngram.ngram import NgramLM
+from neural_sp.models.ngram.ngram import NgramScorer
+from neural_sp.models.torch_utils import tensor2np
+
+WORDS = ['a', 'b', 'c']
+
+
+def write_arpa(path, ngrams):
+    """Write an ARPA file.
+
+    Args:
+        path (str): path to the ARPA file
+        ngrams (list): A list of length `[order]`, which contains dicts of `{words: (log10 prob, log10 bow)}`
+
+    """
+    with codecs.open(path, 'w', 'utf-8') as f:
+        f.write('\\data\\\n')
+        for k, ngrams_k in enumerate(ngrams):
+            f.write('ngram %d=%d\n' % (k + 1, len(ngrams_k)))
+        for k, ngrams_k in enumerate(ngrams):
+            f.write('\n\\%d-grams:\n' % (k + 1))
+            for words, (prob, bow) in ngrams_k.items():
+                if k + 1 < len(ngrams):
+                    f.write('%f %s %f\n' % (prob, ' '.join(words), bow))
+                else:
+                    f.write('%f %s\n' % (prob, ' '.join(words)))
+        f.write('\n\\end\\\n')
+
+
+def random_ngrams(words, order, seed, ratio=0.5):
+    """Random n-grams, a part of which are kept at each order."""
+    rng = np.random.RandomState(seed)
+    vocab = ['<s>', '</s>'] + words
+    ngrams = [{(w,): (-rng.rand() - 0.5, -rng.rand()) for w in vocab}]
+    for k in range(2, order + 1):
+        ngrams.append({})
+        for context in ngrams[-2].keys():
+            if context[-1] == '</s>':
+                continue
+            for w in vocab[1:]:
+                if rng.rand() < ratio:
+                    ngrams[-1][context + (w,)] = (-rng.rand() - 0.5, -rng.rand())
+    return ngrams
+
+
+def write_dict(path, tokens):
+    with codecs.open(path, 'w', 'utf-8') as f:
+        for i, token in enumerate(tokens):
+            f.write('%s %d\n' % (token, i + 4))
+
+
+@pytest.fixture
+def lm(tmpdir):
+    path = str(tmpdir.join('lm.arpa'))
+    write_arpa(path, random_ngrams(WORDS, 3, seed=0))
+    return NgramLM.from_arpa(path)
+
+
+def test_log_probs(lm):
+    # Distributions over the vocabulary are consistent with the scores of each word
+    for state in [(), (lm.bos,), (lm.bos, lm.word_id('a')), (lm.word_id('b'), lm.word_id('c'))]:
+        log_probs = lm.log_probs(state)
+        for w in range(len(lm.vocab)):
+            assert log_probs[w] == pytest.approx(lm.score(state, w)[0], abs=1e-5)
+
+
+def test_cache_bytes(tmpdir):
+    path = str(tmpdir.join('lm.arpa'))
+    write_arpa(path, random_ngrams(WORDS, 3, seed=0))
+    lm = NgramLM.from_arpa(path)
+    lm.cache.max_bytes = 3 * len(lm.vocab) * 4
+    states = [(i, j) for i in range(len(lm.vocab)) for j in range(len(lm.vocab))]
+    for state in states:
+        lm.log_probs(state)
+    assert len(lm.cache) == 3
+    assert lm.cache.nbytes <= lm.cache.max_bytes
+    # The most recently used distributions are kept
+    assert lm.cache.get(states[-1]) is not None
+    assert lm.cache.get(states[0]) is None
+
+
+def test_missing_eos(tmpdir):
+    ngrams = random_ngrams(WORDS, 2, seed=0)
+    ngrams = [{words: v for words, v in ngrams_k.items() if '</s>' not in words} for ngrams_k in ngrams]
+    write_arpa(str(tmpdir.join('lm.arpa')), ngrams)
+    write_dict(str(tmpdir.join('dict.txt')), WORDS)
+    lm = NgramLM.from_arpa(str(tmpdir.join('lm.arpa')))
+    with pytest.raises(ValueError):
+        NgramScorer(lm, str(tmpdir.join('dict.txt')), 'word')
+
+
+@pytest.mark.parametrize('unit', ['word', 'char'])
+def test_scorer(lm, tmpdir, unit):
+    dict_path = str(tmpdir.join('dict.txt'))
+    tokens = WORDS + ['<space>'] if unit == 'char' else WORDS
+    write_dict(dict_path, tokens)
+    scorer = NgramScorer(lm, dict_path, unit)
+    ids = [i + 4 for i in range(len(tokens))]
+
+    # All hypotheses up to 3 tokens
+    states = [scorer.initial_state()]
+    for _ in range(3):
+        next_states = scorer.next_states([s for s in states for _ in ids], [y for _ in states for y in ids])
+        assert next_states == [scorer.next_state(s, y) for s in states for y in ids]
+        states = next_states
+
+    scores = scorer.scores(states)
+    assert np.array_equal(tensor2np(scorer.scores_tensor(states, torch.device('cpu'))), scores)
+    for i, (lm_state, word) in enumerate(states):
+        if unit == 'word':
+            for y in ids:
+                assert scores[i, y] == pytest.approx(lm.score(lm_state, lm.word_id(tokens[y - 4]))[0], abs=1e-5)
+            assert scores[i, scorer.eos] == pytest.approx(lm.score(lm_state, lm.eos)[0], abs=1e-5)
+        else:
+            # The incomplete word is scored at <space> and <eos>
+            logp, lm_state = lm.score(lm_state, lm.word_id(word)) if len(word) > 0 else (0., lm_state)
+            assert scores[i, ids[-1]] == pytest.approx(logp, abs=1e-5)
+            assert scores[i, scorer.eos] == pytest.approx(logp + lm.score(lm_state, lm.eos)[0], abs=1e-5)
+            assert (scores[i, ids[:-1]] == 0).all()
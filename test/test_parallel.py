@@ -0,0 +1,103 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Test decoding on CPUs and in forked workers sharing the model."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import pytest
+import torch
+import torch.multiprocessing as mp
+
+from neural_sp.bin.asr.train_utils import load_config
+from neural_sp.models.seq2seq.encoder_cache import EncoderCache
+from neural_sp.models.seq2seq.seq2seq import Seq2seq
+from neural_sp.utils.parallel import make_parallel
+from neural_sp.utils.parallel import share_model
+
+
+def _decode(model, xs, decode_params, utt_ids=None):
+    best_hyps, _, perm_ids = model.decode(xs, decode_params, exclude_eos=True, utt_ids=utt_ids)
+    hyps = [None] * len(xs)
+    for b, i in enumerate(perm_ids):
+        hyps[i] = [int(y) for y in best_hyps[b]]
+    return hyps
+
+
+@pytest.mark.parametrize('params', [
+    {},
+    {'beam_width': 3},
+    {'beam_width': 3, 'recog_ctc_weight': 0.3},
+    {'beam_width': 3, 'length_penalty': 0.1, 'coverage_penalty': 0.1},
+    {'attn_window': 2},
+    {'blank_skip_threshold': 0.5},
+    {'beam_width': 3, 'shortlist_threshold': 0.1},
+])
+def test_decode_on_cpu(model, xs, decode_params, params):
+    assert model.device_id < 0
+    decode_params.update(params)
+    hyps = _decode(model, xs, decode_params)
+    assert len(hyps) == len(xs)
+
+
+def _worker(k, model, xs, decode_params, queue):
+    torch.set_num_threads(1)
+    shared = all([p.is_shared() for p in model.parameters()])
+    queue.put((k, shared, _decode(model, xs, decode_params)))
+
+
+@pytest.mark.parametrize('beam_width', [1, 3])
+def test_prefork(model_dir, xs, decode_params, beam_width):
+    # Load the checkpoint once in the parent
+    model = Seq2seq(argparse.Namespace(**load_config(model_dir + '/config.yml')))
+    model.load_checkpoint(model_dir, epoch=-1)
+    model.eval()
+    assert share_model(model) > 0
+    assert all([p.is_shared() for p in model.parameters()])
+
+    decode_params['beam_width'] = beam_width
+    ref = _decode(model, xs, decode_params)
+
+    ctx = mp.get_context('fork')
+    queue = ctx.Queue()
+    workers = [ctx.Process(target=_worker, args=(k, model, xs, decode_params, queue)) for k in range(3)]
+    for w in workers:
+        w.start()
+    results = [queue.get(timeout=120) for _ in workers]
+    for w in workers:
+        w.join()
+        assert w.exitcode == 0
+
+    for k, shared, hyps in results:
+        assert shared
+        assert hyps == ref
+
+
+# Shared with forked workers of make_parallel()
+_context = {}
+
+
+def _sweep_worker(decode_params):
+    torch.set_num_threads(1)
+    return _decode(_context['model'], _context['xs'], decode_params, _context['utt_ids'])
+
+
+def test_sweep_workers(tmpdir, model, xs, decode_params):
+    # Fill the encoder cache in the parent as eval.py --sweep does
+    model.enc_cache = EncoderCache(str(tmpdir), 'model', 1)
+    utt_ids = ['utt%d' % i for i in range(len(xs))]
+    with torch.no_grad():
+        model.encode_cached(xs, utt_ids, 'ys')
+    share_model(model)
+
+    configs = [dict(decode_params, beam_width=beam_width, recog_ctc_weight=ctc_weight)
+               for beam_width in [1, 3] for ctc_weight in [0., 0.3]]
+    refs = [_decode(model, xs, config, utt_ids) for config in configs]
+    _context.update({'model': model, 'xs': xs, 'utt_ids': utt_ids})
+    assert make_parallel(_sweep_worker, configs, core=2) == refs
@@ -0,0 +1,52 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Test N-best rescoring of the forward decoder with the backward decoder."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import pytest
+import torch
+
+from conftest import make_model
+from conftest import VOCAB
+
+
+@pytest.mark.parametrize('beam_width,max_len_ratio', [(3, 1.), (16, 1.), (16, 0.)])
+def test_rescore(xs, decode_params, beam_width, max_len_ratio):
+    # NOTE: beam_width 16 exceeds the vocabulary, so fewer hypotheses than the beam
+    # are found when decoding stops at the first step
+    assert VOCAB < 16
+    decode_params.update({'beam_width': beam_width, 'max_len_ratio': max_len_ratio,
+                          'rescore_bwd_weight': 0.5})
+    model = make_model(bwd_weight=0.5, param_init=1.)
+    best_hyps = model.decode(xs, decode_params, exclude_eos=True)[0]
+
+    with torch.no_grad():
+        enc_outs, _ = model.encode(xs, 'ys')
+        eouts, elens = enc_outs['ys']['xs'], enc_outs['ys']['xlens']
+        nbest_hyps, _, scores = model.dec_fwd.beam_search(eouts, elens, decode_params, None,
+                                                          nbest=beam_width, exclude_eos=True)
+        for b in range(len(xs)):
+            assert 1 <= len(nbest_hyps[b]) <= beam_width
+            # Score each hypothesis by the backward decoder one by one
+            scores_rescored = [scores[b][n][-1] + 0.5 * model.dec_bwd.score_sequences(
+                eouts[b:b + 1], elens[b:b + 1], [hyp]).item() for n, hyp in enumerate(nbest_hyps[b])]
+            assert np.array_equal(best_hyps[b], nbest_hyps[b][int(np.argmax(scores_rescored))])
+
+
+def test_rescore_keeps_mode(xs, decode_params):
+    # Rescoring does not switch the model to the evaluation mode
+    model = make_model(bwd_weight=0.5)
+    with torch.no_grad():
+        enc_outs, _ = model.encode(xs, 'ys')
+    model.train()
+    decode_params.update({'rescore_bwd_weight': 0.5})
+    model.rescore(enc_outs, [[np.array([4, 5])] for _ in xs], [[0.] for _ in xs], decode_params)
+    assert model.training
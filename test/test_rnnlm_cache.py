@@ -0,0 +1,123 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Test the cache of RNNLM states keyed by token prefixes."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import functools
+import numpy as np
+import torch
+
+from conftest import make_model
+from conftest import VOCAB
+from neural_sp.models.rnnlm.rnnlm_cache import RNNLMCache
+from neural_sp.models.seq2seq.decoders import decoder as decoder_module
+
+
+class CellRNNLM(torch.nn.Module):
+    """A single-layer LSTM LM with the interface of `RNNLM.predict`, built on LSTMCell."""
+
+    def __init__(self, vocab=VOCAB, nunits=8):
+        super(CellRNNLM, self).__init__()
+        torch.manual_seed(2)
+        self.vocab = vocab
+        self.embed_ = torch.nn.Embedding(vocab, nunits)
+        self.rnn = torch.nn.LSTMCell(nunits, nunits)
+        self.output = torch.nn.Linear(nunits, vocab)
+        self.eval()
+
+    def embed(self, ys):
+        return self.embed_(ys)
+
+    def predict(self, y, state):
+        hx_list, cx_list = state
+        if hx_list is None:
+            hx_list = [y.new_zeros(y.size(0), self.rnn.hidden_size)]
+            cx_list = [y.new_zeros(y.size(0), self.rnn.hidden_size)]
+        h, c = self.rnn(y, (hx_list[0], cx_list[0]))
+        return self.output(h).unsqueeze(1), h, ([h], [c])
+
+
+def predict_loop(rnnlm, ys):
+    """Logits of RNNLM after reading each prefix of ys `[L, vocab]`."""
+    state = (None, None)
+    logits = []
+    for y in ys:
+        y_emb = rnnlm.embed(torch.LongTensor([[y]])).squeeze(1)
+        logits_t, _, state = rnnlm.predict(y_emb, state)
+        logits.append(logits_t[0, 0])
+    return torch.stack(logits, dim=0)
+
+
+def predict_cache(cache, hyps):
+    """Logits of RNNLM for hypotheses of the same length through the cache `[B, L, vocab]`."""
+    nodes = [cache.root] * len(hyps)
+    state = (None, None)
+    logits = []
+    for t in range(len(hyps[0])):
+        logits_t, state, nodes = cache.predict(nodes, [hyp[t] for hyp in hyps], state)
+        logits.append(logits_t)
+    return torch.cat(logits, dim=1), nodes
+
+
+def test_predict():
+    rnnlm = CellRNNLM()
+    cache = RNNLMCache(rnnlm)
+    hyps = [[2, 4, 5, 6], [2, 4, 5, 7], [2, 8, 5, 6], [2, 4, 5, 6]]
+    with torch.no_grad():
+        logits, _ = predict_cache(cache, hyps)
+        for i, hyp in enumerate(hyps):
+            assert torch.allclose(logits[i], predict_loop(rnnlm, hyp), atol=1e-6)
+        # Shared prefixes are computed once
+        assert cache.queries == 16
+        assert cache.queries - cache.hits == 8
+
+        # The second pass is served from the cache
+        logits_hit, _ = predict_cache(cache, hyps)
+        assert torch.equal(logits, logits_hit)
+        assert cache.queries - cache.hits == 8
+
+
+def test_cached_values_are_copied():
+    # Rows of mini-batches are copied so that the mini-batches are released
+    cache = RNNLMCache(CellRNNLM())
+    with torch.no_grad():
+        _, nodes = predict_cache(cache, [[2, 4], [2, 5]])
+    for node in nodes:
+        logits, hx_list, cx_list = node.value
+        assert all([x._base is None for x in [logits] + hx_list + cx_list])
+
+
+def test_evict():
+    cache = RNNLMCache(CellRNNLM(), max_size=3)
+    with torch.no_grad():
+        _, nodes = predict_cache(cache, [[2, 4, 5], [2, 6, 7], [2, 8, 9]])
+    assert len(cache.lru) == 3
+    # States of the current hypotheses are kept even if they are the least recently used
+    assert all([node.value is not None for node in nodes])
+
+    # Evicted states are recomputed
+    cache.max_size = 1
+    with torch.no_grad():
+        logits, _ = predict_cache(cache, [[2, 4, 5], [2, 6, 7]])
+        assert torch.allclose(logits[0], predict_loop(cache.rnnlm, [2, 4, 5]), atol=1e-6)
+    assert len(cache.lru) == 2
+
+
+def test_beam_search(xs, decode_params, monkeypatch):
+    # Eviction does not change the results of shallow fusion
+    model = make_model()
+    model.rnnlm_fwd = CellRNNLM()
+    decode_params.update({'beam_width': 3, 'rnnlm_weight': 0.5})
+    results = []
+    for max_size in [10000, 2]:
+        monkeypatch.setattr(decoder_module, 'RNNLMCache', functools.partial(RNNLMCache, max_size=max_size))
+        results.append(model.decode(xs, decode_params, exclude_eos=True)[0])
+    for hyp, hyp_evict in zip(*results):
+        assert np.array_equal(hyp, hyp_evict)
@@ -0,0 +1,185 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Test the HTTP server of the ASR model."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import asyncio
+import importlib
+import io
+import json
+import numpy as np
+import os
+import pytest
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from conftest import INPUT_DIM
+from conftest import make_model
+from neural_sp.datasets.token_converter.word import Id2word
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def model():
+    model = make_model()
+    # NOTE: <blank> is not in the dictionary, and an untrained decoder may emit it
+    model.dec_fwd.output.fc.bias.data[0] = -1e4
+    return model
+
+
+@pytest.fixture
+def serve(monkeypatch):
+    monkeypatch.setattr(sys, 'argv', ['serve.py'])
+    return importlib.import_module('neural_sp.bin.asr.serve')
+
+
+def npy(x):
+    f = io.BytesIO()
+    np.save(f, x)
+    return f.getvalue()
+
+
+def request(path, method, url, body=b'', content_type='application/octet-stream'):
+    """Send a request over the unix socket and return the status code and the JSON body."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(60)
+    sock.connect(path)
+    sock.sendall(('%s %s HTTP/1.1\r\nContent-Type: %s\r\nContent-Length: %d\r\nConnection: close\r\n\r\n' %
+                  (method, url, content_type, len(body))).encode('latin-1') + body)
+    response = b''
+    while True:
+        data = sock.recv(65536)
+        if len(data) == 0:
+            break
+        response += data
+    sock.close()
+    header, body = response.split(b'\r\n\r\n', 1)
+    return int(header.split(b' ')[1]), json.loads(body.decode('utf-8'))
+
+
+def test_recognize(tmpdir, model, model_dir, decode_params):
+    # NOTE: utterances have the same length, so that the maximum length of hypotheses does not
+    # depend on the other utterances in the mini-batch
+    rng = np.random.RandomState(0)
+    xs = [rng.randn(8, INPUT_DIM).astype(np.float32) for _ in range(6)]
+
+    sock_path = str(tmpdir.join('serve.sock'))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT] + sys.path))
+    server = subprocess.Popen([sys.executable, os.path.join(ROOT, 'neural_sp/bin/asr/serve.py'),
+                               '--model', model_dir, '--unix_socket', sock_path,
+                               '--max_batch_size', '4', '--max_latency_ms', '200', '--nworkers', '2'],
+                              env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    try:
+        for _ in range(600):
+            if os.path.exists(sock_path) or server.poll() is not None:
+                break
+            time.sleep(0.1)
+        assert server.poll() is None, server.stdout.read().decode('utf-8')
+
+        assert request(sock_path, 'GET', '/health') == (200, {'status': 'ok'})
+
+        # Concurrent requests are decoded in mini-batches
+        responses = [None] * len(xs)
+
+        def post(i):
+            responses[i] = request(sock_path, 'POST', '/recognize', npy(xs[i]))
+        threads = [threading.Thread(target=post, args=(i,)) for i in range(len(xs))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        id2word = Id2word(os.path.join(model_dir, 'dict.txt'))
+        for x, (status, result) in zip(xs, responses):
+            assert status == 200, result
+            hyp = model.decode([x], decode_params, exclude_eos=True)[0][0]
+            assert result['token_ids'] == [int(y) for y in hyp]
+            assert result['text'] == id2word(hyp)
+        assert max([result['batch_size'] for _, result in responses]) > 1
+
+        # Features of a wrong size
+        status, result = request(sock_path, 'POST', '/recognize', npy(np.zeros((3, INPUT_DIM + 1), dtype=np.float32)))
+        assert status == 400
+
+        status, result = request(sock_path, 'GET', '/metrics')
+        assert status == 200
+        assert result['latency_ms']['count'] == len(xs)
+        assert sum([b['count'] for b in result['batch_size']['buckets']]) == result['batch_size']['count']
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def test_decode_error(tmpdir, serve):
+    def decode_fn(xs):
+        raise RuntimeError('failed to decode')
+
+    sock_path = str(tmpdir.join('serve.sock'))
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    batcher = serve.MicroBatcher(decode_fn, max_batch_size=2, max_latency=0.01, nworkers=1)
+    server = loop.run_until_complete(asyncio.start_unix_server(
+        serve.make_handler(batcher, INPUT_DIM, 16000), path=sock_path))
+    task = loop.create_task(batcher.run())
+    thread = threading.Thread(target=loop.run_forever)
+    thread.start()
+    try:
+        status, result = request(sock_path, 'POST', '/recognize', npy(np.zeros((3, INPUT_DIM), dtype=np.float32)))
+        assert status == 500
+        assert 'failed to decode' in result['error']
+
+        # The server keeps serving
+        assert request(sock_path, 'GET', '/health') == (200, {'status': 'ok'})
+    finally:
+        loop.call_soon_threadsafe(task.cancel)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        server.close()
+        batcher.executor.shutdown()
+
+
+def test_load_feat_off_event_loop(tmpdir, serve, monkeypatch):
+    # Slow feature extraction does not block other connections
+    def wav2feat(data, input_dim, sample_rate, cmvn=None):
+        time.sleep(2)
+        return np.zeros((3, input_dim), dtype=np.float32)
+    monkeypatch.setattr(serve, 'wav2feat', wav2feat)
+
+    sock_path = str(tmpdir.join('serve.sock'))
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    batcher = serve.MicroBatcher(lambda xs: [{'text': ''} for _ in xs], max_batch_size=2, max_latency=0.01,
+                                 nworkers=1)
+    server = loop.run_until_complete(asyncio.start_unix_server(
+        serve.make_handler(batcher, INPUT_DIM, 16000), path=sock_path))
+    task = loop.create_task(batcher.run())
+    thread = threading.Thread(target=loop.run_forever)
+    thread.start()
+    try:
+        responses = []
+        post = threading.Thread(target=lambda: responses.append(
+            request(sock_path, 'POST', '/recognize', b'wav', content_type='audio/wav')))
+        post.start()
+        time.sleep(0.2)
+        start = time.time()
+        assert request(sock_path, 'GET', '/health') == (200, {'status': 'ok'})
+        assert time.time() - start < 1
+        post.join()
+        assert responses[0][0] == 200
+    finally:
+        loop.call_soon_threadsafe(task.cancel)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        server.close()
+        batcher.executor.shutdown()